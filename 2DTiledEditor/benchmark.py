@@ -0,0 +1,276 @@
+"""编辑器性能基准测试
+
+生成 100x100、1000x1000、4000x4000 的多图层合成地图, 测量地图读写、选区填充、滚轮缩放、整图刷新的耗时,
+以及资源列表从扫描目录到可见行图标全部显示的耗时(缩略图缓存为空和已缓存两种情况), 同时记录峰值内存和画布项数量. 结果保存为 JSON, 指定基准结果时逐项比较, 变慢超过阈值以非零状态退出.
+
+在 2DTiledEditor 目录下运行:
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+没有 DISPLAY 时自动启动 Xvfb, 也可以用 xvfb-run python benchmark.py 运行.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import tkinter as tk
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image
+from editor.map_canvas import MapCanvas
+from editor.resource_tree import ResourceTree
+from editor.asset_pipeline import AssetPipeline
+from editor.tile_map import TileMap, TILE_DTYPE
+from utils.thumbnail_cache import ThumbnailCache
+
+DEFAULT_SIZES = (100, 1000, 4000)
+JSON_SIZE_LIMIT = 1000  # 更大的地图 JSON 文件有数百 MB, 只测试二进制格式
+FILL_SIZE = 256
+ZOOM_STEPS = 10
+RESOURCE_COUNT = 200  # 资源列表测试生成的图片数量
+RESOURCE_IMAGE_SIZE = 256
+# 比较时小于这些差值的变化视为噪声
+NOISE = {"median_ms": 1.0, "peak_kb": 256}
+
+
+def start_xvfb():
+    """Linux 下没有 DISPLAY 时启动一个 Xvfb, 返回其进程"""
+    if not sys.platform.startswith("linux") or os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        sys.exit("没有可用的显示, 请安装 Xvfb 或使用 xvfb-run 运行")
+    display = ":%d" % (90 + os.getpid() % 100)
+    process = subprocess.Popen([xvfb, display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = display
+    time.sleep(0.5)
+    return process
+
+
+def list_tiles(resources_dir="Resources"):
+    return sorted(name for name in os.listdir(resources_dir) if name.lower().endswith(".png") and not name.startswith("atlas_"))
+
+
+def make_resources(resources_dir, count=RESOURCE_COUNT, size=RESOURCE_IMAGE_SIZE, seed=0):
+    """生成 count 张随机内容的 PNG 图片, 解码和缩放的开销与真实图片相近"""
+    os.makedirs(resources_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for index in range(count):
+        pixels = rng.integers(0, 256, (size, size, 4), dtype=np.uint8)
+        Image.fromarray(pixels, "RGBA").save(os.path.join(resources_dir, "tile_%04d.png" % index))
+
+
+def make_map(size, tile_names, seed=0):
+    """生成 size x size 的三图层地图: 铺满的地面层、约 25% 的装饰层和约 2% 的物体层"""
+    rng = np.random.default_rng(seed)
+    tile_map = TileMap(size, size, 32, 32)
+    ids = np.array([tile_map.tile_id(name) for name in tile_names], dtype=TILE_DTYPE)
+    ground_ids = ids[:max(len(ids) // 2, 1)]
+    tile_map.add_layer("ground").set_region(0, 0, ground_ids[rng.integers(0, len(ground_ids), (size, size))])
+    for name, density in (("decoration", 0.25), ("objects", 0.02)):
+        data = ids[rng.integers(0, len(ids), (size, size))]
+        data[rng.random((size, size)) >= density] = 0
+        tile_map.add_layer(name).set_region(0, 0, data)
+    return tile_map
+
+
+class BenchmarkRunner:
+    def __init__(self, repeat=3, work_dir=None):
+        self.repeat = repeat
+        self.work_dir = work_dir
+        self.root = tk.Tk()
+        self.root.geometry("1024x768")
+        frame = tk.Frame(self.root)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.asset_pipeline = AssetPipeline(self.root)
+        self.canvas = MapCanvas(frame, asset_pipeline=self.asset_pipeline)
+        self.thumbnail_dir = os.path.join(work_dir, "thumbnails")
+        self.resource_tree = ResourceTree(self.root, asset_pipeline=self.asset_pipeline, thumbnail_cache=ThumbnailCache(self.thumbnail_dir))
+        self.resource_tree.pack(side=tk.RIGHT, fill=tk.Y)
+        self.resource_tree.resources_dir = os.path.join(work_dir, "resources")
+        make_resources(self.resource_tree.resources_dir)
+        self.root.update()
+        self.tile_names = list_tiles()
+        self.fill_count = 0
+        self.results = {}
+
+    def settle(self):
+        """让画布处理完等待中的重绘和布局"""
+        self.canvas.redraw_scheduler.flush()
+        self.root.update_idletasks()
+
+    def measure(self, name, func, setup=None, repeat=None):
+        times = []
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            self.settle()
+            times.append((time.perf_counter() - start) * 1000)
+        # 峰值内存单独再运行一次测量, tracemalloc 会拖慢计时
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            self.settle()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            "min_ms": round(min(times), 3),
+            "median_ms": round(statistics.median(times), 3),
+            "peak_kb": peak // 1024,
+            "items": len(self.canvas.find_all())
+        }
+        self.results[name] = result
+        print("%-28s %10.1f ms %10d KB %8d items" % (name, result["median_ms"], result["peak_kb"], result["items"]))
+        return result
+
+    def install(self, tile_map):
+        canvas = self.canvas
+        canvas.set_tile_map(tile_map)
+        canvas.current_layer = tile_map.layers[0].name
+        canvas.refresh_map()
+        canvas.center_map()
+        self.settle()
+
+    def next_fill(self):
+        """每次填充换一张图片, 保证每次都真正修改格子"""
+        canvas = self.canvas
+        self.fill_count += 1
+        size = min(FILL_SIZE, canvas.rows, canvas.cols)
+        canvas.selected_image = self.tile_names[self.fill_count % len(self.tile_names)]
+        canvas.drag_selection = {"start": (0, 0), "end": (size - 1, size - 1), "active": True}
+
+    def fill(self):
+        self.canvas.apply_selection()
+        self.canvas.drag_selection = {"start": None, "end": None, "active": False}
+
+    def zoom(self):
+        canvas = self.canvas
+        for delta in [120] * ZOOM_STEPS + [-120] * ZOOM_STEPS:
+            canvas.on_mouse_wheel(SimpleNamespace(delta=delta, x=canvas.winfo_width() // 2, y=canvas.winfo_height() // 2))
+            self.settle()
+
+    def reset_resources(self):
+        tree = self.resource_tree
+        tree.delete(*tree.get_children())
+        tree.rows = []
+        tree.row_index = {}
+        tree.icon_cache = {}
+
+    def clear_thumbnails(self):
+        """清空缩略图缓存, 所有图标都要从原图生成"""
+        self.reset_resources()
+        shutil.rmtree(self.thumbnail_dir, ignore_errors=True)
+
+    def populate_resources(self):
+        """与启动时相同: 扫描目录, 加载可见行的图标, 等到线程池生成的图标全部显示, 再选中第一张图片"""
+        tree = self.resource_tree
+        tree.scan_resources()
+        self.root.update_idletasks()
+        tree.load_visible_icons()
+        while tree.pending_icons or self.asset_pipeline.pending:
+            self.root.update()
+        if not tree.icon_cache:
+            raise RuntimeError("资源列表没有加载任何图标")
+        tree.selection_set(tree.rows[0][0])
+        self.root.update()
+
+    def run_size(self, size):
+        canvas = self.canvas
+        self.install(make_map(size, self.tile_names))
+        binary_path = os.path.join(self.work_dir, "bench_%d.tmap" % size)
+        json_path = os.path.join(self.work_dir, "bench_%d.json" % size)
+        self.measure("save_map.tmap@%d" % size, lambda: canvas.save_map(binary_path))
+        if size <= JSON_SIZE_LIMIT:
+            self.measure("save_map.json@%d" % size, lambda: canvas.save_map(json_path))
+            self.measure("load_map.json@%d" % size, lambda: canvas.load_map(json_path))
+        self.measure("load_map.tmap@%d" % size, lambda: canvas.load_map(binary_path))
+        canvas.center_map()
+        self.settle()
+        self.measure("refresh_map@%d" % size, canvas.refresh_map)
+        self.measure("apply_selection@%d" % size, self.fill, setup=self.next_fill)
+        self.measure("zoom@%d" % size, self.zoom)
+
+    def run(self, sizes):
+        # 缩略图缓存未命中: 解码原图、缩放并写入磁盘缓存; 命中: 只读取缓存的小图
+        self.measure("populate_resources.cold", self.populate_resources, setup=self.clear_thumbnails)
+        self.measure("populate_resources.warm", self.populate_resources, setup=self.reset_resources)
+        for size in sizes:
+            self.run_size(size)
+        return {
+            "meta": {
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "tk": self.root.tk.call("info", "patchlevel"),
+                "repeat": self.repeat,
+                "sizes": list(sizes)
+            },
+            "results": self.results
+        }
+
+    def close(self):
+        self.asset_pipeline.shutdown()
+        self.root.destroy()
+
+
+def compare(results, baseline, threshold):
+    """返回变慢或内存增长超过阈值的项目 [(名称, 指标, 基准值, 当前值)]"""
+    regressions = []
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for key, noise in NOISE.items():
+            if result[key] > base[key] * (1 + threshold) and result[key] - base[key] > noise:
+                regressions.append((name, key, base[key], result[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地图编辑器性能基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="地图边长")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="用于比较的基准结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="超过基准的比例视为退化")
+    args = parser.parse_args()
+
+    xvfb = start_xvfb()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            runner = BenchmarkRunner(args.repeat, work_dir)
+            try:
+                results = runner.run(args.sizes)
+            finally:
+                runner.close()
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, key, base, value in regressions:
+            print("退化: %s %s %s -> %s" % (name, key, base, value))
+        if regressions:
+            sys.exit(1)
+        print("没有超过 %d%% 的退化" % (args.threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
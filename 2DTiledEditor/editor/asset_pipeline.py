@@ -0,0 +1,67 @@
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class AssetPipeline:
+    """共享的图片处理线程池
+
+    PIL 解码、缩放时会释放 GIL, 图片解码和缩略图生成放到线程池里可以按核心数并行.
+    PhotoImage 只能在 Tk 主线程创建: submit() 的 callback 由主线程通过 after() 调用,
+    每次调用不超过 frame_budget 秒.
+    """
+
+    def __init__(self, widget, max_workers=None, frame_budget=0.008):
+        self.widget = widget
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 4, thread_name_prefix="asset")
+        self.frame_budget = frame_budget
+        self.results = queue.Queue()
+        self.pending = 0
+        self.after_id = None
+
+    def submit(self, func, *args, callback=None):
+        """在线程池中执行 func(*args); callback(result, error) 在主线程调用. 只能在主线程调用本方法"""
+        future = self.executor.submit(func, *args)
+        if callback is not None:
+            self.pending += 1
+            future.add_done_callback(lambda future: self.results.put((callback, future)))
+            if self.after_id is None:
+                self.after_id = self.widget.after(10, self.pump)
+        return future
+
+    def map(self, func, items, progress=None):
+        """并行执行 func(item) 并按顺序返回结果, 会阻塞调用线程, 适合在后台线程里使用
+
+        progress(done, total) 在调用线程中随完成数量调用, 抛出异常时取消尚未开始的任务.
+        """
+        futures = [self.executor.submit(func, item) for item in items]
+        try:
+            for done, _ in enumerate(as_completed(futures), 1):
+                if progress:
+                    progress(done, len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+    def pump(self):
+        self.after_id = None
+        deadline = time.perf_counter() + self.frame_budget
+        while self.pending and time.perf_counter() < deadline:
+            try:
+                callback, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            error = future.exception()
+            callback(None if error else future.result(), error)
+        if self.pending:
+            self.after_id = self.widget.after(10, self.pump)
+
+    def shutdown(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+import tkinter as tk
+from PIL import Image, ImageTk
+from utils.lru_cache import LRUCache
+from .tile_renderer import LayerRenderer
+
+CHUNK_SIZE = 16
+
+
+class ChunkRenderer(LayerRenderer):
+    """分块合成渲染: 每个图层按 CHUNK_SIZE x CHUNK_SIZE 个格子合成一张位图, 每块只占一个画布项"""
+
+    def __init__(self, canvas, margin=2, chunk_size=CHUNK_SIZE, cache_budget=64 * 1024 * 1024):
+        super().__init__(canvas, margin)
+        self.chunk_size = chunk_size
+        self.cache = LRUCache(cache_budget)  # (图层, cx, cy, 格子宽, 格子高) -> (版本, PhotoImage)
+        self.items = {}  # (图层, cx, cy) -> 画布项
+        self.item_photos = {}  # 正在显示的 PhotoImage, 被缓存淘汰后也不会失效
+        self.versions = {}  # (图层, cx, cy) -> 修改次数
+        self.tile_size = None
+        self.tile_map = None
+
+    def get_chunk_bounds(self):
+        """返回视口覆盖的分块范围 (cx0, cy0, cx1, cy1), 右下边界不包含"""
+        x0, y0, x1, y1 = self.view_bounds
+        size = self.chunk_size
+        return x0 // size, y0 // size, -(-x1 // size), -(-y1 // size)
+
+    def check_map(self):
+        """地图或格子大小变化后丢弃失效的缓存"""
+        canvas = self.canvas
+        if self.tile_map is not canvas.tile_map:
+            self.tile_map = canvas.tile_map
+            self.cache.clear()
+            self.versions = {}
+        self.tile_size = (canvas.grid_width, canvas.grid_height)
+
+    def render(self, force=False):
+        """按当前视口同步分块画布项, 视口没有变化时直接返回"""
+        bounds = self.get_view_bounds()
+        if bounds == self.view_bounds and not force:
+            return
+        self.view_bounds = bounds
+        self.check_map()
+        layers = self.canvas.layers
+        cx0, cy0, cx1, cy1 = self.get_chunk_bounds()
+        for key in [key for key in self.items if key[0] not in layers or not (cx0 <= key[1] < cx1 and cy0 <= key[2] < cy1)]:
+            self.remove_item(key)
+        for layer in [layer for layer in self.layer_tags if layer not in layers]:
+            self.remove_layer_marker(layer)
+        for layer in layers:
+            self.get_layer_tag(layer)
+        for layer in layers:
+            for cy in range(cy0, cy1):
+                for cx in range(cx0, cx1):
+                    if (layer, cx, cy) not in self.items:
+                        self.show_chunk(layer, cx, cy)
+
+    def update_cells(self, layer, x0, y0, x1, y1):
+        """格子数据修改后, 只重新合成 [x0, x1) x [y0, y1) 所在的分块"""
+        self.check_map()
+        size = self.chunk_size
+        visible = self.get_chunk_bounds() if self.view_bounds else (0, 0, 0, 0)
+        for cy in range(y0 // size, -(-y1 // size)):
+            for cx in range(x0 // size, -(-x1 // size)):
+                key = (layer, cx, cy)
+                self.versions[key] = self.versions.get(key, 0) + 1
+                if visible[0] <= cx < visible[2] and visible[1] <= cy < visible[3]:
+                    self.show_chunk(layer, cx, cy)
+
+    def relayout(self):
+        """格子大小改变后(缩放), 所有分块按新大小重新显示"""
+        for key in list(self.items):
+            self.remove_item(key)
+        self.render(force=True)
+
+    def show_chunk(self, layer, cx, cy):
+        key = (layer, cx, cy)
+        photo = self.get_chunk_photo(layer, cx, cy)
+        if photo is None:
+            self.remove_item(key)
+            return
+        canvas = self.canvas
+        image_id = self.items.get(key)
+        if image_id:
+            canvas.itemconfig(image_id, image=photo)
+        else:
+            state = tk.NORMAL if layer.visible else tk.HIDDEN
+            x = cx * self.chunk_size * canvas.grid_width
+            y = cy * self.chunk_size * canvas.grid_height
+            image_id = canvas.create_image(x, y, image=photo, anchor=tk.NW, state=state, tags=(self.get_layer_tag(layer), "chunk"))
+            self.stack_item(layer, image_id)
+            self.items[key] = image_id
+        self.item_photos[key] = photo
+
+    def remove_item(self, key):
+        image_id = self.items.pop(key, None)
+        if image_id:
+            self.canvas.delete(image_id)
+        self.item_photos.pop(key, None)
+
+    def get_chunk_photo(self, layer, cx, cy):
+        """返回分块位图, 缓存中没有或已过期时重新合成; 空分块返回 None"""
+        version = self.versions.get((layer, cx, cy), 0)
+        cache_key = (layer, cx, cy) + self.tile_size
+        entry = self.cache.get(cache_key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        image = self.compose_chunk(layer, cx, cy)
+        if image is None:
+            self.cache.put(cache_key, (version, None), 64)
+            return None
+        photo = ImageTk.PhotoImage(image)
+        self.cache.put(cache_key, (version, photo), image.width * image.height * 4)
+        return photo
+
+    def compose_chunk(self, layer, cx, cy):
+        """用 PIL 把分块内的格子图片合成为一张 RGBA 位图"""
+        size = self.chunk_size
+        grid_width, grid_height = self.tile_size
+        x0, y0 = cx * size, cy * size
+        x1, y1 = min(x0 + size, layer.cols), min(y0 + size, layer.rows)
+        xs, ys, ids = layer.occupied_cells(x0, y0, x1, y1)
+        if len(ids) == 0 or grid_width <= 0 or grid_height <= 0:
+            return None
+        image = Image.new("RGBA", ((x1 - x0) * grid_width, (y1 - y0) * grid_height), (0, 0, 0, 0))
+        for grid_x, grid_y, tile_id in zip(xs.tolist(), ys.tolist(), ids.tolist()):
+            # 同一图层内格子互不重叠, 直接覆盖粘贴即可
+            image.paste(self.canvas.get_tile_image(self.tile_map.tile_name(tile_id)), ((grid_x - x0) * grid_width, (grid_y - y0) * grid_height))
+        return image
+
+    def remove_layer(self, layer):
+        for key in [key for key in self.items if key[0] is layer]:
+            self.remove_item(key)
+        for key in [key for key in self.versions if key[0] is layer]:
+            del self.versions[key]
+        for key in [key for key in self.cache.entries if key[0] is layer]:
+            self.cache.pop(key)
+        self.remove_layer_marker(layer)
+
+    def clear(self):
+        super().clear()
+        self.items = {}
+        self.item_photos = {}
+
+    def item_count(self):
+        return len(self.items)
@@ -0,0 +1,148 @@
+import numpy as np
+from .tile_map import EMPTY_TILE, TILE_DTYPE, intersect_rect
+
+
+class EditEngine:
+    """与界面无关的批量编辑引擎
+
+    所有操作都用 NumPy 对矩形区域整体读写, 耗时只与涉及的格子数成正比.
+    每个操作把修改过的矩形记入脏区域, 由渲染器通过 take_dirty() 取走后局部刷新;
+    同时把修改前的内容通知给监听者(例如撤销历史).
+    """
+
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        self.dirty = {}  # 图层 -> [(x0, y0, x1, y1)]
+        self.listeners = []
+        self.batch_depth = 0
+
+    def add_listener(self, listener):
+        """listener(change) 在每次修改后调用, change 为描述修改内容的字典"""
+        self.listeners.append(listener)
+
+    def get_layer(self, layer):
+        """图层参数既可以是图层对象, 也可以是图层名称"""
+        if isinstance(layer, str):
+            return self.tile_map.get_layer(layer)
+        return layer
+
+    def clip_rect(self, rect):
+        if rect is None:
+            return 0, 0, self.tile_map.cols, self.tile_map.rows
+        return intersect_rect(rect, (0, 0, self.tile_map.cols, self.tile_map.rows))
+
+    def fill_rect(self, layer, rect, name):
+        """用同一张图片填充矩形 (x0, y0, x1, y1), name 为 None 时清空"""
+        layer = self.get_layer(layer)
+        rect = self.clip_rect(rect)
+        if layer is None or rect is None:
+            return None
+        before = layer.get_region(*rect)
+        layer.fill_ids(*rect, self.tile_map.tile_id(name))
+        return self.record_change(layer, rect, before)
+
+    def clear(self, layer, rect=None):
+        """清空矩形内的格子, rect 为 None 时清空整个图层"""
+        layer = self.get_layer(layer)
+        rect = self.clip_rect(rect)
+        if layer is None or rect is None:
+            return None
+        # 稀疏图层只逐个处理画过内容的分块, 清空整个大地图时也不会生成地图大小的数组
+        rects = layer.painted_rects(*rect)
+        if len(rects) == 1:
+            return self.fill_rect(layer, rects[0], None)
+        self.begin_batch()
+        try:
+            for painted in rects:
+                self.fill_rect(layer, painted, None)
+        finally:
+            self.end_batch()
+        return None
+
+    def stamp(self, layer, x, y, pattern, transparent=True):
+        """把图案(图片名称二维列表或编号数组)盖到以 (x, y) 为左上角的位置; transparent 时图案中的空格子保留原内容"""
+        layer = self.get_layer(layer)
+        ids = self.pattern_ids(pattern)
+        rect = self.clip_rect((x, y, x + ids.shape[1], y + ids.shape[0]))
+        if layer is None or rect is None:
+            return None
+        x0, y0, x1, y1 = rect
+        ids = ids[y0 - y:y1 - y, x0 - x:x1 - x]
+        before = layer.get_region(*rect)
+        after = np.where(ids != EMPTY_TILE, ids, before) if transparent else ids
+        layer.set_region(x0, y0, after)
+        return self.record_change(layer, rect, before)
+
+    def replace(self, layer, old_name, new_name, rect=None):
+        """把矩形内(默认整个图层)所有 old_name 替换为 new_name, 脏区域只包含实际改动的格子的外接矩形"""
+        layer = self.get_layer(layer)
+        rect = self.clip_rect(rect)
+        if layer is None or rect is None or old_name not in self.tile_map.palette_ids:
+            return None
+        old_id = self.tile_map.palette_ids[old_name]
+        new_id = self.tile_map.tile_id(new_name)
+        rects = layer.painted_rects(*rect) if old_id != EMPTY_TILE else [rect]
+        if len(rects) == 1:
+            return self.replace_ids(layer, old_id, new_id, rects[0])
+        self.begin_batch()
+        try:
+            for painted in rects:
+                self.replace_ids(layer, old_id, new_id, painted)
+        finally:
+            self.end_batch()
+        return None
+
+    def replace_ids(self, layer, old_id, new_id, rect):
+        x0, y0, x1, y1 = rect
+        region = layer.get_region(*rect)
+        ys, xs = np.nonzero(region == old_id)
+        if len(xs) == 0 or old_id == new_id:
+            return None
+        changed = (x0 + int(xs.min()), y0 + int(ys.min()), x0 + int(xs.max()) + 1, y0 + int(ys.max()) + 1)
+        before = region[changed[1] - y0:changed[3] - y0, changed[0] - x0:changed[2] - x0]
+        layer.set_region(changed[0], changed[1], np.where(before == old_id, new_id, before))
+        return self.record_change(layer, changed, before.copy())
+
+    def pattern_ids(self, pattern):
+        if isinstance(pattern, np.ndarray):
+            return pattern.astype(TILE_DTYPE, copy=False)
+        tile_id = self.tile_map.tile_id
+        return np.array([[tile_id(name) for name in row] for row in pattern], dtype=TILE_DTYPE)
+
+    def record_change(self, layer, rect, before, mark_dirty=True):
+        """登记一次已经写入图层的修改; 界面已经自行绘制过的修改可以传 mark_dirty=False"""
+        if mark_dirty:
+            self.mark_dirty(layer, rect)
+        change = {"type": "cells", "layer": layer, "rect": rect, "before": before}
+        self.notify(change)
+        return change
+
+    def begin_batch(self):
+        """begin_batch()/end_batch() 之间的修改属于同一次操作(例如撤销时一起撤销), 可以嵌套"""
+        self.batch_depth += 1
+        if self.batch_depth == 1:
+            self.notify({"type": "begin_batch"})
+
+    def end_batch(self):
+        self.batch_depth -= 1
+        if self.batch_depth == 0:
+            self.notify({"type": "end_batch"})
+
+    def notify(self, change):
+        for listener in self.listeners:
+            listener(change)
+
+    def mark_dirty(self, layer, rect):
+        """记录脏矩形, 被已有矩形包含的直接忽略, 包含已有矩形的替换掉它们"""
+        rects = self.dirty.setdefault(layer, [])
+        for other in rects:
+            if other[0] <= rect[0] and other[1] <= rect[1] and rect[2] <= other[2] and rect[3] <= other[3]:
+                return
+        rects[:] = [other for other in rects if not (rect[0] <= other[0] and rect[1] <= other[1] and other[2] <= rect[2] and other[3] <= rect[3])]
+        rects.append(rect)
+
+    def take_dirty(self):
+        """取走并清空脏区域, 返回 [(图层, (x0, y0, x1, y1))]"""
+        dirty = [(layer, rect) for layer, rects in self.dirty.items() for rect in rects]
+        self.dirty = {}
+        return dirty
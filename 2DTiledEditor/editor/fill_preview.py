@@ -0,0 +1,57 @@
+from .tile_map import subtract_rect
+
+
+class FillPreview:
+    """矩形填充工具拖动过程中的实时预览
+
+    拖动开始后第一次覆盖到的格子只记录一次原始内容; 每次选区变化只恢复移出选区的格子、填充新进入选区的格子,
+    开销与两次选区的差异成正比, 与拖动时长和选区大小无关.
+    """
+
+    def __init__(self, layer, tile_id):
+        self.layer = layer
+        self.tile_id = tile_id
+        self.rect = None
+        self.box = None
+        self.snapshot = None
+
+    def update(self, rect):
+        """把预览选区改为 rect, 返回内容发生变化的矩形列表"""
+        if rect == self.rect:
+            return []
+        self.extend_snapshot(rect)
+        changed = []
+        for restore in subtract_rect(self.rect, rect):
+            self.layer.set_region(restore[0], restore[1], self.original_region(restore))
+            changed.append(restore)
+        for fill in subtract_rect(rect, self.rect):
+            self.layer.fill_ids(*fill, self.tile_id)
+            changed.append(fill)
+        self.rect = rect
+        return changed
+
+    def cancel(self):
+        """恢复预览覆盖的所有格子, 返回发生变化的矩形列表"""
+        return self.update(None) if self.rect is not None else []
+
+    def extend_snapshot(self, rect):
+        """保证快照覆盖 rect; 原快照范围以外的格子从未被预览修改过, 可以直接从图层读取"""
+        if rect is None:
+            return
+        if self.box is None:
+            self.box = rect
+            self.snapshot = self.layer.get_region(*rect)
+            return
+        box = (min(self.box[0], rect[0]), min(self.box[1], rect[1]), max(self.box[2], rect[2]), max(self.box[3], rect[3]))
+        if box == self.box:
+            return
+        snapshot = self.layer.get_region(*box)
+        x0, y0, x1, y1 = self.box
+        snapshot[y0 - box[1]:y1 - box[1], x0 - box[0]:x1 - box[0]] = self.snapshot
+        self.box = box
+        self.snapshot = snapshot
+
+    def original_region(self, rect):
+        """返回 rect 范围内格子在拖动开始前的编号数组"""
+        x0, y0, x1, y1 = rect
+        return self.snapshot[y0 - self.box[1]:y1 - self.box[1], x0 - self.box[0]:x1 - self.box[0]].copy()
@@ -0,0 +1,294 @@
+import zlib
+from collections import deque
+import numpy as np
+
+# 超过这个字节数的数组用 zlib 压缩保存
+COMPRESS_THRESHOLD = 4096
+
+
+def pack_array(array):
+    """把数组打包为 (是否压缩, 字节串, 类型, 形状)"""
+    data = np.ascontiguousarray(array).tobytes()
+    compressed = len(data) > COMPRESS_THRESHOLD
+    if compressed:
+        data = zlib.compress(data, 1)
+    return compressed, data, array.dtype.str, array.shape
+
+
+def unpack_array(packed):
+    compressed, data, dtype, shape = packed
+    if compressed:
+        data = zlib.decompress(data)
+    return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+
+class CellDelta:
+    """一次格子修改的差异记录
+
+    只保存发生变化的格子: 变化稀疏时保存矩形内的下标和前后编号, 变化密集时保存整个矩形的前后内容,
+    较大的数组再用 zlib 压缩. 撤销一次 10 万格的填充只需解压几百 KB 数据, 不会复制整张地图.
+    """
+
+    def __init__(self, layer, rect, before, after):
+        self.layer = layer
+        self.rect = rect
+        changed = before != after
+        count = int(np.count_nonzero(changed))
+        self.cell_count = count
+        if count * 8 < before.size * 4:
+            self.sparse = True
+            self.indices = pack_array(np.flatnonzero(changed).astype(np.uint32))
+            self.before = pack_array(before[changed])
+            self.after = pack_array(after[changed])
+        else:
+            self.sparse = False
+            self.indices = None
+            self.before = pack_array(before)
+            self.after = pack_array(after)
+
+    @property
+    def nbytes(self):
+        packs = [self.before, self.after] + ([self.indices] if self.indices else [])
+        return sum(len(pack[1]) for pack in packs) + 128
+
+    def apply(self, packed):
+        x0, y0, x1, y1 = self.rect
+        values = unpack_array(packed)
+        if self.sparse:
+            region = self.layer.get_region(x0, y0, x1, y1)
+            region.ravel()[unpack_array(self.indices)] = values
+            values = region
+        self.layer.set_region(x0, y0, values)
+        return {"cells": [(self.layer, self.rect)]}
+
+    def undo(self, tile_map):
+        return self.apply(self.before)
+
+    def redo(self, tile_map):
+        return self.apply(self.after)
+
+    def to_cells(self):
+        """返回 (矩形内平铺下标, 修改前编号, 修改后编号), 用于合并多次修改"""
+        before = unpack_array(self.before)
+        after = unpack_array(self.after)
+        if self.sparse:
+            return unpack_array(self.indices), before, after
+        indices = np.arange(before.size, dtype=np.uint32)
+        return indices, before.ravel(), after.ravel()
+
+
+def rect_area(rect):
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def union_rect(deltas):
+    return (min(delta.rect[0] for delta in deltas), min(delta.rect[1] for delta in deltas),
+            max(delta.rect[2] for delta in deltas), max(delta.rect[3] for delta in deltas))
+
+
+def merge_cell_deltas(deltas):
+    """把同一图层上按时间顺序排列的多条修改合并为一条: 每个格子保留最早的修改前内容和最后的修改后内容"""
+    layer = deltas[0].layer
+    x0, y0, x1, y1 = union_rect(deltas)
+    width = x1 - x0
+    all_indices, all_before, all_after = [], [], []
+    for delta in deltas:
+        indices, before, after = delta.to_cells()
+        dx0, dy0, dx1, _ = delta.rect
+        local_width = dx1 - dx0
+        ys, xs = np.divmod(indices.astype(np.int64), local_width)
+        all_indices.append((ys + dy0 - y0) * width + (xs + dx0 - x0))
+        all_before.append(before)
+        all_after.append(after)
+    indices = np.concatenate(all_indices)
+    before_values = np.concatenate(all_before)
+    after_values = np.concatenate(all_after)
+    unique, first = np.unique(indices, return_index=True)
+    _, last_reversed = np.unique(indices[::-1], return_index=True)
+    last = len(indices) - 1 - last_reversed
+    # 没有被修改过的格子取图层当前内容, 因此要在这些修改全部完成后立即合并
+    after = layer.get_region(x0, y0, x1, y1).ravel()
+    before = after.copy()
+    before[unique] = before_values[first]
+    after[unique] = after_values[last]
+    return CellDelta(layer, (x0, y0, x1, y1), before.reshape(y1 - y0, width), after.reshape(y1 - y0, width))
+
+
+class LayerAction:
+    """图层的添加、删除、移动和显示切换"""
+
+    def __init__(self, kind, layer, index=None, new_index=None, visible=None):
+        self.kind = kind
+        self.layer = layer
+        self.index = index
+        self.new_index = new_index
+        self.visible = visible
+
+    @property
+    def nbytes(self):
+        # 被删除的图层(或被撤销的新增图层)的数据由历史记录持有, 计入内存预算
+        return self.layer.nbytes + 128 if self.kind in ("add", "remove") else 128
+
+    def insert(self, tile_map):
+        tile_map.layers.insert(self.index, self.layer)
+        tile_map.layer_lookup[self.layer.name] = self.layer
+
+    def undo(self, tile_map):
+        if self.kind == "add":
+            tile_map.remove_layer(self.layer.name)
+        elif self.kind == "remove":
+            self.insert(tile_map)
+        elif self.kind == "move":
+            tile_map.move_layer(self.new_index, self.index)
+        elif self.kind == "visible":
+            self.layer.visible = not self.visible
+        return {"layers": True}
+
+    def redo(self, tile_map):
+        if self.kind == "add":
+            self.insert(tile_map)
+        elif self.kind == "remove":
+            tile_map.remove_layer(self.layer.name)
+        elif self.kind == "move":
+            tile_map.move_layer(self.index, self.new_index)
+        elif self.kind == "visible":
+            self.layer.visible = self.visible
+        return {"layers": True}
+
+
+class History:
+    """撤销/重做历史, 撤销栈和重做栈的总内存超过预算时先丢弃最旧的撤销记录, 再丢弃离当前最远的重做记录
+
+    begin_group()/end_group() 之间同一图层的格子修改会合并为一条记录, 一次撤销即可全部恢复.
+    """
+
+    def __init__(self, budget_bytes=32 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.undo_stack = deque()
+        self.redo_stack = deque()  # 末尾是下一条可以重做的记录
+        self.total_bytes = 0
+        self.group = None
+        self.group_depth = 0
+
+    def push(self, entry):
+        if self.group is not None:
+            self.group.append(entry)
+            return
+        for dropped in self.redo_stack:
+            self.total_bytes -= dropped.counted_bytes
+        self.redo_stack = deque()
+        self.undo_stack.append(entry)
+        self.count_bytes(entry)
+        self.trim()
+
+    def count_bytes(self, entry):
+        """记录进入栈时的大小; 图层在此期间可能被编辑, 大小会变, 移出时减去的是当时记录的值"""
+        entry.counted_bytes = entry.nbytes
+        self.total_bytes += entry.counted_bytes
+
+    def trim(self):
+        """超过预算时丢弃记录, 至少保留最近的一条撤销或重做记录"""
+        while self.total_bytes > self.budget_bytes and len(self.undo_stack) + len(self.redo_stack) > 1:
+            if len(self.undo_stack) > 1 or not self.redo_stack:
+                self.total_bytes -= self.undo_stack.popleft().counted_bytes
+            else:
+                self.total_bytes -= self.redo_stack.popleft().counted_bytes
+
+    def record_cells(self, layer, rect, before, after):
+        """记录一次格子修改, 内容没有变化时不产生记录"""
+        if np.array_equal(before, after):
+            return
+        self.push(CellDelta(layer, rect, before, after))
+
+    def begin_group(self):
+        """可以嵌套, 最外层的 end_group() 才生成记录"""
+        self.group_depth += 1
+        if self.group is None:
+            self.group = []
+
+    def end_group(self):
+        self.group_depth = max(self.group_depth - 1, 0)
+        if self.group_depth > 0:
+            return
+        group, self.group = self.group, None
+        if not group:
+            return
+        # 相邻且属于同一图层的格子修改合并; 分散在大范围里的修改(例如稀疏图层的各个分块)合并后外接矩形太大, 保持分开
+        merged = []
+        for entry in group:
+            if isinstance(entry, CellDelta) and merged and isinstance(merged[-1], list) and merged[-1][0].layer is entry.layer:
+                merged[-1].append(entry)
+            elif isinstance(entry, CellDelta):
+                merged.append([entry])
+            else:
+                merged.append(entry)
+        entries = []
+        for item in merged:
+            if not isinstance(item, list):
+                entries.append(item)
+            elif len(item) > 1 and rect_area(union_rect(item)) <= 4 * sum(rect_area(delta.rect) for delta in item):
+                entries.append(merge_cell_deltas(item))
+            else:
+                entries.extend(item)
+        self.push(entries[0] if len(entries) == 1 else GroupEntry(entries))
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, tile_map):
+        """撤销最近一条记录, 返回需要刷新的内容, 没有可撤销的记录时返回 None"""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.total_bytes -= entry.counted_bytes
+        result = entry.undo(tile_map)
+        self.redo_stack.append(entry)
+        self.count_bytes(entry)
+        self.trim()
+        return result
+
+    def redo(self, tile_map):
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.total_bytes -= entry.counted_bytes
+        result = entry.redo(tile_map)
+        self.undo_stack.append(entry)
+        self.count_bytes(entry)
+        self.trim()
+        return result
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.total_bytes = 0
+        self.group = None
+        self.group_depth = 0
+
+
+class GroupEntry:
+    """多条记录组成的一次操作"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.entries)
+
+    def undo(self, tile_map):
+        return merge_results(entry.undo(tile_map) for entry in reversed(self.entries))
+
+    def redo(self, tile_map):
+        return merge_results(entry.redo(tile_map) for entry in self.entries)
+
+
+def merge_results(results):
+    merged = {"cells": [], "layers": False}
+    for result in results:
+        merged["cells"].extend(result.get("cells", []))
+        merged["layers"] = merged["layers"] or result.get("layers", False)
+    return merged
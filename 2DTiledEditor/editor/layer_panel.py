@@ -1,6 +1,7 @@
 
 import tkinter as tk
 from tkinter import ttk
+from utils.profiler import profiler
 
 class LayerPanel(tk.Frame):
     def __init__(self, parent, map_canvas=None, *args, **kwargs):
@@ -66,10 +67,7 @@ class LayerPanel(tk.Frame):
                 layer_name = self.layer_list.item(item, "values")[1]
                 self.layers = [layer if layer["name"] != layer_name else {"name": layer_name, "visible": new_value == "✓"} for layer in self.layers]
                 if self.map_canvas:
-                    for layer in self.map_canvas.layers:
-                        if layer["name"] == layer_name:
-                            layer["visible"] = True if new_value == "✓" else False
-                    self.map_canvas.refresh_map()
+                    self.map_canvas.set_layer_visible(layer_name, new_value == "✓")
 
     def move_layer_up(self):
         selected_item = self.layer_list.selection()
@@ -79,8 +77,7 @@ class LayerPanel(tk.Frame):
                 self.layer_list.move(selected_item, "", index - 1)
                 self.layers[index], self.layers[index - 1] = self.layers[index - 1], self.layers[index]
                 if self.map_canvas:
-                    self.map_canvas.layers[index], self.map_canvas.layers[index - 1] = self.map_canvas.layers[index - 1], self.map_canvas.layers[index]
-                    self.map_canvas.refresh_map()
+                    self.map_canvas.move_layer(index, index - 1)
 
     def move_layer_down(self):
         selected_item = self.layer_list.selection()
@@ -90,8 +87,7 @@ class LayerPanel(tk.Frame):
                 self.layer_list.move(selected_item, "", index + 1)
                 self.layers[index], self.layers[index + 1] = self.layers[index + 1], self.layers[index]
                 if self.map_canvas:
-                    self.map_canvas.layers[index], self.map_canvas.layers[index + 1] = self.map_canvas.layers[index + 1], self.map_canvas.layers[index]
-                    self.map_canvas.refresh_map()
+                    self.map_canvas.move_layer(index, index + 1)
 
     def set_current_layer(self, event):
         selected_item = self.layer_list.selection()
@@ -108,3 +104,9 @@ class LayerPanel(tk.Frame):
         self.layer_list.delete(*self.layer_list.get_children())
         for layer in self.layers:
             self.layer_list.insert("", "end", values=("✓" if layer["visible"] else " ", layer["name"]))
+
+    @profiler.timed("sync_layer_list", "ui")
+    def sync_from_canvas(self):
+        """按地图中的图层重建列表, 用于撤销/重做图层操作之后"""
+        if self.map_canvas:
+            self.deserialize([{"name": layer.name, "visible": layer.visible} for layer in self.map_canvas.layers])
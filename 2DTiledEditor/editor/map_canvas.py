@@ -1,41 +1,97 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog
-from PIL import Image, ImageTk
-import json
 import os
+from .tile_map import TileMap
+from .tile_renderer import TileRenderer
+from .chunk_renderer import ChunkRenderer
+from .tile_image_cache import TileImageCache, quantize_zoom, ZOOM_STEP
+from .redraw_scheduler import RedrawScheduler
+from .pointer_tracker import PointerTracker
+from .fill_preview import FillPreview
+from .edit_engine import EditEngine
+from .map_file import load_map_file, save_map_file
+from .map_loader import MapLoader
+from .asset_pipeline import AssetPipeline
+from utils.texture_atlas import load_atlas
+from utils.profiler import profiler
+from .history import History, LayerAction
 
 class MapCanvas(tk.Canvas):
-    def __init__(self, parent, rows=10, cols=10, *args, **kwargs):
+    def __init__(self, parent, rows=10, cols=10, render_mode="chunks", tile_cache_budget=64 * 1024 * 1024, history_budget=32 * 1024 * 1024, asset_pipeline=None, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
         self.parent = parent
-        self.original_grid_width = 32
-        self.original_grid_height = 32
+        self.tile_map = TileMap(rows, cols, 32, 32)
+        self.edit_engine = EditEngine(self.tile_map)
+        self.history = History(history_budget)
+        self.edit_engine.add_listener(self.record_history)
         self.grid_width = self.original_grid_width
         self.grid_height = self.original_grid_height
         self.zoom_level = 1.0
         self.show_grid = True
-        self.layers = []
         self.current_layer = None
         self.selected_image = None
-        self.image_cache = {}
+        self.tile_images = TileImageCache("Resources", tile_cache_budget, load_atlas("Resources"))
+        self.asset_pipeline = asset_pipeline or AssetPipeline(self)
+        self.render_mode = render_mode
+        self.renderer = self.create_renderer(render_mode)
+        self.rendered_grid_size = (self.grid_width, self.grid_height)
+        self.redraw_scheduler = RedrawScheduler(self, self.redraw)
+        self.pointer_tracker = PointerTracker(self, self.on_pointer_frame)
+        self.pointer_key = None
+        self.pointer_listeners = []
+        self.grid_lines = []
         self.drag_data = {"x": 0, "y": 0, "item": None}
-        self.rows = rows
-        self.cols = cols
         self.background_music = None
         self.init_ui()
         self.bind_events()
         self.drag_selection = {"start": None, "end": None, "active": False}
-        self.previous_selection_data = []
+        self.fill_preview = None
         self.drag_offset = {"x": 0, "y": 0}
         self.drag_begin_x = 0
         self.drag_beign_y = 0
         self.highlighted_grid = None
+        self.map_loader = None
+        self.previous_state = None
+        self.view_listeners = []
+
+    def add_view_listener(self, listener):
+        """listener(kind, rect) 在画面变化后调用: "cells" 为格子数据修改, rect 为 (x0, y0, x1, y1);
+        "map" 为整张地图或图层结构变化; "view" 为平移、缩放等视口变化"""
+        self.view_listeners.append(listener)
+
+    def add_pointer_listener(self, listener):
+        """listener(grid_x, grid_y) 在指针所在格子、缩放或偏移变化后调用, 每帧最多一次"""
+        self.pointer_listeners.append(listener)
+
+    def notify_view(self, kind, rect=None):
+        for listener in self.view_listeners:
+            listener(kind, rect)
+
+    @property
+    def layers(self):
+        return self.tile_map.layers
+
+    @property
+    def rows(self):
+        return self.tile_map.rows
+
+    @property
+    def cols(self):
+        return self.tile_map.cols
+
+    @property
+    def original_grid_width(self):
+        return self.tile_map.grid_width
+
+    @property
+    def original_grid_height(self):
+        return self.tile_map.grid_height
 
     def init_ui(self):
         self.configure(bg="#2F4F4F")  # 设置背景颜色为深灰蓝色
-        self.scroll_x = ttk.Scrollbar(self.parent, orient=tk.HORIZONTAL, command=self.xview)
-        self.scroll_y = ttk.Scrollbar(self.parent, orient=tk.VERTICAL, command=self.yview)
+        self.scroll_x = ttk.Scrollbar(self.parent, orient=tk.HORIZONTAL, command=self.on_scroll_x)
+        self.scroll_y = ttk.Scrollbar(self.parent, orient=tk.VERTICAL, command=self.on_scroll_y)
         self.configure(xscrollcommand=self.scroll_x.set, yscrollcommand=self.scroll_y.set)
         self.scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
         self.scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
@@ -54,6 +110,59 @@ class MapCanvas(tk.Canvas):
         self.xview_moveto(0)
         self.yview_moveto(0)
         self.scan_dragto(x_offset, y_offset, gain=1)
+        self.render_view()
+        self.draw_grid()
+        self.notify_view("view")
+
+    def on_scroll_x(self, *args):
+        self.xview(*args)
+        self.request_redraw("pan")
+
+    def on_scroll_y(self, *args):
+        self.yview(*args)
+        self.request_redraw("pan")
+
+    def create_renderer(self, render_mode):
+        """chunks: 按分块合成位图渲染; tiles: 每个可见格子一个画布图片"""
+        if render_mode == "tiles":
+            return TileRenderer(self)
+        return ChunkRenderer(self)
+
+    def set_render_mode(self, render_mode):
+        self.render_mode = render_mode
+        self.renderer = self.create_renderer(render_mode)
+        self.refresh_map()
+
+    @profiler.timed("render_view", "render")
+    def render_view(self, force=False):
+        """只为视口内的格子创建或回收画布图片, 开销与窗口大小相关而与地图大小无关"""
+        self.renderer.render(force)
+
+    def request_redraw(self, reason):
+        """登记重绘请求, 同一帧内的缩放、平移和窗口大小变化合并为一次重绘"""
+        self.redraw_scheduler.request(reason)
+
+    @profiler.timed("redraw", "render")
+    def redraw(self, reasons):
+        """由重绘调度器每帧最多调用一次"""
+        if "resize" in reasons:
+            self.center_map()
+        if (self.grid_width, self.grid_height) != self.rendered_grid_size:
+            # 同一帧内的多次缩放只按最终的格子大小重排一次
+            self.rendered_grid_size = (self.grid_width, self.grid_height)
+            self.renderer.relayout()
+        else:
+            self.render_view()
+        self.draw_grid()
+        self.notify_view("view")
+
+    def get_frame_stats(self):
+        """返回重绘帧数、合并的请求数和每帧耗时(毫秒)"""
+        return self.redraw_scheduler.get_stats()
+
+    def get_pointer_stats(self):
+        """返回指针事件数、处理帧数、跳过的帧数和输入延迟(毫秒)"""
+        return self.pointer_tracker.get_stats()
 
     def bind_events(self):
         self.bind("<Button-1>", self.on_left_click)
@@ -64,17 +173,39 @@ class MapCanvas(tk.Canvas):
         self.bind("<ButtonPress-2>", self.on_middle_press)
         self.bind("<ButtonRelease-2>", self.on_middle_release)
         self.bind("<B2-Motion>", self.on_middle_drag)
+        self.bind("<Motion>", self.on_mouse_move)
 
     def on_mouse_move(self, event):
+        profiler.count("input_events")
+        self.pointer_tracker.on_event(event)
+
+    def on_pointer_frame(self, event):
+        """由指针事件合并器每帧最多调用一次; 指针仍在同一格子且视图没变时直接返回"""
         x, y = self.canvasx(event.x), self.canvasy(event.y)
         grid_x, grid_y = self.get_grid_position(x, y)
-        if self.is_within_map(grid_x, grid_y):
+        key = (grid_x, grid_y, self.grid_width, self.grid_height, self.drag_offset["x"], self.drag_offset["y"])
+        if key == self.pointer_key:
+            return False
+        self.pointer_key = key
+        self.update_highlight(grid_x, grid_y)
+        for listener in self.pointer_listeners:
+            listener(grid_x, grid_y)
+        return True
+
+    def update_highlight(self, grid_x, grid_y):
+        """移动唯一的高亮框, 指针不在地图内时隐藏"""
+        if not self.is_within_map(grid_x, grid_y):
             if self.highlighted_grid:
-                self.delete(self.highlighted_grid)
-            x1 = grid_x * self.grid_width
-            y1 = grid_y * self.grid_height
-            x2 = x1 + self.grid_width
-            y2 = y1 + self.grid_height
+                self.itemconfigure(self.highlighted_grid, state=tk.HIDDEN)
+            return
+        x1 = grid_x * self.grid_width
+        y1 = grid_y * self.grid_height
+        x2 = x1 + self.grid_width
+        y2 = y1 + self.grid_height
+        if self.highlighted_grid:
+            self.coords(self.highlighted_grid, x1, y1, x2, y2)
+            self.itemconfigure(self.highlighted_grid, state=tk.NORMAL)
+        else:
             self.highlighted_grid = self.create_rectangle(x1, y1, x2, y2, outline="yellow", width=2, tags="highlight")
 
     def on_middle_press(self, event):
@@ -84,6 +215,7 @@ class MapCanvas(tk.Canvas):
 
     def on_middle_release(self, event):
         self.scan_dragto(event.x, event.y, gain=1)
+        self.request_redraw("pan")
 
     def on_middle_drag(self, event):
         self.scan_dragto(event.x, event.y, gain=1)
@@ -91,55 +223,133 @@ class MapCanvas(tk.Canvas):
         self.drag_offset["y"] += event.y - self.drag_beign_y
         self.drag_begin_x = event.x
         self.drag_beign_y = event.y
+        self.request_redraw("pan")
+        self.on_mouse_move(event)
+
+    def scroll_to(self, x, y):
+        """平移视图, 使画布坐标 (x, y) 位于窗口中央"""
+        dx = int(self.canvasx(self.winfo_width() / 2) - x)
+        dy = int(self.canvasy(self.winfo_height() / 2) - y)
+        self.scan_mark(0, 0)
+        self.scan_dragto(dx, dy, gain=1)
+        self.drag_offset["x"] += dx
+        self.drag_offset["y"] += dy
+        self.request_redraw("pan")
 
     def get_drag_offset(self):
         """返回鼠标拖动地图的偏移位置"""
         return self.drag_offset["x"], self.drag_offset["y"]
 
     def draw_grid(self):
-        self.delete("grid")
+        """只绘制穿过当前视口的网格线, 线条画布项随视口移动重复使用"""
         self.delete("gray_area")
-        if self.show_grid:
+        lines = []
+        if self.show_grid and self.grid_width > 0 and self.grid_height > 0:
             width = self.cols * self.grid_width
             height = self.rows * self.grid_height
-            if self.grid_width > 0 and self.grid_height > 0:
-                for x in range(0, width, self.grid_width):
-                    self.create_line(x, 0, x, height, tags="grid", fill="gray")
-                self.create_line(width, 0, width, height, tags="grid", fill="gray")
-                for y in range(0, height, self.grid_height):
-                    self.create_line(0, y, width, y, tags="grid", fill="gray")
-                self.create_line(0, height, width, height, tags="grid", fill="gray")
+            left = max(self.canvasx(0), 0)
+            top = max(self.canvasy(0), 0)
+            right = min(self.canvasx(self.winfo_width()), width)
+            bottom = min(self.canvasy(self.winfo_height()), height)
+            if left <= right and top <= bottom:
+                for x in range(int(left // self.grid_width) * self.grid_width, int(right) + 1, self.grid_width):
+                    lines.append((x, top, x, bottom))
+                for y in range(int(top // self.grid_height) * self.grid_height, int(bottom) + 1, self.grid_height):
+                    lines.append((left, y, right, y))
+        for index, line in enumerate(lines):
+            if index < len(self.grid_lines):
+                self.coords(self.grid_lines[index], *line)
+            else:
+                self.grid_lines.append(self.create_line(*line, tags="grid", fill="gray"))
+        for line_id in self.grid_lines[len(lines):]:
+            self.delete(line_id)
+        del self.grid_lines[len(lines):]
 
     def on_resize(self, event):
-        self.draw_grid()
-        self.center_map()
+        self.request_redraw("resize")
 
     def toggle_grid(self):
         self.show_grid = not self.show_grid
         self.draw_grid()
 
     def add_layer(self, layer_name):
-        grid_data = [[None for _ in range(self.cols)] for _ in range(self.rows)]
-        self.layers.append({"name": layer_name, "elements": [], "visible": True, "grid_data": grid_data, "image_ids": {}})
+        layer = self.tile_map.add_layer(layer_name)
+        self.history.push(LayerAction("add", layer, len(self.layers) - 1))
         if not self.current_layer:
             self.current_layer = layer_name
 
     def delete_layer(self, layer_name):
+        layer = self.get_layer(layer_name)
+        if layer is not None:
+            index = self.layers.index(layer)
+            self.tile_map.remove_layer(layer_name)
+            self.history.push(LayerAction("remove", layer, index))
+            self.renderer.remove_layer(layer)
+            self.check_current_layer()
+            self.notify_view("map")
+
+    def move_layer(self, index, new_index):
+        """调整图层的上下顺序"""
+        layer = self.layers[index]
+        self.tile_map.move_layer(index, new_index)
+        self.history.push(LayerAction("move", layer, index, new_index))
+        self.renderer.move_layer(layer)
+        self.notify_view("map")
+
+    def set_layer_visible(self, layer_name, visible):
+        layer = self.get_layer(layer_name)
+        if layer is not None and layer.visible != visible:
+            layer.visible = visible
+            self.history.push(LayerAction("visible", layer, visible=visible))
+            self.renderer.set_layer_visible(layer)
+            self.notify_view("map")
+
+    def sync_layers(self):
+        """图层增删、顺序或可见性改变后(例如撤销), 按标签调整已有画布项, 不重建整个画布"""
+        self.render_view(force=True)
+        self.renderer.restack_layers()
         for layer in self.layers:
-            if layer["name"] == layer_name:
-                for grid_y in range(self.rows):
-                    for grid_x in range(self.cols):
-                        if layer["grid_data"][grid_y][grid_x] is not None:
-                            image_id = layer["image_ids"].get((grid_x, grid_y))
-                            if image_id:
-                                self.delete(image_id)
-                                layer["elements"].remove(image_id)
-                                layer["grid_data"][grid_y][grid_x] = None
-                                del layer["image_ids"][(grid_x, grid_y)]
-                self.layers.remove(layer)
-                if self.current_layer == layer_name:
-                    self.current_layer = self.layers[0]["name"] if self.layers else None
-                break
+            self.renderer.set_layer_visible(layer)
+        self.notify_view("map")
+
+    def check_current_layer(self):
+        """当前图层被删除(或被撤销)后改为第一个图层"""
+        if self.get_layer(self.current_layer) is None:
+            self.current_layer = self.layers[0].name if self.layers else None
+
+    def record_history(self, change):
+        """编辑引擎的监听者: 把每次格子修改记入撤销历史, 同一批修改合并为一条记录"""
+        if change["type"] == "begin_batch":
+            self.history.begin_group()
+            return
+        if change["type"] == "end_batch":
+            self.history.end_group()
+            return
+        layer = change["layer"]
+        rect = change["rect"]
+        self.history.record_cells(layer, rect, change["before"], layer.get_region(*rect))
+
+    def undo(self):
+        """撤销上一步操作, 返回是否有操作被撤销"""
+        return self.apply_history(self.history.undo(self.tile_map))
+
+    def redo(self):
+        return self.apply_history(self.history.redo(self.tile_map))
+
+    def apply_history(self, result):
+        if result is None:
+            return False
+        if result.get("layers"):
+            self.check_current_layer()
+            self.sync_layers()
+        # 组合记录可能同时包含图层操作和格子修改, 图层同步后格子修改仍要重绘; 已被删除的图层不再绘制
+        for layer, rect in result.get("cells", []):
+            if any(layer is current for current in self.layers):
+                self.update_tiles(layer, *rect)
+        return True
+
+    def get_layer(self, layer_name):
+        return self.tile_map.get_layer(layer_name)
 
     def set_current_layer(self, layer_name):
         self.current_layer = layer_name
@@ -147,6 +357,32 @@ class MapCanvas(tk.Canvas):
     def is_within_map(self, grid_x, grid_y):
         return 0 <= grid_x < self.cols and 0 <= grid_y < self.rows
 
+    def get_tile_photo(self, image_name):
+        """返回图片在当前格子大小下的 PhotoImage"""
+        return self.tile_images.get_photo(image_name, self.grid_width, self.grid_height)
+
+    def get_tile_image(self, image_name):
+        """返回图片在当前格子大小下的 PIL 图像"""
+        return self.tile_images.get_image(image_name, self.grid_width, self.grid_height)
+
+    def set_tile_map(self, tile_map):
+        self.tile_map = tile_map
+        self.edit_engine.tile_map = tile_map
+        self.edit_engine.take_dirty()
+        self.history.clear()
+
+    @profiler.timed("flush_edits", "edit")
+    def flush_edits(self):
+        """把编辑引擎记录的脏矩形交给渲染器局部刷新"""
+        for layer, rect in self.edit_engine.take_dirty():
+            self.update_tiles(layer, *rect)
+
+    @profiler.timed("update_tiles", "render")
+    def update_tiles(self, layer, x0, y0, x1, y1):
+        """图层 [x0, x1) x [y0, y1) 区域的数据修改后刷新画布"""
+        self.renderer.update_cells(layer, x0, y0, x1, y1)
+        self.notify_view("cells", (x0, y0, x1, y1))
+
     def on_left_click(self, event):
         if self.selected_image:
             x, y = self.canvasx(event.x), self.canvasy(event.y)
@@ -155,9 +391,10 @@ class MapCanvas(tk.Canvas):
             if self.is_within_map(grid_x, grid_y) and self.current_layer:
                 self.drag_selection["start"] = (grid_x, grid_y)
                 self.drag_selection["active"] = True
-                self.previous_selection_data = []
+                self.fill_preview = None
 
     def on_left_drag(self, event):
+        profiler.count("input_events")
         if self.drag_selection["active"]:
             x, y = self.canvasx(event.x), self.canvasy(event.y)
             grid_x = int(x // self.grid_width)
@@ -174,12 +411,12 @@ class MapCanvas(tk.Canvas):
             grid_y = int(y // self.grid_height)
             if self.is_within_map(grid_x, grid_y):
                 self.drag_selection["end"] = (grid_x, grid_y)
-                self.reset_previous_selection()
-                self.apply_selection()
-                self.drag_selection["start"] = None
-                self.drag_selection["end"] = None
-                self.drag_selection["active"] = False
-                self.delete("selection_rect")
+            # 在地图外松开时按最后一次有效的选区提交
+            self.apply_selection()
+            self.drag_selection["start"] = None
+            self.drag_selection["end"] = None
+            self.drag_selection["active"] = False
+            self.delete("selection_rect")
 
     def draw_selection_rect(self):
         self.delete("selection_rect")
@@ -192,236 +429,184 @@ class MapCanvas(tk.Canvas):
             y2 = (max(start_y, end_y) + 1) * self.grid_height
             self.create_rectangle(x1, y1, x2, y2, outline="red", tags="selection_rect")
 
-    def temporarily_apply_selection(self):
+    def get_selection_bounds(self):
+        """返回拖动选区在地图内的格子范围 (x0, y0, x1, y1), 右下边界不包含"""
         if self.drag_selection["start"] and self.drag_selection["end"]:
             start_x, start_y = self.drag_selection["start"]
             end_x, end_y = self.drag_selection["end"]
-            min_x = min(start_x, end_x)
-            max_x = max(start_x, end_x)
-            min_y = min(start_y, end_y)
-            max_y = max(start_y, end_y)
-            for grid_x in range(min_x, max_x + 1):
-                for grid_y in range(min_y, max_y + 1):
-                    if self.is_within_map(grid_x, grid_y) and self.current_layer:
-                        for layer in self.layers:
-                            if layer["name"] == self.current_layer:
-                                if layer["grid_data"][grid_y][grid_x] is not None:
-                                    image_id = layer["image_ids"].get((grid_x, grid_y))
-                                    if image_id:
-                                        self.previous_selection_data.append((grid_x, grid_y, layer["grid_data"][grid_y][grid_x], image_id))
-                                        self.delete(image_id)
-                                        layer["elements"].remove(image_id)
-                                        layer["grid_data"][grid_y][grid_x] = None
-                                        del layer["image_ids"][(grid_x, grid_y)]
-                                if self.selected_image not in self.image_cache:
-                                    image = Image.open(f"Resources/{self.selected_image}")
-                                    image = image.resize((self.grid_width, self.grid_height))
-                                    photo = ImageTk.PhotoImage(image)
-                                    self.image_cache[self.selected_image] = [image, photo]
-                                else:
-                                    photo = self.image_cache[self.selected_image][1]
-                                image_id = self.create_image(grid_x * self.grid_width, grid_y * self.grid_height, image=photo, anchor=tk.NW, tags=(str("%s(%d,%d)" % (self.current_layer, grid_x, grid_y))))
-                                layer["elements"].append(image_id)
-                                layer["grid_data"][grid_y][grid_x] = self.selected_image
-                                layer["image_ids"][(grid_x, grid_y)] = image_id
+            x0 = max(min(start_x, end_x), 0)
+            y0 = max(min(start_y, end_y), 0)
+            x1 = min(max(start_x, end_x) + 1, self.cols)
+            y1 = min(max(start_y, end_y) + 1, self.rows)
+            if x0 < x1 and y0 < y1:
+                return x0, y0, x1, y1
+        return None
+
+    def temporarily_apply_selection(self):
+        """拖动过程中的填充预览, 只更新与上一次选区不同的格子"""
+        bounds = self.get_selection_bounds()
+        layer = self.get_layer(self.current_layer)
+        if bounds and layer and self.selected_image:
+            if self.fill_preview is None or self.fill_preview.layer is not layer:
+                self.tile_images.load_source(self.selected_image)
+                self.fill_preview = FillPreview(layer, self.tile_map.tile_id(self.selected_image))
+            for rect in self.fill_preview.update(bounds):
+                self.update_tiles(layer, *rect)
 
     def reset_previous_selection(self):
-        for data in self.previous_selection_data:
-            grid_x, grid_y, image_name, image_id = data
-            for layer in self.layers:
-                if layer["name"] == self.current_layer:
-                    if layer["grid_data"][grid_y][grid_x] is not None:
-                        self.delete(layer["image_ids"].get((grid_x, grid_y)))
-                        layer["elements"].remove(layer["image_ids"].get((grid_x, grid_y)))
-                        layer["grid_data"][grid_y][grid_x] = None
-                        del layer["image_ids"][(grid_x, grid_y)]
-                    if image_name:
-                        if image_name not in self.image_cache:
-                            image = Image.open(f"Resources/{image_name}")
-                            image = image.resize((self.grid_width, self.grid_height))
-                            photo = ImageTk.PhotoImage(image)
-                            self.image_cache[image_name] = [image, photo]
-                        else:
-                            photo = self.image_cache[image_name][1]
-                        new_image_id = self.create_image(grid_x * self.grid_width, grid_y * self.grid_height, image=photo, anchor=tk.NW, tags=(str("%s(%d,%d)" % (self.current_layer, grid_x, grid_y))))
-                        layer["elements"].append(new_image_id)
-                        layer["grid_data"][grid_y][grid_x] = image_name
-                        layer["image_ids"][(grid_x, grid_y)] = new_image_id
+        """取消拖动预览, 恢复预览覆盖格子的原始内容"""
+        if self.fill_preview:
+            for rect in self.fill_preview.cancel():
+                self.update_tiles(self.fill_preview.layer, *rect)
+        self.fill_preview = None
 
+    @profiler.timed("apply_selection", "edit")
     def apply_selection(self):
-        if self.drag_selection["start"] and self.drag_selection["end"]:
-            start_x, start_y = self.drag_selection["start"]
-            end_x, end_y = self.drag_selection["end"]
-            min_x = min(start_x, end_x)
-            max_x = max(start_x, end_x)
-            min_y = min(start_y, end_y)
-            max_y = max(start_y, end_y)
-            for grid_x in range(min_x, max_x + 1):
-                for grid_y in range(min_y, max_y + 1):
-                    if self.is_within_map(grid_x, grid_y) and self.current_layer:
-                        for layer in self.layers:
-                            if layer["name"] == self.current_layer:
-                                if layer["grid_data"][grid_y][grid_x] is not None:
-                                    image_id = layer["image_ids"].get((grid_x, grid_y))
-                                    if image_id:
-                                        self.delete(image_id)
-                                        layer["elements"].remove(image_id)
-                                        layer["grid_data"][grid_y][grid_x] = None
-                                        del layer["image_ids"][(grid_x, grid_y)]
-                                if self.selected_image not in self.image_cache:
-                                    image = Image.open(f"Resources/{self.selected_image}")
-                                    image = image.resize((self.grid_width, self.grid_height))
-                                    photo = ImageTk.PhotoImage(image)
-                                    self.image_cache[self.selected_image] = [image, photo]
-                                else:
-                                    photo = self.image_cache[self.selected_image][1]
-                                image_id = self.create_image(grid_x * self.grid_width, grid_y * self.grid_height, image=photo, anchor=tk.NW, tags=(str("%s(%d,%d)" % (self.current_layer, grid_x, grid_y))))
-                                layer["elements"].append(image_id)
-                                layer["grid_data"][grid_y][grid_x] = self.selected_image
-                                layer["image_ids"][(grid_x, grid_y)] = image_id
+        """松开鼠标时提交选区填充, 预览已经显示的格子不会重复绘制"""
+        self.temporarily_apply_selection()
+        preview = self.fill_preview
+        if preview and preview.rect:
+            self.edit_engine.record_change(preview.layer, preview.rect, preview.original_region(preview.rect), mark_dirty=False)
+        self.fill_preview = None
 
     def on_right_click(self, event):
         x, y = self.canvasx(event.x), self.canvasy(event.y)
         grid_x = int(x // self.grid_width)
         grid_y = int(y // self.grid_height)
-        if self.is_within_map(grid_x, grid_y) and self.current_layer:
-            for layer in self.layers:
-                if layer["name"] == self.current_layer:
-                    if layer["grid_data"][grid_y][grid_x] is not None:
-                        image_id = layer["image_ids"].get((grid_x, grid_y))
-                        if image_id:
-                            self.delete(image_id)
-                            layer["elements"].remove(image_id)
-                            layer["grid_data"][grid_y][grid_x] = None
-                            del layer["image_ids"][(grid_x, grid_y)]
+        layer = self.get_layer(self.current_layer)
+        if self.is_within_map(grid_x, grid_y) and layer:
+            self.edit_engine.clear(layer, (grid_x, grid_y, grid_x + 1, grid_y + 1))
+            self.flush_edits()
 
     def on_mouse_wheel(self, event):
         if event.delta > 0:
-            self.zoom_level += 0.1
+            self.zoom_level = quantize_zoom(self.zoom_level + ZOOM_STEP)
         else:
-            self.zoom_level -= 0.1
+            self.zoom_level = quantize_zoom(self.zoom_level - ZOOM_STEP)
         self.grid_width = int(self.original_grid_width * self.zoom_level)
         self.grid_height = int(self.original_grid_height * self.zoom_level)
-        self.scale("all", 0, 0, self.zoom_level, self.zoom_level)
-        self.draw_grid()
-        self.resize_images()
-        self.parent.update()
+        self.request_redraw("zoom")
         self.on_mouse_move(event)
 
-    def resize_images(self):
-        for image_name in self.image_cache.keys():
-            image = self.image_cache[image_name][0]
-            image_resize = image.resize((self.grid_width, self.grid_height))
-            photo = ImageTk.PhotoImage(image_resize)
-            self.image_cache[image_name] = [image, photo]
-
-        for layer in self.layers:
-            for (grid_x, grid_y), image_id in layer["image_ids"].items():
-                image_name = layer["grid_data"][grid_y][grid_x]
-                if image_name:
-                    photo = self.image_cache[image_name][1]
-                    self.itemconfig(image_id, image=photo)
-                    self.coords(image_id, grid_x * self.grid_width, grid_y * self.grid_height)
-
     def update_grid(self):
         self.draw_grid()
 
+    @profiler.timed("refresh_map", "render")
     def refresh_map(self):
         self.delete("all")
-        for layer in self.layers:
-            layer["elements"].clear()
-            for (grid_x, grid_y), image_id in layer["image_ids"].items():
-                image_name = layer["grid_data"][grid_y][grid_x]
-                if image_name:
-                    photo = self.image_cache[image_name][1]
-                    image_id = self.create_image(grid_x * self.grid_width, grid_y * self.grid_height, image=photo, anchor=tk.NW, tags=(str("%s(%d,%d)" % (layer["name"], grid_x, grid_y))))
-                    layer["elements"].append(image_id)
-                    layer["image_ids"][(grid_x, grid_y)] = image_id
-        for layer in self.layers:
-            if layer["visible"]:
-                for element_id in layer["elements"]:
-                    self.itemconfig(element_id, state=tk.NORMAL)
-            else:
-                for element_id in layer["elements"]:
-                    self.itemconfig(element_id, state=tk.HIDDEN)
+        self.grid_lines = []
+        self.highlighted_grid = None
+        self.pointer_key = None
+        self.renderer.clear()
+        self.rendered_grid_size = (self.grid_width, self.grid_height)
         self.draw_grid()
+        self.render_view(force=True)
+        self.notify_view("map")
 
+    @profiler.timed("save_map", "io")
     def save_map(self, file_path):
         if file_path:
-            map_data = {
-                "grid_width": self.original_grid_width,
-                "grid_height": self.original_grid_height,
-                "zoom_level": self.zoom_level,
-                "show_grid": self.show_grid,
-                "rows": self.rows,
-                "cols": self.cols,
-                "background_music": self.background_music,
-                "layers": [],
-                "image_cache": {image_name: image_name for image_name in self.image_cache.keys()}
-            }
-            for layer in self.layers:
-                layer_data = {
-                    "name": layer["name"],
-                    "visible": layer["visible"],
-                    "grid_data": layer["grid_data"]
-                }
-                map_data["layers"].append(layer_data)
-            with open(file_path, "w") as f:
-                json.dump(map_data, f, indent=4)
+            self.tile_map.properties["zoom_level"] = self.zoom_level
+            self.tile_map.properties["show_grid"] = self.show_grid
+            self.tile_map.properties["background_music"] = self.background_music
+            save_map_file(self.tile_map, file_path)
 
     def new_map(self, rows=10, cols=10, grid_width=32, grid_height=32):
         """重设格子的宽高、行列数，并清空各个图层及图像元素"""
-        self.rows = rows
-        self.cols = cols
-        self.original_grid_width = grid_width
-        self.original_grid_height = grid_height
+        self.cancel_load()
+        self.set_tile_map(TileMap(rows, cols, grid_width, grid_height))
         self.grid_width = int(self.original_grid_width * self.zoom_level)
         self.grid_height = int(self.original_grid_height * self.zoom_level)
-        self.layers = []
         self.current_layer = None
         self.selected_image = None
-        self.image_cache = {}
+        self.tile_images.clear()
         self.drag_data = {"x": 0, "y": 0, "item": None}
         self.background_music = None
         self.refresh_map()
         
+    @profiler.timed("load_map", "io")
     def load_map(self, file_path):
         if file_path:
-            with open(file_path, "r") as f:
-                map_data = json.load(f)
-            self.original_grid_width = map_data["grid_width"]
-            self.original_grid_height = map_data["grid_height"]
-            self.zoom_level = map_data["zoom_level"]
-            self.grid_width = int(self.original_grid_width * self.zoom_level)
-            self.grid_height = int(self.original_grid_height * self.zoom_level)
-            self.show_grid = map_data["show_grid"]
-            self.rows = map_data.get("rows", 10)
-            self.cols = map_data.get("cols", 10)
-            self.background_music = map_data.get("background_music")
-            self.layers = []
-            self.image_cache = {}
-            for image_name in map_data["image_cache"]:
-                image = Image.open(f"Resources/{image_name}")
-                image = image.resize((self.grid_width, self.grid_height))
-                photo = ImageTk.PhotoImage(image)
-                self.image_cache[image_name] = [image, photo]
-
-            layer_counter = 1
-            for layer_data in map_data["layers"]:
-                self.add_layer(layer_data["name"])
-                layer = self.layers[-1]
-                layer["name"] = f"图层_{layer_counter}"
-                layer_counter = layer_counter + 1
-                layer["visible"] = layer_data["visible"]
-                layer["grid_data"] = layer_data["grid_data"]
-                for y, row in enumerate(layer["grid_data"]):
-                    for x, image_name in enumerate(row):
-                        if image_name:
-                            photo = self.image_cache[image_name][1]
-                            image_id = self.create_image(x * self.grid_width, y * self.grid_height, image=photo, anchor=tk.NW, tags=(str("%s(%d,%d)" % (layer["name"], x, y))))
-                            layer["elements"].append(image_id)
-                            layer["image_ids"][(x, y)] = image_id
+            self.tile_images.clear()
+            tile_map = load_map_file(file_path)
+            self.asset_pipeline.map(self.tile_images.load_source, tile_map.palette[1:])
+            layers = tile_map.layers
+            tile_map.layers = []
+            tile_map.layer_lookup = {}
+            self.install_map(tile_map)
+            for layer in layers:
+                self.append_loaded_layer(layer)
             self.refresh_map()
+
+    def install_map(self, tile_map):
+        """切换到新读取的地图并应用其中保存的设置, 图层随后由 append_loaded_layer() 逐个加入"""
+        self.set_tile_map(tile_map)
+        self.zoom_level = quantize_zoom(self.tile_map.properties["zoom_level"])
+        self.grid_width = int(self.original_grid_width * self.zoom_level)
+        self.grid_height = int(self.original_grid_height * self.zoom_level)
+        self.show_grid = self.tile_map.properties["show_grid"]
+        self.background_music = self.tile_map.properties["background_music"]
+        self.current_layer = None
+
+    def append_loaded_layer(self, layer):
+        self.tile_map.layers.append(layer)
+        self.tile_map.rename_layer(layer, f"图层_{len(self.layers)}")
+        if not self.current_layer:
+            self.current_layer = layer.name
+
+    def load_map_async(self, file_path, on_progress=None, on_done=None):
+        """在后台加载地图, 图层解码完成一个就显示一个; 加载期间可以平移视图, 也可以用 cancel_load() 取消"""
+        self.cancel_load()
+        self.previous_state = (self.tile_map, self.history, self.zoom_level, self.show_grid, self.background_music, self.current_layer)
+        self.history = History(self.history.budget_bytes)
+        self.tile_images.clear()
+
+        def on_map(tile_map):
+            self.install_map(tile_map)
+            self.refresh_map()
+            self.center_map()
+
+        def on_layer(layer):
+            self.append_loaded_layer(layer)
+            self.render_view(force=True)
+            self.notify_view("map")
+
+        def finished(error):
+            self.map_loader = None
+            if error is not None:
+                self.restore_previous_map()
+            self.previous_state = None
+            if on_done:
+                on_done(error)
+
+        self.map_loader = MapLoader(self, file_path, self.tile_images, self.asset_pipeline, on_map, on_layer, on_progress, finished).start()
+        return self.map_loader
+
+    def cancel_load(self):
+        """取消正在进行的后台加载, 恢复加载前的地图"""
+        if self.map_loader:
+            self.map_loader.cancel()
+            self.map_loader = None
+            self.restore_previous_map()
+            self.previous_state = None
+
+    def is_loading(self):
+        return self.map_loader is not None
+
+    def restore_previous_map(self):
+        tile_map, history, zoom_level, show_grid, background_music, current_layer = self.previous_state
+        if self.tile_map is not tile_map:
+            self.set_tile_map(tile_map)
+            self.zoom_level = zoom_level
+            self.grid_width = int(self.original_grid_width * zoom_level)
+            self.grid_height = int(self.original_grid_height * zoom_level)
+            self.show_grid = show_grid
+            self.background_music = background_music
+            self.current_layer = current_layer
+            self.refresh_map()
+            self.center_map()
+        self.history = history
+
     def get_grid_position(self, x, y):
         """获取指定像素位置对应的格子行列数"""
         grid_x = int(x // self.grid_width)
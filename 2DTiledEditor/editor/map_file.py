@@ -0,0 +1,219 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+import numpy as np
+from utils.profiler import profiler
+from .tile_map import TileMap, TILE_DTYPE, STORAGE_CHUNK_SIZE, SPARSE_THRESHOLD
+
+# 二进制地图文件: 固定文件头 + JSON 头部(尺寸、设置、调色板、图层目录) + 各图层 zlib 压缩后的数据
+# 版本 1: 图层数据为整个 rows x cols 编号数组
+# 版本 2: 图层数据为非空分块的坐标数组 (n, 2) int32 加分块编号数组 (n, size, size), 全空的分块不保存
+MAGIC = b"TMAP"
+FORMAT_VERSION = 2
+FILE_HEADER = struct.Struct("<4sHI")  # 魔数, 格式版本, JSON 头部字节数
+BINARY_EXTENSION = ".tmap"
+# 文件中的编号数组固定为小端 uint16, 与运行平台无关
+FILE_DTYPE = np.dtype("<u2")
+COORD_DTYPE = np.dtype("<i4")
+
+
+class MapFileError(Exception):
+    pass
+
+
+def is_binary_map(file_path):
+    """根据文件开头的魔数判断是否为二进制地图文件"""
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encode_layer(layer, level=6, chunk_size=STORAGE_CHUNK_SIZE):
+    """按分块编码图层, 返回 (压缩数据, 分块数)"""
+    coords = []
+    blocks = []
+    for cx, cy, chunk in layer.iter_chunks(chunk_size):
+        if chunk.shape != (chunk_size, chunk_size):
+            # 稠密图层在地图边缘的分块不完整, 补齐为完整分块
+            block = np.zeros((chunk_size, chunk_size), dtype=TILE_DTYPE)
+            block[:chunk.shape[0], :chunk.shape[1]] = chunk
+            chunk = block
+        coords.append((cx, cy))
+        blocks.append(chunk)
+    coords = np.array(coords, dtype=COORD_DTYPE).reshape(-1, 2)
+    blocks = np.array(blocks, dtype=FILE_DTYPE).reshape(-1, chunk_size, chunk_size)
+    return zlib.compress(coords.tobytes() + blocks.tobytes(), level), len(coords)
+
+
+def save_binary(tile_map, file_path, level=6):
+    """保存为二进制地图文件"""
+    # 先压缩全部图层再打开文件, 覆盖正在被内存映射读取的同一个文件时也不会出错
+    encoded = [encode_layer(layer, level) for layer in tile_map.layers]
+    blobs = [blob for blob, _ in encoded]
+    layers = []
+    offset = 0
+    for layer, (blob, chunk_count) in zip(tile_map.layers, encoded):
+        layers.append({
+            "name": layer.name, "visible": layer.visible, "codec": "zlib", "storage": "chunks",
+            "chunk_size": STORAGE_CHUNK_SIZE, "chunk_count": chunk_count, "offset": offset, "length": len(blob)
+        })
+        offset += len(blob)
+    header = {
+        "grid_width": tile_map.grid_width,
+        "grid_height": tile_map.grid_height,
+        "rows": tile_map.rows,
+        "cols": tile_map.cols,
+        "sparse": tile_map.sparse,
+        "properties": tile_map.properties,
+        "palette": tile_map.palette[1:],
+        "layers": layers
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    with open(file_path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for blob in blobs:
+            f.write(blob)
+
+
+class MapFileReader:
+    """以内存映射方式打开二进制地图文件, 图层数据在第一次访问时才解压
+
+    所有图层都解压完之后自动关闭映射和文件.
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, "rb")
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, header_size = FILE_HEADER.unpack_from(self.mmap, 0)
+            if magic != MAGIC:
+                raise MapFileError("不是二进制地图文件: %s" % file_path)
+            if version > FORMAT_VERSION:
+                raise MapFileError("不支持的地图文件版本 %d" % version)
+            start = FILE_HEADER.size
+            self.header = json.loads(self.mmap[start:start + header_size].decode("utf-8"))
+        except (ValueError, struct.error) as e:
+            self.close()
+            raise MapFileError("地图文件已损坏: %s" % file_path) from e
+        except Exception:
+            self.close()
+            raise
+        self.version = version
+        self.data_start = start + header_size
+        self.pending = len(self.header["layers"])
+        if self.pending == 0:
+            self.close()
+
+    def create_map(self):
+        header = self.header
+        tile_map = TileMap(header["rows"], header["cols"], header["grid_width"], header["grid_height"], header.get("sparse"))
+        tile_map.properties.update(header.get("properties", {}))
+        for image_name in header["palette"]:
+            tile_map.tile_id(image_name)
+        for entry in header["layers"]:
+            tile_map.add_layer(entry["name"], entry["visible"], loader=self.layer_loader(entry, tile_map))
+        return tile_map
+
+    def layer_loader(self, entry, tile_map):
+        def load():
+            return self.decode_layer(entry, tile_map)
+        return load
+
+    def decode_layer(self, entry, tile_map):
+        """解压图层数据; 稀疏地图返回 {(cx, cy): 分块数组}, 稠密地图返回 rows x cols 数组"""
+        if entry.get("codec", "zlib") != "zlib":
+            raise MapFileError("不支持的图层压缩方式 %s" % entry["codec"])
+        start = self.data_start + entry["offset"]
+        raw = zlib.decompress(self.mmap[start:start + entry["length"]])
+        self.pending -= 1
+        if self.pending == 0:
+            self.close()
+        rows, cols = tile_map.rows, tile_map.cols
+        if entry.get("storage", "dense") == "dense":
+            data = np.frombuffer(raw, dtype=FILE_DTYPE).reshape(rows, cols).astype(TILE_DTYPE)
+            return chunks_from_dense(data) if tile_map.sparse else data
+        size = entry["chunk_size"]
+        count = entry["chunk_count"]
+        coords = np.frombuffer(raw, dtype=COORD_DTYPE, count=count * 2).reshape(count, 2)
+        blocks = np.frombuffer(raw, dtype=FILE_DTYPE, offset=coords.nbytes).reshape(count, size, size).astype(TILE_DTYPE)
+        if tile_map.sparse and size == STORAGE_CHUNK_SIZE:
+            return {(int(cx), int(cy)): blocks[index] for index, (cx, cy) in enumerate(coords)}
+        data = np.zeros((rows, cols), dtype=TILE_DTYPE)
+        for index, (cx, cy) in enumerate(coords.tolist()):
+            x0, y0 = cx * size, cy * size
+            block = blocks[index, :min(size, rows - y0), :min(size, cols - x0)]
+            data[y0:y0 + block.shape[0], x0:x0 + block.shape[1]] = block
+        return chunks_from_dense(data) if tile_map.sparse else data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if getattr(self, "mmap", None) is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+
+
+def chunks_from_dense(data, chunk_size=STORAGE_CHUNK_SIZE):
+    """把稠密数组切成稀疏图层使用的分块字典, 跳过全空的分块"""
+    chunks = {}
+    for y in range(0, data.shape[0], chunk_size):
+        for x in range(0, data.shape[1], chunk_size):
+            block = data[y:y + chunk_size, x:x + chunk_size]
+            if block.any():
+                chunk = np.zeros((chunk_size, chunk_size), dtype=TILE_DTYPE)
+                chunk[:block.shape[0], :block.shape[1]] = block
+                chunks[(x // chunk_size, y // chunk_size)] = chunk
+    return chunks
+
+
+def load_binary(file_path):
+    """读取二进制地图文件, 图层数据延迟解压"""
+    return MapFileReader(file_path).create_map()
+
+
+def load_map_file(file_path):
+    """读取地图文件, 自动识别二进制格式和 JSON 格式"""
+    if is_binary_map(file_path):
+        return load_binary(file_path)
+    with open(file_path, "r") as f:
+        with profiler.span("parse_json", "io"):
+            map_data = json.load(f)
+    return TileMap.from_dict(map_data)
+
+
+def can_save_json(tile_map):
+    """JSON 格式需要先生成完整的二维列表, 格子数超过 SPARSE_THRESHOLD 的地图只能保存为二进制格式"""
+    return tile_map.rows * tile_map.cols <= SPARSE_THRESHOLD
+
+
+def save_map_file(tile_map, file_path):
+    """按扩展名保存: .tmap 为二进制格式, 其它为 JSON 格式"""
+    if os.path.splitext(file_path)[1].lower() == BINARY_EXTENSION:
+        save_binary(tile_map, file_path)
+    else:
+        if not can_save_json(tile_map):
+            raise MapFileError("地图有 %d x %d 个格子, 不能保存为 JSON 格式, 请保存为 %s 格式" % (tile_map.cols, tile_map.rows, BINARY_EXTENSION))
+        map_data = tile_map.to_dict()
+        with open(file_path, "w") as f:
+            json.dump(map_data, f, indent=4)
+
+
+def convert_map(source_path, target_path):
+    """在 JSON 和二进制地图格式之间转换, 目标格式由扩展名决定"""
+    save_map_file(load_map_file(source_path), target_path)
+
+
+if __name__ == "__main__":
+    # python -m editor.map_file 源文件 目标文件
+    if len(sys.argv) != 3:
+        print("用法: python -m editor.map_file <源地图> <目标地图(.json 或 .tmap)>")
+        sys.exit(1)
+    convert_map(sys.argv[1], sys.argv[2])
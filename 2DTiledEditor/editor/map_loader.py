@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .map_file import is_binary_map, load_map_file
+from .tile_image_cache import quantize_zoom
+
+# 超过这个大小的 JSON 地图放到子进程里解析: json 解析期间一直持有 GIL, 在线程里解析同样会卡住界面
+PROCESS_PARSE_THRESHOLD = 8 * 1024 * 1024
+
+parse_executor = None
+parse_executor_lock = threading.Lock()
+
+
+def get_parse_executor():
+    """所有加载共用一个解析进程, 第一次需要时才启动.
+    使用 spawn 启动: 编辑器进程中有 Tk 和其它线程, fork 出的子进程可能死锁"""
+    global parse_executor
+    with parse_executor_lock:
+        if parse_executor is None:
+            parse_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return parse_executor
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class MapLoader:
+    """渐进式地图加载
+
+    后台线程负责解析文件和解码图层数据, 图片的解码和缩放交给 asset_pipeline 的线程池并行完成,
+    结果通过队列交给 Tk 主线程;
+    主线程每帧用 after() 取出消息, 每次处理不超过 frame_budget 秒, 加载期间界面可以正常平移和取消.
+
+    回调都在主线程调用:
+        on_map(tile_map)                     地图尺寸和设置已经读出, 图层列表为空
+        on_layer(layer)                      一个图层的数据已经解码完成
+        on_progress(stage, done, total)      stage 为 "parse"、"images" 或 "layers"
+        on_done(error)                       加载结束, 成功时 error 为 None; 被取消时不调用
+    """
+
+    def __init__(self, widget, file_path, tile_images, asset_pipeline, on_map, on_layer, on_progress=None, on_done=None, frame_budget=0.012):
+        self.widget = widget
+        self.file_path = file_path
+        self.tile_images = tile_images
+        self.asset_pipeline = asset_pipeline
+        self.on_map = on_map
+        self.on_layer = on_layer
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.frame_budget = frame_budget
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.after_id = None
+        self.finished = False
+        self.worker = threading.Thread(target=self.run_worker, daemon=True)
+
+    def start(self):
+        self.worker.start()
+        self.after_id = self.widget.after(16, self.pump)
+        return self
+
+    def cancel(self):
+        """停止加载, 已经排队的消息全部丢弃"""
+        self.cancelled.set()
+        self.finished = True
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise LoadCancelled()
+
+    def post(self, *message):
+        self.check_cancelled()
+        self.messages.put(message)
+
+    def parse_map(self):
+        if not is_binary_map(self.file_path) and os.path.getsize(self.file_path) > PROCESS_PARSE_THRESHOLD:
+            return get_parse_executor().submit(load_map_file, self.file_path).result()
+        return load_map_file(self.file_path)
+
+    def run_worker(self):
+        """后台线程: 不访问任何 Tk 对象"""
+        try:
+            self.post("progress", "parse", 0, 1)
+            tile_map = self.parse_map()
+            self.check_cancelled()
+            layers = tile_map.layers
+            tile_map.layers = []
+            tile_map.layer_lookup = {}
+            self.post("map", tile_map)
+            zoom_level = quantize_zoom(tile_map.properties["zoom_level"])
+            size = (int(tile_map.grid_width * zoom_level), int(tile_map.grid_height * zoom_level))
+            self.asset_pipeline.map(lambda image_name: self.prepare_image(image_name, size), tile_map.palette[1:],
+                                    lambda done, total: self.post("progress", "images", done, total))
+            for index, layer in enumerate(layers):
+                self.check_cancelled()
+                layer.load()  # 在后台线程完成延迟解码
+                self.post("layer", layer)
+                self.post("progress", "layers", index + 1, len(layers))
+            self.post("done", None)
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.messages.put(("done", e))
+
+    def prepare_image(self, image_name, size):
+        """在线程池中读取原图并缩放到打开地图时的格子大小, 主线程合成分块时直接命中缓存"""
+        if self.cancelled.is_set():
+            return
+        try:
+            self.tile_images.load_source(image_name)
+            if size[0] > 0 and size[1] > 0:
+                self.tile_images.get_image(image_name, *size)
+        except OSError:
+            # 缺失的图片留到绘制时再报错, 不影响地图本身的加载
+            pass
+
+    def pump(self):
+        """主线程: 在帧预算内处理后台线程的消息"""
+        self.after_id = None
+        deadline = time.perf_counter() + self.frame_budget
+        while not self.finished and time.perf_counter() < deadline:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            self.handle(message)
+            if message[0] == "layer":
+                # 每帧最多显示一个图层, 把绘制开销分摊到多帧
+                break
+        if not self.finished:
+            self.after_id = self.widget.after(16, self.pump)
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == "map":
+            self.on_map(message[1])
+        elif kind == "layer":
+            self.on_layer(message[1])
+        elif kind == "progress":
+            if self.on_progress:
+                self.on_progress(*message[1:])
+        elif kind == "done":
+            self.finished = True
+            if self.on_done:
+                self.on_done(message[1])
@@ -0,0 +1,298 @@
+import argparse
+import math
+import os
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from utils.texture_atlas import load_atlas
+from .map_file import is_binary_map, load_map_file, save_binary
+from .tile_image_cache import TileImageCache
+
+# 离线渲染: 把地图的可见图层按图层顺序(与 refresh_map 相同, 下标越大越靠上)合成为图片,
+# 输出一张完整的 PNG 和 z/x/y 分级瓦片. 地图被切成若干区域交给进程池渲染, 每个进程同一时间只持有一个区域的图像.
+TILE_SIZE = 256
+BLOCK_LEVELS = 3  # 分级瓦片的每个任务渲染 TILE_SIZE << BLOCK_LEVELS 像素见方的区域, 并在本地生成其下 BLOCK_LEVELS 级
+BAND_BYTES = 32 * 1024 * 1024  # 完整 PNG 按横条渲染, 每条图像的大约上限
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+ADLER_BASE = 65521
+
+# 进程池中每个进程的渲染状态, 由 init_worker() 设置
+worker = None
+
+
+class RegionRenderer:
+    """按格子区域合成地图图像, 每种图片在第一次用到时缩放一次, 只保存用到过的图片"""
+
+    def __init__(self, map_path, resources_dir, cell_width, cell_height, background=(0, 0, 0, 0)):
+        self.tile_map = load_map_file(map_path)
+        self.images = TileImageCache(resources_dir, 0, load_atlas(resources_dir))
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.background = background
+        self.empty_tile = np.zeros((cell_height, cell_width, 4), dtype=np.uint8)
+        self.tiles = {0: self.empty_tile}  # 调色板编号 -> 缩放后的像素
+        self.loaded = np.zeros(len(self.tile_map.palette), dtype=bool)
+        self.loaded[0] = True
+        self.missing = set()
+
+    @property
+    def width(self):
+        return self.tile_map.cols * self.cell_width
+
+    @property
+    def height(self):
+        return self.tile_map.rows * self.cell_height
+
+    def load_tiles(self, ids):
+        for tile_id in ids[~self.loaded[ids]].tolist():
+            name = self.tile_map.palette[tile_id]
+            try:
+                image = self.images.get_image(name, self.cell_width, self.cell_height)
+                self.tiles[tile_id] = np.asarray(image.convert("RGBA"))
+            except OSError:
+                # 缺少的图片画成透明
+                self.missing.add(name)
+                self.tiles[tile_id] = self.empty_tile
+            self.loaded[tile_id] = True
+
+    def render_cells(self, x0, y0, x1, y1):
+        """合成格子区域 [x0, x1) x [y0, y1) 的图像"""
+        width, height = (x1 - x0) * self.cell_width, (y1 - y0) * self.cell_height
+        result = Image.new("RGBA", (width, height), self.background)
+        for layer in self.tile_map.layers:
+            if not layer.visible:
+                continue
+            ids = layer.get_region(x0, y0, x1, y1)
+            if not ids.any():
+                continue
+            used, inverse = np.unique(ids, return_inverse=True)
+            self.load_tiles(used)
+            # 只把这个区域用到的图片叠成数组, 再按格子取出
+            stack = np.stack([self.tiles[tile_id] for tile_id in used.tolist()])
+            # (行, 列, 格子高, 格子宽, 4) -> (行 * 格子高, 列 * 格子宽, 4)
+            pixels = stack[inverse.reshape(ids.shape)].transpose(0, 2, 1, 3, 4).reshape(height, width, 4)
+            result.alpha_composite(Image.fromarray(pixels, "RGBA"))
+        return result
+
+    def render_pixels(self, px0, py0, px1, py1):
+        """合成像素区域 [px0, px1) x [py0, py1) 的图像, 区域边界不必与格子对齐"""
+        x0, y0 = px0 // self.cell_width, py0 // self.cell_height
+        x1, y1 = -(-px1 // self.cell_width), -(-py1 // self.cell_height)
+        image = self.render_cells(x0, y0, x1, y1)
+        left, top = px0 - x0 * self.cell_width, py0 - y0 * self.cell_height
+        return image.crop((left, top, left + px1 - px0, top + py1 - py0))
+
+
+def init_worker(map_path, resources_dir, cell_width, cell_height, background):
+    global worker
+    worker = RegionRenderer(map_path, resources_dir, cell_width, cell_height, background)
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def adler32_combine(adler1, adler2, length2):
+    """合并两段数据的 adler32 校验值, 与 zlib 的 adler32_combine 相同"""
+    remainder = length2 % ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % ADLER_BASE
+    sum1 += (adler2 & 0xFFFF) + ADLER_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - remainder
+    return (sum1 % ADLER_BASE) | ((sum2 % ADLER_BASE) << 16)
+
+
+def encode_band(band_index, y0, y1):
+    """进程池任务: 渲染第 y0 到 y1 行格子的横条, 返回 (下标, 原始 deflate 数据, adler32, 未压缩长度)
+
+    每行像素使用 PNG 的 Sub 过滤; 每条单独压缩并以 Z_FULL_FLUSH 结束, 按顺序拼接后仍是一个合法的 deflate 流.
+    """
+    pixels = np.asarray(worker.render_cells(0, y0, worker.tile_map.cols, y1))
+    filtered = pixels.reshape(pixels.shape[0], -1).copy()
+    filtered[:, 4:] -= pixels.reshape(pixels.shape[0], -1)[:, :-4]
+    raw = np.empty((filtered.shape[0], filtered.shape[1] + 1), dtype=np.uint8)
+    raw[:, 0] = 1  # Sub 过滤
+    raw[:, 1:] = filtered
+    raw = raw.tobytes()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_FULL_FLUSH)
+    return band_index, data, zlib.adler32(raw), len(raw)
+
+
+def ordered_results(executor, func, tasks, window):
+    """按任务顺序产生结果, 同时最多有 window 个任务在执行或等待写出, 限制主进程的内存"""
+    pending = []
+    for task in tasks:
+        pending.append(executor.submit(func, *task))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def render_png(executor, renderer, file_path, window, progress=None):
+    """渲染完整地图并流式写出 PNG, 主进程内存与地图大小无关"""
+    width, height = renderer.width, renderer.height
+    row_bytes = width * 4 * renderer.cell_height
+    band_rows = max(1, BAND_BYTES // max(row_bytes, 1))
+    tasks = [(index, y, min(y + band_rows, renderer.tile_map.rows)) for index, y in enumerate(range(0, renderer.tile_map.rows, band_rows))]
+    adler = 1
+    with open(file_path, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        f.write(png_chunk(b"IDAT", b"\x78\x9c"))
+        for done, (_, data, band_adler, length) in enumerate(ordered_results(executor, encode_band, tasks, window), 1):
+            adler = adler32_combine(adler, band_adler, length)
+            for start in range(0, len(data), 1 << 20):
+                f.write(png_chunk(b"IDAT", data[start:start + (1 << 20)]))
+            if progress:
+                progress("png", done, len(tasks))
+        # 空的最后一个块结束 deflate 流, 然后是整个数据的 adler32
+        f.write(png_chunk(b"IDAT", zlib.compressobj(6, zlib.DEFLATED, -15).flush() + struct.pack(">I", adler)))
+        f.write(png_chunk(b"IEND", b""))
+
+
+def get_max_level(width, height, tile_size):
+    """最高一级(原始分辨率)的级别编号, 第 0 级整张地图缩小到一张瓦片以内"""
+    return max(0, math.ceil(math.log2(max(width, height, 1) / tile_size)))
+
+
+def level_size(width, height, max_level, level):
+    shift = max_level - level
+    return -(-width >> shift), -(-height >> shift)
+
+
+def save_tile(image, output_dir, level, x, y):
+    """保存一张瓦片, 全透明的瓦片不保存; 返回是否保存"""
+    if image.getchannel("A").getbbox() is None:
+        return False
+    tile_dir = os.path.join(output_dir, str(level), str(x))
+    os.makedirs(tile_dir, exist_ok=True)
+    image.save(os.path.join(tile_dir, "%d.png" % y))
+    return True
+
+
+def render_block(bx, by, output_dir, tile_size, block_levels, max_level):
+    """进程池任务: 渲染一个区域的最高级瓦片, 再逐级缩小生成同一区域下面 block_levels 级的瓦片"""
+    block_size = tile_size << block_levels
+    px0, py0 = bx * block_size, by * block_size
+    px1, py1 = min(px0 + block_size, worker.width), min(py0 + block_size, worker.height)
+    image = Image.new("RGBA", (block_size, block_size), (0, 0, 0, 0))
+    image.paste(worker.render_pixels(px0, py0, px1, py1), (0, 0))
+    saved = 0
+    for step in range(block_levels + 1):
+        level = max_level - step
+        count = 1 << (block_levels - step)
+        level_width, level_height = level_size(worker.width, worker.height, max_level, level)
+        for j in range(count):
+            for i in range(count):
+                x, y = bx * count + i, by * count + j
+                if x * tile_size < level_width and y * tile_size < level_height:
+                    saved += save_tile(image.crop((i * tile_size, j * tile_size, (i + 1) * tile_size, (j + 1) * tile_size)), output_dir, level, x, y)
+        if step < block_levels:
+            image = image.resize((image.width // 2, image.height // 2), Image.BOX)
+    return saved
+
+
+def build_upper_levels(output_dir, width, height, tile_size, top_level, max_level):
+    """由第 top_level 级的瓦片每 2x2 张合成上一级, 直到第 0 级"""
+    saved = 0
+    for level in range(top_level - 1, -1, -1):
+        level_width, level_height = level_size(width, height, max_level, level)
+        for y in range(-(-level_height // tile_size)):
+            for x in range(-(-level_width // tile_size)):
+                image = Image.new("RGBA", (tile_size * 2, tile_size * 2), (0, 0, 0, 0))
+                for j in range(2):
+                    for i in range(2):
+                        path = os.path.join(output_dir, str(level + 1), str(x * 2 + i), "%d.png" % (y * 2 + j))
+                        if os.path.exists(path):
+                            with Image.open(path) as child:
+                                image.paste(child.convert("RGBA"), (i * tile_size, j * tile_size))
+                saved += save_tile(image.resize((tile_size, tile_size), Image.BOX), output_dir, level, x, y)
+    return saved
+
+
+def render_pyramid(executor, renderer, output_dir, tile_size, block_levels, progress=None):
+    """生成 z/x/y 分级瓦片, 返回 (最高级别, 保存的瓦片数)"""
+    width, height = renderer.width, renderer.height
+    max_level = get_max_level(width, height, tile_size)
+    block_levels = min(block_levels, max_level)
+    block_size = tile_size << block_levels
+    blocks = [(bx, by) for by in range(-(-height // block_size)) for bx in range(-(-width // block_size))]
+    futures = [executor.submit(render_block, bx, by, output_dir, tile_size, block_levels, max_level) for bx, by in blocks]
+    saved = 0
+    for done, future in enumerate(futures, 1):
+        saved += future.result()
+        if progress:
+            progress("tiles", done, len(futures))
+    saved += build_upper_levels(output_dir, width, height, tile_size, max_level - block_levels, max_level)
+    return max_level, saved
+
+
+def render_map(map_path, output_dir, resources_dir="Resources", scale=1.0, tile_size=TILE_SIZE, flat=True, pyramid=True,
+               max_workers=None, background=(0, 0, 0, 0), block_levels=BLOCK_LEVELS, progress=None):
+    """渲染地图, 输出 output_dir/map.png 和 output_dir/tiles/{z}/{x}/{y}.png, 返回统计信息"""
+    os.makedirs(output_dir, exist_ok=True)
+    temp_path = None
+    if not is_binary_map(map_path):
+        # JSON 地图先转为二进制格式, 各进程通过内存映射读取, 不必各自解析一遍 JSON
+        fd, temp_path = tempfile.mkstemp(suffix=".tmap")
+        os.close(fd)
+        save_binary(load_map_file(map_path), temp_path)
+        map_path = temp_path
+    try:
+        tile_map = load_map_file(map_path)
+        cell_width = max(1, round(tile_map.grid_width * scale))
+        cell_height = max(1, round(tile_map.grid_height * scale))
+        renderer = RegionRenderer(map_path, resources_dir, cell_width, cell_height, background)
+        stats = {"width": renderer.width, "height": renderer.height}
+        workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(map_path, resources_dir, cell_width, cell_height, background)) as executor:
+            if flat:
+                png_path = os.path.join(output_dir, "map.png")
+                render_png(executor, renderer, png_path, workers * 2, progress)
+                stats["png"] = png_path
+            if pyramid:
+                stats["max_level"], stats["tiles"] = render_pyramid(executor, renderer, os.path.join(output_dir, "tiles"), tile_size, block_levels, progress)
+        return stats
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def parse_color(text):
+    text = text.lstrip("#")
+    if len(text) not in (6, 8):
+        raise argparse.ArgumentTypeError("颜色格式为 RRGGBB 或 RRGGBBAA")
+    values = [int(text[i:i + 2], 16) for i in range(0, len(text), 2)]
+    return tuple(values + [255] * (4 - len(values)))
+
+
+if __name__ == "__main__":
+    # python -m editor.map_render 地图文件 输出目录
+    parser = argparse.ArgumentParser(description="离线渲染地图为 PNG 和分级瓦片")
+    parser.add_argument("map", help="地图文件(.json 或 .tmap)")
+    parser.add_argument("output", help="输出目录")
+    parser.add_argument("--resources", default="Resources", help="图片资源目录")
+    parser.add_argument("--scale", type=float, default=1.0, help="格子像素大小的缩放比例")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="瓦片边长")
+    parser.add_argument("--background", type=parse_color, default=(0, 0, 0, 0), help="背景颜色, 默认透明")
+    parser.add_argument("--jobs", type=int, default=None, help="进程数, 默认为 CPU 核数")
+    parser.add_argument("--no-png", action="store_true", help="不输出完整 PNG")
+    parser.add_argument("--no-tiles", action="store_true", help="不输出分级瓦片")
+    args = parser.parse_args()
+
+    def print_progress(stage, done, total):
+        print("\r%s %d/%d" % (stage, done, total), end="\n" if done == total else "", flush=True)
+
+    start = time.perf_counter()
+    result = render_map(args.map, args.output, args.resources, args.scale, args.tile_size, not args.no_png, not args.no_tiles,
+                        args.jobs, args.background, progress=print_progress)
+    print("%d x %d 像素, 用时 %.1f 秒" % (result["width"], result["height"], time.perf_counter() - start))
+    if "tiles" in result:
+        print("分级瓦片 0-%d 级, 共 %d 张" % (result["max_level"], result["tiles"]))
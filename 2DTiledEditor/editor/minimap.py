@@ -1,45 +1,148 @@
 import tkinter as tk
-from tkinter import ttk
+import numpy as np
+from PIL import Image, ImageTk
+
+MINIMAP_WIDTH = 200
+MINIMAP_HEIGHT = 150
+BACKGROUND_COLOR = (47, 79, 79)  # 与地图画布背景 #2F4F4F 一致
+
 
 class MiniMap(tk.Canvas):
+    """小地图
+
+    整张地图绘制为一张缩小的位图: 每隔 sample_step 个格子取一个, 取最上层可见图层的图片,
+    用该图片的平均颜色表示. 编辑后只重新采样脏矩形覆盖的部分, 视口框是一个单独的矩形, 平移缩放时只移动它.
+    """
+
     def __init__(self, parent, main_canvas, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
         self.parent = parent
         self.main_canvas = main_canvas
+        self.tile_colors = {}  # 图片名称 -> 平均颜色 (r, g, b)
+        self.color_table = np.array([BACKGROUND_COLOR], dtype=np.uint8)  # 调色板编号 -> 颜色
+        self.palette_key = (None,)  # 生成 color_table 时的调色板内容
+        self.samples = None  # 采样后的颜色数组 (h, w, 3)
+        self.sample_step = 1
+        self.image_rect = (0, 0, 0, 0)  # 位图在小地图中的位置 (x, y, 宽, 高)
+        self.photo = None
+        self.dirty_rects = []
+        self.full_update = True
+        self.update_id = None
         self.init_ui()
         self.bind_events()
+        self.schedule_update()
 
     def init_ui(self):
-        self.configure(width=200, height=150, bg="lightgray")
-        self.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
-        self.update_minimap()
+        self.configure(width=MINIMAP_WIDTH, height=MINIMAP_HEIGHT, bg="#%02x%02x%02x" % BACKGROUND_COLOR, highlightthickness=0)
+        self.pack(side=tk.TOP, pady=5)
+        self.image_item = self.create_image(0, 0, anchor=tk.NW)
+        self.view_item = self.create_rectangle(0, 0, 0, 0, outline="red", width=1)
 
     def bind_events(self):
         self.bind("<Button-1>", self.on_click)
+        self.bind("<B1-Motion>", self.on_click)
+        self.main_canvas.add_view_listener(self.on_view_change)
+
+    def on_view_change(self, kind, rect):
+        if kind == "view":
+            self.update_view_area()
+            return
+        if kind == "map":
+            self.full_update = True
+            self.dirty_rects = []
+        elif not self.full_update:
+            self.dirty_rects.append(rect)
+        self.schedule_update()
+
+    def schedule_update(self):
+        """同一轮事件中的多次修改合并为一次刷新"""
+        if self.update_id is None:
+            self.update_id = self.after_idle(self.update_minimap)
+
+    def get_color(self, image_name):
+        """返回图片不透明像素的平均颜色"""
+        color = self.tile_colors.get(image_name)
+        if color is None:
+            try:
+                pixels = np.asarray(self.main_canvas.tile_images.load_source(image_name), dtype=np.float32).reshape(-1, 4)
+            except OSError:
+                pixels = np.zeros((0, 4), dtype=np.float32)
+            alpha = pixels[:, 3]
+            if alpha.sum() > 0:
+                color = tuple(int(round(c)) for c in (pixels[:, :3] * alpha[:, None]).sum(axis=0) / alpha.sum())
+            else:
+                color = BACKGROUND_COLOR
+            self.tile_colors[image_name] = color
+        return color
+
+    def update_color_table(self):
+        # 按调色板内容判断, 打开另一张调色板长度相同的地图或调色板重新编号后都要重建
+        palette = tuple(self.main_canvas.tile_map.palette)
+        if palette != self.palette_key:
+            self.palette_key = palette
+            self.color_table = np.array([BACKGROUND_COLOR] + [self.get_color(name) for name in palette[1:]], dtype=np.uint8)
+
+    def sample_region(self, sx0, sy0, sx1, sy1):
+        """合成采样点 [sx0, sx1) x [sy0, sy1) 的颜色, 上层可见图层的非空格子覆盖下层"""
+        step = self.sample_step
+        colors = np.empty((sy1 - sy0, sx1 - sx0, 3), dtype=np.uint8)
+        colors[:] = BACKGROUND_COLOR
+        for layer in self.main_canvas.layers:
+            if not layer.visible or not layer.is_loaded:
+                continue
+            ids = layer.sample(sx0 * step, sy0 * step, sx1 * step, sy1 * step, step)
+            mask = ids != 0
+            colors[mask] = self.color_table[ids[mask]]
+        return colors
 
     def update_minimap(self):
-        self.delete("all")
-        main_width = self.main_canvas.winfo_width()
-        main_height = self.main_canvas.winfo_height()
-        scale_x = 200 / main_width
-        scale_y = 150 / main_height
-
-        for item in self.main_canvas.find_all():
-            coords = self.main_canvas.coords(item)
-            scaled_coords = [coord * scale_x if idx % 2 == 0 else coord * scale_y for idx, coord in enumerate(coords)]
-            self.create_rectangle(*scaled_coords, fill="blue", tags="element")
-
-        view_x0 = self.main_canvas.canvasx(0) * scale_x
-        view_y0 = self.main_canvas.canvasy(0) * scale_y
-        view_x1 = self.main_canvas.canvasx(self.main_canvas.winfo_width()) * scale_x
-        view_y1 = self.main_canvas.canvasy(self.main_canvas.winfo_height()) * scale_y
-        self.create_rectangle(view_x0, view_y0, view_x1, view_y1, outline="red", tags="view_area")
+        self.update_id = None
+        rows, cols = self.main_canvas.rows, self.main_canvas.cols
+        self.update_color_table()
+        if self.full_update or self.samples is None:
+            self.full_update = False
+            self.dirty_rects = []
+            self.sample_step = max(1, -(-cols // MINIMAP_WIDTH), -(-rows // MINIMAP_HEIGHT))
+            step = self.sample_step
+            self.samples = self.sample_region(0, 0, -(-cols // step), -(-rows // step))
+        else:
+            step = self.sample_step
+            for x0, y0, x1, y1 in self.dirty_rects:
+                # 只有格子坐标为 step 倍数的格子参与采样
+                sx0, sy0 = -(-x0 // step), -(-y0 // step)
+                sx1, sy1 = -(-x1 // step), -(-y1 // step)
+                if sx0 < sx1 and sy0 < sy1:
+                    self.samples[sy0:sy1, sx0:sx1] = self.sample_region(sx0, sy0, sx1, sy1)
+            self.dirty_rects = []
+        height, width = self.samples.shape[:2]
+        scale = min(MINIMAP_WIDTH / width, MINIMAP_HEIGHT / height)
+        image_width, image_height = max(1, int(width * scale)), max(1, int(height * scale))
+        image = Image.fromarray(self.samples, "RGB").resize((image_width, image_height), Image.NEAREST)
+        self.photo = ImageTk.PhotoImage(image)
+        self.image_rect = ((MINIMAP_WIDTH - image_width) // 2, (MINIMAP_HEIGHT - image_height) // 2, image_width, image_height)
+        self.coords(self.image_item, self.image_rect[0], self.image_rect[1])
+        self.itemconfigure(self.image_item, image=self.photo)
+        self.update_view_area()
+
+    def update_view_area(self):
+        """按主画布的视口移动红色视口框"""
+        canvas = self.main_canvas
+        if canvas.grid_width <= 0 or canvas.grid_height <= 0 or canvas.cols == 0 or canvas.rows == 0:
+            return
+        left, top, width, height = self.image_rect
+        scale_x = width / (canvas.cols * canvas.grid_width)
+        scale_y = height / (canvas.rows * canvas.grid_height)
+        x0, y0 = canvas.canvasx(0), canvas.canvasy(0)
+        x1, y1 = canvas.canvasx(canvas.winfo_width()), canvas.canvasy(canvas.winfo_height())
+        self.coords(self.view_item, left + x0 * scale_x, top + y0 * scale_y, left + x1 * scale_x, top + y1 * scale_y)
+        self.tag_raise(self.view_item)
 
     def on_click(self, event):
-        scale_x = self.main_canvas.winfo_width() / 200
-        scale_y = self.main_canvas.winfo_height() / 150
-        x = event.x * scale_x
-        y = event.y * scale_y
-        self.main_canvas.xview_moveto((x - self.main_canvas.winfo_width() / 2) / self.main_canvas.winfo_width())
-        self.main_canvas.yview_moveto((y - self.main_canvas.winfo_height() / 2) / self.main_canvas.winfo_height())
-        self.update_minimap()
+        """点击或拖动时把主画布的视图中心移到对应位置"""
+        canvas = self.main_canvas
+        left, top, width, height = self.image_rect
+        if width == 0 or height == 0:
+            return
+        x = min(max(event.x - left, 0), width) / width * canvas.cols * canvas.grid_width
+        y = min(max(event.y - top, 0), height) / height * canvas.rows * canvas.grid_height
+        canvas.scroll_to(x, y)
@@ -0,0 +1,115 @@
+import time
+import tkinter as tk
+from utils.profiler import profiler
+
+HUD_INTERVAL = 500  # 刷新间隔, 毫秒
+
+
+class PerfHud:
+    """显示在地图画布左上角的性能信息: 帧耗时、画布项数量、图片缓存命中率和内存、每秒输入事件数
+
+    每次刷新时把这些数值写入性能计数器, 录制期间会出现在导出的 trace 中.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.visible = False
+        self.item = None
+        self.after_id = None
+        self.last_time = time.perf_counter()
+        self.last_events = 0
+        canvas.add_view_listener(self.on_view_change)
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+        return self.visible
+
+    def show(self):
+        self.visible = True
+        self.last_time = time.perf_counter()
+        self.last_events = profiler.get_counter("input_events")
+        self.update()
+
+    def hide(self):
+        self.visible = False
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+        if self.item is not None:
+            self.canvas.delete(self.item)
+            self.item = None
+
+    def on_view_change(self, kind, rect):
+        if not self.visible:
+            return
+        if kind == "map":
+            # refresh_map() 会删除所有画布项, 图层操作等其它 "map" 通知不会; 文字项还在时只需移到最上层
+            if self.item is not None and not self.canvas.type(self.item):
+                self.item = None
+                self.update_text(self.get_text())
+            else:
+                self.place()
+        elif kind == "view":
+            self.place()
+
+    def collect(self):
+        """汇总各模块的统计并写入性能计数器"""
+        canvas = self.canvas
+        now = time.perf_counter()
+        events = profiler.get_counter("input_events")
+        events_per_second = (events - self.last_events) / max(now - self.last_time, 1e-6)
+        self.last_time, self.last_events = now, events
+        images = canvas.tile_images.get_stats()
+        stats = {
+            "frame": canvas.get_frame_stats(),
+            "pointer": canvas.get_pointer_stats(),
+            "images": images,
+            "items": len(canvas.find_all()),
+            "events_per_second": events_per_second
+        }
+        profiler.set_value("frame_ms", round(stats["frame"]["last_ms"], 3))
+        profiler.set_value("canvas_items", stats["items"])
+        profiler.set_value("image_cache_hits", images["hits"])
+        profiler.set_value("image_cache_misses", images["misses"])
+        profiler.set_value("image_cache_bytes", images["bytes"])
+        profiler.set_value("events_per_second", round(events_per_second, 1))
+        profiler.sample_counters()
+        return stats
+
+    def get_text(self):
+        stats = self.collect()
+        frame, pointer, images = stats["frame"], stats["pointer"], stats["images"]
+        lookups = images["hits"] + images["misses"]
+        hit_rate = images["hits"] * 100 / lookups if lookups else 0
+        _, _, render_ms, render_max_ms = profiler.get_span("render_view")
+        return "\n".join([
+            "frame %.1f ms  avg %.1f  max %.1f  (%d)" % (frame["last_ms"], frame["avg_ms"], frame["max_ms"], frame["frames"]),
+            "render %.1f ms  max %.1f" % (render_ms, render_max_ms),
+            "items %d" % stats["items"],
+            "images %d%% hit  %d/%d  %.1f MB" % (hit_rate, images["hits"], lookups, images["bytes"] / (1024 * 1024)),
+            "input %.0f/s  latency %.1f ms" % (stats["events_per_second"], pointer["avg_ms"])
+        ])
+
+    def update_text(self, text):
+        canvas = self.canvas
+        if self.item is None:
+            self.item = canvas.create_text(0, 0, anchor=tk.NW, text=text, fill="#7CFC00", font=("Courier", 9), tags="hud")
+        else:
+            canvas.itemconfigure(self.item, text=text)
+        self.place()
+
+    def place(self):
+        """画布项随画布平移, 每次都移回窗口左上角"""
+        if self.item is not None:
+            self.canvas.coords(self.item, self.canvas.canvasx(8), self.canvas.canvasy(8))
+            self.canvas.tag_raise(self.item)
+
+    def update(self):
+        self.after_id = None
+        if not self.visible:
+            return
+        self.update_text(self.get_text())
+        self.after_id = self.canvas.after(HUD_INTERVAL, self.update)
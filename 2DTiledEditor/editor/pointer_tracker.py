@@ -0,0 +1,69 @@
+import time
+from collections import deque
+
+
+class PointerTracker:
+    """指针事件合并器: 把鼠标移动、拖动和滚轮事件合并为每帧最多处理一次
+
+    on_event() 只保存最新的事件, 并按目标帧率安排一次 after 回调; 回调时只处理最后一个事件,
+    中间的事件直接丢弃. callback(event) 返回 False 表示指针所在格子没有变化, 本帧没有实际工作.
+    延迟从合并进本帧的第一个事件到达开始计算, 到 callback 完成为止.
+    """
+
+    def __init__(self, widget, callback, fps=60):
+        self.widget = widget
+        self.callback = callback
+        self.frame_interval = 1.0 / fps
+        self.event = None
+        self.first_event_time = None
+        self.after_id = None
+        self.last_frame_end = 0.0
+        self.latencies = deque(maxlen=120)
+        self.event_count = 0
+        self.frame_count = 0
+        self.skipped_count = 0
+
+    def on_event(self, event):
+        self.event = event
+        self.event_count += 1
+        if self.after_id is not None:
+            return
+        self.first_event_time = time.perf_counter()
+        delay = self.frame_interval - (self.first_event_time - self.last_frame_end)
+        if delay > 0:
+            self.after_id = self.widget.after(int(delay * 1000) + 1, self.run_frame)
+        else:
+            self.after_id = self.widget.after_idle(self.run_frame)
+
+    def run_frame(self):
+        self.after_id = None
+        event, self.event = self.event, None
+        if event is None:
+            return
+        try:
+            changed = self.callback(event)
+        finally:
+            self.last_frame_end = time.perf_counter()
+            self.frame_count += 1
+        if changed is False:
+            self.skipped_count += 1
+        else:
+            self.latencies.append(self.last_frame_end - self.first_event_time)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.event = None
+
+    def get_stats(self):
+        """返回事件数、处理帧数、格子未变而跳过的帧数和输入到绘制完成的延迟(毫秒)"""
+        latencies = list(self.latencies)
+        return {
+            "events": self.event_count,
+            "frames": self.frame_count,
+            "skipped": self.skipped_count,
+            "last_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "avg_ms": sum(latencies) * 1000 / len(latencies) if latencies else 0.0,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0
+        }
@@ -0,0 +1,73 @@
+import time
+from collections import deque
+
+
+class RedrawScheduler:
+    """重绘调度器: 把缩放、平移、窗口大小变化等请求合并为每帧最多一次重绘
+
+    request() 只记录原因并按目标帧率安排一次 after 回调, 回调触发前到达的请求都并入同一帧,
+    被后续请求覆盖的中间状态(例如快速滚动滚轮时的每一级缩放)不会单独重绘.
+    """
+
+    def __init__(self, widget, callback, fps=60):
+        self.widget = widget
+        self.callback = callback
+        self.frame_interval = 1.0 / fps
+        self.pending = set()
+        self.after_id = None
+        self.last_frame_end = 0.0
+        self.frame_times = deque(maxlen=120)
+        self.frame_count = 0
+        self.request_count = 0
+        self.coalesced_count = 0
+
+    def request(self, reason):
+        """登记一次重绘请求, reason 为 "zoom"、"pan"、"resize" 等"""
+        self.pending.add(reason)
+        self.request_count += 1
+        if self.after_id is not None:
+            self.coalesced_count += 1
+            return
+        delay = self.frame_interval - (time.perf_counter() - self.last_frame_end)
+        if delay > 0:
+            self.after_id = self.widget.after(int(delay * 1000) + 1, self.run_frame)
+        else:
+            self.after_id = self.widget.after_idle(self.run_frame)
+
+    def run_frame(self):
+        self.after_id = None
+        reasons, self.pending = self.pending, set()
+        if not reasons:
+            return
+        start = time.perf_counter()
+        try:
+            self.callback(reasons)
+        finally:
+            self.last_frame_end = time.perf_counter()
+            self.frame_times.append(self.last_frame_end - start)
+            self.frame_count += 1
+
+    def flush(self):
+        """立即执行尚未完成的重绘"""
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.run_frame()
+
+    def cancel(self):
+        """丢弃尚未执行的重绘请求"""
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.pending = set()
+
+    def get_stats(self):
+        """返回帧计时统计, 时间单位为毫秒"""
+        frame_times = list(self.frame_times)
+        return {
+            "frames": self.frame_count,
+            "requests": self.request_count,
+            "coalesced": self.coalesced_count,
+            "last_ms": frame_times[-1] * 1000 if frame_times else 0.0,
+            "avg_ms": sum(frame_times) * 1000 / len(frame_times) if frame_times else 0.0,
+            "max_ms": max(frame_times) * 1000 if frame_times else 0.0
+        }
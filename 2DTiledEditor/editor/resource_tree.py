@@ -1,40 +1,115 @@
-
 import os
+import math
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
+from utils.thumbnail_cache import ThumbnailCache
+from utils.profiler import profiler
+from .asset_pipeline import AssetPipeline
+
+ICON_SIZE = 16
+
 
 class ResourceTree(ttk.Treeview):
-    def __init__(self, parent, on_select_callback=None, *args, **kwargs):
+    """资源图片列表
+
+    启动时只列出文件名并显示占位图标, 真正的图标只为滚动到可见范围内的行加载,
+    离开可见范围较远的行释放图标; 缩略图保存在磁盘缓存中, 再次启动时不需要重新缩放原图.
+    """
+
+    def __init__(self, parent, on_select_callback=None, asset_pipeline=None, thumbnail_cache=None, *args, **kwargs):
+        self.scroll_command = kwargs.pop("yscrollcommand", None)  # 调用者的滚动命令, 例如滚动条的 set
         super().__init__(parent, *args, **kwargs)
         self.parent = parent
         self.on_select_callback = on_select_callback
+        self.asset_pipeline = asset_pipeline or AssetPipeline(self)
+        self.thumbnail_cache = thumbnail_cache or ThumbnailCache()
         self.resources_dir = "Resources"
-        self.image_cache = {}
-        self.icon_cache = {}
+        self.icon_cache = {}  # 文件名 -> 当前可见行的 16px 图标
+        self.pending_icons = set()
+        self.rows = []  # [(行, 文件名)], 按显示顺序
+        self.row_index = {}  # 文件名 -> 在 rows 中的下标
+        self.placeholder_icon = ImageTk.PhotoImage(Image.new("RGBA", (ICON_SIZE, ICON_SIZE), (128, 128, 128, 255)))
         self.init_ui()
         self.scan_resources()
 
     def init_ui(self):
         self.heading('#0', text='Resources图片列表', anchor=tk.W)
         self.bind("<<TreeviewSelect>>", self.on_item_select)
+        self.bind("<Configure>", lambda event: self.load_visible_icons())
+        # 滚动时加载新出现的行的图标
+        super().configure(yscrollcommand=self.on_yscroll)
+
+    def configure(self, cnf=None, **kw):
+        """设置 yscrollcommand 时保存为调用者的滚动命令, 由 on_yscroll 转发"""
+        if isinstance(cnf, str):
+            # configure("选项名") 是查询
+            return super().configure(cnf)
+        kw = dict(cnf or {}, **kw)
+        if "yscrollcommand" in kw:
+            self.scroll_command = kw.pop("yscrollcommand")
+        return super().configure(**kw)
 
+    config = configure
+
+    def on_yscroll(self, first, last):
+        if self.scroll_command:
+            self.scroll_command(first, last)
+        self.load_visible_icons()
+
+    @profiler.timed("scan_resources", "resources")
     def scan_resources(self):
-        for filename in os.listdir(self.resources_dir):
-            if filename.lower().endswith(".png"):
+        """只列出图片文件, 不读取图片内容"""
+        with os.scandir(self.resources_dir) as entries:
+            # 打包生成的图集图片不作为资源列出
+            filenames = sorted(entry.name for entry in entries if entry.name.lower().endswith(".png") and not entry.name.startswith("atlas_"))
+        for filename in filenames:
+            item = self.insert("", "end", text="  " + filename, image=self.placeholder_icon)
+            self.row_index[filename] = len(self.rows)
+            self.rows.append((item, filename))
+
+    def get_visible_range(self):
+        """返回可见行的下标范围 [first, last)"""
+        if not self.rows:
+            return 0, 0
+        if not self.winfo_ismapped():
+            # 还没有显示时 yview() 返回 (0, 1), 等 <Configure> 事件后再加载
+            return 0, 0
+        first, last = self.yview()
+        count = len(self.rows)
+        return int(first * count), min(int(math.ceil(last * count)) + 1, count)
+
+    @profiler.timed("load_visible_icons", "resources")
+    def load_visible_icons(self):
+        first, last = self.get_visible_range()
+        # 可见范围上下各保留一屏, 超出的图标释放
+        margin = last - first
+        keep_first, keep_last = max(first - margin, 0), last + margin
+        for filename in list(self.icon_cache):
+            index = self.row_index[filename]
+            if index < keep_first or index >= keep_last:
+                del self.icon_cache[filename]
+                self.item(self.rows[index][0], image=self.placeholder_icon)
+        for item, filename in self.rows[first:last]:
+            if filename not in self.icon_cache and filename not in self.pending_icons:
+                self.pending_icons.add(filename)
                 file_path = os.path.join(self.resources_dir, filename)
-                image = Image.open(file_path)
-                image.thumbnail((100, 100))
-                photo = ImageTk.PhotoImage(image)
-                self.image_cache[filename] = photo
-
-                # Create icon
-                icon_image = image.copy()
-                icon_image.thumbnail((16, 16))
-                icon_photo = ImageTk.PhotoImage(icon_image)
-                self.icon_cache[filename] = icon_photo
-
-                self.insert("", "end", text="  " + filename, image=icon_photo)
+                self.asset_pipeline.submit(self.thumbnail_cache.get_thumbnails, file_path, (ICON_SIZE,), callback=self.icon_callback(filename, item))
+
+    def icon_callback(self, filename, item):
+        def on_thumbnails(thumbnails, error):
+            self.pending_icons.discard(filename)
+            if error is not None or not self.exists(item):
+                return
+            first, last = self.get_visible_range()
+            if not first <= self.row_index[filename] < last:
+                # 加载期间已经滚出可见范围
+                return
+            with profiler.span("create_icon", "resources"):
+                icon_photo = ImageTk.PhotoImage(thumbnails[ICON_SIZE])
+            self.icon_cache[filename] = icon_photo
+            self.item(item, image=icon_photo)
+        return on_thumbnails
 
     def on_item_select(self, event):
         selected_item = self.selection()
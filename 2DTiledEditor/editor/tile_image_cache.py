@@ -0,0 +1,108 @@
+import os
+import threading
+from PIL import Image, ImageTk
+from utils.lru_cache import LRUCache
+from utils.profiler import profiler
+
+ZOOM_STEP = 0.1
+MIN_ZOOM = 0.1
+MAX_ZOOM = 5.0
+
+
+def quantize_zoom(zoom_level):
+    """把缩放比例量化到 ZOOM_STEP 的整数倍, 避免浮点累加误差产生新的缓存级别"""
+    steps = round(zoom_level / ZOOM_STEP)
+    return min(max(steps * ZOOM_STEP, MIN_ZOOM), MAX_ZOOM)
+
+
+def image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class TileImageCache:
+    """格子图片的缩放金字塔缓存
+
+    原图常驻内存; 每张原图按需生成逐级减半的 mipmap, 目标尺寸从不小于它的最小一级缩放得到.
+    缩放后的 PIL 图像和 PhotoImage 都放在按内存预算淘汰的 LRU 缓存里, 回到访问过的缩放级别时不再重新采样.
+    load_source()、get_mipmap() 和 get_image() 可以在线程池中调用, 缓存读写由锁保护; get_photo() 只能在主线程调用.
+    """
+
+    def __init__(self, resources_dir="Resources", budget_bytes=64 * 1024 * 1024, atlas=None):
+        self.resources_dir = resources_dir
+        self.atlas = atlas
+        self.sources = {}
+        self.cache = LRUCache(budget_bytes)
+        self.lock = threading.Lock()
+
+    def load_source(self, image_name):
+        """返回原始图片(RGBA), 第一次使用时读取; 有图集时从图集中裁出, 不再逐个打开图片文件"""
+        image = self.sources.get(image_name)
+        if image is None:
+            if self.atlas is not None and image_name in self.atlas and not self.atlas.is_stale(image_name):
+                image = self.atlas.get_image(image_name)
+            else:
+                with Image.open(os.path.join(self.resources_dir, image_name)) as source:
+                    image = source.convert("RGBA")
+            self.sources[image_name] = image
+        return image
+
+    def get_mipmap(self, image_name, level):
+        """返回第 level 级 mipmap, 第 0 级为原图, 每级宽高减半"""
+        if level == 0:
+            return self.load_source(image_name)
+        key = ("mip", image_name, level)
+        with self.lock:
+            image = self.cache.get(key)
+        if image is None:
+            image = self.get_mipmap(image_name, level - 1).reduce(2)
+            self.put(key, image)
+        return image
+
+    def get_image(self, image_name, width, height):
+        """返回缩放到 width x height 的 PIL 图像"""
+        key = ("image", image_name, width, height)
+        with self.lock:
+            image = self.cache.get(key)
+        if image is None:
+            source = self.load_source(image_name)
+            level = 0
+            while source.width >> (level + 1) >= width and source.height >> (level + 1) >= height and min(source.width, source.height) >> (level + 1) > 0:
+                level += 1
+            mipmap = self.get_mipmap(image_name, level)
+            if mipmap.size == (width, height):
+                image = mipmap
+            else:
+                with profiler.span("resize_image", "image"):
+                    image = mipmap.resize((width, height))
+            self.put(key, image)
+        return image
+
+    def get_photo(self, image_name, width, height):
+        """返回缩放到 width x height 的 PhotoImage, 需要在 Tk 主线程调用"""
+        key = ("photo", image_name, width, height)
+        with self.lock:
+            photo = self.cache.get(key)
+        if photo is None:
+            image = self.get_image(image_name, width, height)
+            with profiler.span("create_photo", "image"):
+                photo = ImageTk.PhotoImage(image)
+            self.put(key, photo, image_nbytes(image))
+        return photo
+
+    def put(self, key, value, nbytes=None):
+        with self.lock:
+            self.cache.put(key, value, image_nbytes(value) if nbytes is None else nbytes)
+
+    def get_stats(self):
+        """返回缓存命中次数、未命中次数、占用字节数和条目数"""
+        with self.lock:
+            return {"hits": self.cache.hits, "misses": self.cache.misses, "bytes": self.cache.total_bytes, "entries": len(self.cache), "sources": len(self.sources)}
+
+    def set_budget(self, budget_bytes):
+        with self.lock:
+            self.cache.set_budget(budget_bytes)
+
+    def clear(self):
+        with self.lock:
+            self.sources.clear()
+            self.cache.clear()
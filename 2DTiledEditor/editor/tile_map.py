@@ -0,0 +1,477 @@
+import itertools
+import numpy as np
+
+# 调色板中 0 号固定表示空格子
+EMPTY_TILE = 0
+TILE_DTYPE = np.uint16
+MAX_TILE_ID = np.iinfo(TILE_DTYPE).max
+# 稀疏存储的分块边长, 以及自动改用稀疏存储的地图格子数
+STORAGE_CHUNK_SIZE = 64
+SPARSE_THRESHOLD = 4096 * 4096
+
+
+class TileLayer:
+    """单个图层: 用紧凑的整型数组保存每个格子的调色板编号"""
+
+    def __init__(self, tile_map, name, visible=True, data=None, loader=None):
+        self.tile_map = tile_map
+        self.name = name
+        self.visible = visible
+        if data is None and loader is None:
+            data = np.zeros((tile_map.rows, tile_map.cols), dtype=TILE_DTYPE)
+        self.layer_data = data
+        # 延迟加载: 第一次访问 data 时才调用 loader() 解码格子数据
+        self.loader = loader
+
+    @property
+    def data(self):
+        if self.layer_data is None:
+            self.layer_data = self.loader()
+            self.loader = None
+        return self.layer_data
+
+    @data.setter
+    def data(self, data):
+        self.layer_data = data
+        self.loader = None
+
+    @property
+    def is_loaded(self):
+        return self.layer_data is not None
+
+    def load(self):
+        """确保延迟加载的数据已经解码"""
+        self.data
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def painted_rects(self, x0, y0, x1, y1):
+        """矩形内可能有非空格子的区域列表, 稠密图层直接返回矩形本身"""
+        return [(x0, y0, x1, y1)]
+
+    @property
+    def rows(self):
+        return self.data.shape[0] if self.is_loaded else self.tile_map.rows
+
+    @property
+    def cols(self):
+        return self.data.shape[1] if self.is_loaded else self.tile_map.cols
+
+    def get_id(self, x, y):
+        return int(self.data[y, x])
+
+    def set_id(self, x, y, tile_id):
+        self.data[y, x] = tile_id
+
+    def get(self, x, y):
+        """返回格子上的图片名称, 空格子返回 None"""
+        return self.tile_map.tile_name(self.data[y, x])
+
+    def set(self, x, y, name):
+        self.data[y, x] = self.tile_map.tile_id(name)
+
+    def get_region(self, x0, y0, x1, y1):
+        """返回 [x0, x1) x [y0, y1) 区域编号数组的副本"""
+        return self.data[y0:y1, x0:x1].copy()
+
+    def set_region(self, x0, y0, ids):
+        """把编号数组写入以 (x0, y0) 为左上角的区域"""
+        ids = np.asarray(ids, dtype=TILE_DTYPE)
+        self.data[y0:y0 + ids.shape[0], x0:x0 + ids.shape[1]] = ids
+
+    def fill_region(self, x0, y0, x1, y1, name):
+        """用同一张图片填充 [x0, x1) x [y0, y1) 区域, name 为 None 时清空"""
+        self.fill_ids(x0, y0, x1, y1, self.tile_map.tile_id(name))
+
+    def fill_ids(self, x0, y0, x1, y1, tile_id):
+        self.data[y0:y1, x0:x1] = tile_id
+
+    def clear(self):
+        self.data.fill(EMPTY_TILE)
+
+    def occupied_cells(self, x0=0, y0=0, x1=None, y1=None):
+        """返回区域内非空格子的 (xs, ys, ids) 数组"""
+        x1 = self.cols if x1 is None else x1
+        y1 = self.rows if y1 is None else y1
+        region = self.data[y0:y1, x0:x1]
+        ys, xs = np.nonzero(region)
+        return xs + x0, ys + y0, region[ys, xs]
+
+    def used_ids(self):
+        return np.unique(self.data)
+
+    def sample(self, x0, y0, x1, y1, step):
+        """返回 [x0, x1) x [y0, y1) 内每隔 step 个格子取一个的编号数组, 用于缩略显示"""
+        return self.data[y0:y1:step, x0:x1:step]
+
+    def iter_chunks(self, chunk_size=STORAGE_CHUNK_SIZE):
+        """按 chunk_size 分块遍历, 跳过全空的分块, 产生 (cx, cy, 编号数组)"""
+        data = self.data
+        for y in range(0, self.rows, chunk_size):
+            for x in range(0, self.cols, chunk_size):
+                chunk = data[y:y + chunk_size, x:x + chunk_size]
+                if chunk.any():
+                    yield x // chunk_size, y // chunk_size, chunk
+
+    def to_grid_data(self):
+        """转换为保存文件中的 grid_data 格式(图片名称或 None 的二维列表)"""
+        names = np.array(self.tile_map.palette, dtype=object)
+        return names[self.data].tolist()
+
+    def load_grid_data(self, grid_data):
+        """从 grid_data 格式读取格子数据, 未知图片会追加到调色板"""
+        check_grid_data(grid_data, self.rows, self.cols, self.name)
+        tile_id = self.tile_map.tile_id
+        ids = np.fromiter((tile_id(name) for name in itertools.chain.from_iterable(grid_data)), dtype=TILE_DTYPE, count=self.rows * self.cols)
+        self.data = ids.reshape(self.rows, self.cols)
+
+
+class SparseTileLayer:
+    """稀疏分块图层: 只为画过内容的 STORAGE_CHUNK_SIZE x STORAGE_CHUNK_SIZE 分块分配数组
+
+    接口与 TileLayer 相同, 内存和保存大小只与画过的面积有关, 与地图的名义尺寸无关.
+    分块被清空后立即释放.
+    """
+
+    def __init__(self, tile_map, name, visible=True, chunks=None, loader=None, chunk_size=STORAGE_CHUNK_SIZE):
+        self.tile_map = tile_map
+        self.name = name
+        self.visible = visible
+        self.chunk_size = chunk_size
+        if chunks is None and loader is None:
+            chunks = {}
+        self.layer_chunks = chunks
+        # 延迟加载: 第一次访问 chunks 时才调用 loader() 解码, 返回 {(cx, cy): 编号数组}
+        self.loader = loader
+
+    @property
+    def chunks(self):
+        if self.layer_chunks is None:
+            self.layer_chunks = self.loader()
+            self.loader = None
+        return self.layer_chunks
+
+    @property
+    def is_loaded(self):
+        return self.layer_chunks is not None
+
+    def load(self):
+        self.chunks
+
+    @property
+    def rows(self):
+        return self.tile_map.rows
+
+    @property
+    def cols(self):
+        return self.tile_map.cols
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def new_chunk(self, key):
+        chunk = np.zeros((self.chunk_size, self.chunk_size), dtype=TILE_DTYPE)
+        self.chunks[key] = chunk
+        return chunk
+
+    def chunk_keys(self, x0, y0, x1, y1):
+        """与矩形相交的所有分块坐标"""
+        size = self.chunk_size
+        for cy in range(y0 // size, -(-y1 // size)):
+            for cx in range(x0 // size, -(-x1 // size)):
+                yield cx, cy
+
+    def chunks_in_rect(self, x0, y0, x1, y1):
+        """与矩形相交的已分配分块, 产生 (cx, cy, 分块数组); 矩形很大时改为遍历已分配的分块"""
+        size = self.chunk_size
+        chunks = self.chunks
+        if (-(-x1 // size) - x0 // size) * (-(-y1 // size) - y0 // size) > len(chunks):
+            for (cx, cy), chunk in list(chunks.items()):
+                if cx * size < x1 and x0 < (cx + 1) * size and cy * size < y1 and y0 < (cy + 1) * size:
+                    yield cx, cy, chunk
+        else:
+            for key in self.chunk_keys(x0, y0, x1, y1):
+                chunk = chunks.get(key)
+                if chunk is not None:
+                    yield key[0], key[1], chunk
+
+    def clip(self, x0, y0, x1, y1, cx, cy):
+        """返回矩形与分块的交集, 以及交集在分块内的切片"""
+        size = self.chunk_size
+        ox, oy = cx * size, cy * size
+        ix0, iy0 = max(x0, ox), max(y0, oy)
+        ix1, iy1 = min(x1, ox + size), min(y1, oy + size)
+        return (ix0, iy0, ix1, iy1), (slice(iy0 - oy, iy1 - oy), slice(ix0 - ox, ix1 - ox))
+
+    def get_id(self, x, y):
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        return EMPTY_TILE if chunk is None else int(chunk[y % size, x % size])
+
+    def set_id(self, x, y, tile_id):
+        self.fill_ids(x, y, x + 1, y + 1, tile_id)
+
+    def get(self, x, y):
+        """返回格子上的图片名称, 空格子返回 None"""
+        return self.tile_map.tile_name(self.get_id(x, y))
+
+    def set(self, x, y, name):
+        self.set_id(x, y, self.tile_map.tile_id(name))
+
+    def get_region(self, x0, y0, x1, y1):
+        """返回 [x0, x1) x [y0, y1) 区域的编号数组(新分配的数组)"""
+        x1, y1 = min(x1, self.cols), min(y1, self.rows)
+        region = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=TILE_DTYPE)
+        for cx, cy, chunk in self.chunks_in_rect(x0, y0, x1, y1):
+            (ix0, iy0, ix1, iy1), inner = self.clip(x0, y0, x1, y1, cx, cy)
+            region[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = chunk[inner]
+        return region
+
+    def set_region(self, x0, y0, ids):
+        """把编号数组写入以 (x0, y0) 为左上角的区域"""
+        ids = np.asarray(ids, dtype=TILE_DTYPE)
+        x1, y1 = x0 + ids.shape[1], y0 + ids.shape[0]
+        for key in self.chunk_keys(x0, y0, x1, y1):
+            (ix0, iy0, ix1, iy1), inner = self.clip(x0, y0, x1, y1, *key)
+            values = ids[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0]
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                if not values.any():
+                    continue
+                chunk = self.new_chunk(key)
+            chunk[inner] = values
+            if not values.all() and not chunk.any():
+                del self.chunks[key]
+
+    def fill_region(self, x0, y0, x1, y1, name):
+        """用同一张图片填充 [x0, x1) x [y0, y1) 区域, name 为 None 时清空"""
+        self.fill_ids(x0, y0, x1, y1, self.tile_map.tile_id(name))
+
+    def fill_ids(self, x0, y0, x1, y1, tile_id):
+        if tile_id == EMPTY_TILE:
+            # 清空时只需要处理已分配的分块
+            for cx, cy, chunk in list(self.chunks_in_rect(x0, y0, x1, y1)):
+                _, inner = self.clip(x0, y0, x1, y1, cx, cy)
+                chunk[inner] = EMPTY_TILE
+                if not chunk.any():
+                    del self.chunks[(cx, cy)]
+            return
+        for key in self.chunk_keys(x0, y0, x1, y1):
+            _, inner = self.clip(x0, y0, x1, y1, *key)
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = self.new_chunk(key)
+            chunk[inner] = tile_id
+
+    def clear(self):
+        self.layer_chunks = {}
+        self.loader = None
+
+    def painted_rects(self, x0, y0, x1, y1):
+        """矩形内可能有非空格子的区域列表: 矩形与每个已分配分块的交集"""
+        return [self.clip(x0, y0, x1, y1, cx, cy)[0] for cx, cy, _ in self.chunks_in_rect(x0, y0, x1, y1)]
+
+    def occupied_cells(self, x0=0, y0=0, x1=None, y1=None):
+        """返回区域内非空格子的 (xs, ys, ids) 数组"""
+        x1 = self.cols if x1 is None else x1
+        y1 = self.rows if y1 is None else y1
+        all_xs, all_ys, all_ids = [], [], []
+        for cx, cy, chunk in self.chunks_in_rect(x0, y0, x1, y1):
+            (ix0, iy0, _, _), inner = self.clip(x0, y0, x1, y1, cx, cy)
+            region = chunk[inner]
+            ys, xs = np.nonzero(region)
+            all_xs.append(xs + ix0)
+            all_ys.append(ys + iy0)
+            all_ids.append(region[ys, xs])
+        if not all_ids:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty, np.zeros(0, dtype=TILE_DTYPE)
+        return np.concatenate(all_xs), np.concatenate(all_ys), np.concatenate(all_ids)
+
+    def sample(self, x0, y0, x1, y1, step):
+        """返回 [x0, x1) x [y0, y1) 内每隔 step 个格子取一个的编号数组, 只访问已分配的分块"""
+        x1, y1 = min(x1, self.cols), min(y1, self.rows)
+        result = np.zeros((len(range(y0, y1, step)), len(range(x0, x1, step))), dtype=TILE_DTYPE)
+        size = self.chunk_size
+        for cx, cy, chunk in self.chunks_in_rect(x0, y0, x1, y1):
+            ox, oy = cx * size, cy * size
+            # 落在分块内的第一个和最后一个采样点
+            i0, i1 = max(-(-(ox - x0) // step), 0), min(-(-(ox + size - x0) // step), result.shape[1])
+            j0, j1 = max(-(-(oy - y0) // step), 0), min(-(-(oy + size - y0) // step), result.shape[0])
+            if i0 < i1 and j0 < j1:
+                local_x, local_y = x0 + i0 * step - ox, y0 + j0 * step - oy
+                result[j0:j1, i0:i1] = chunk[local_y::step, local_x::step][:j1 - j0, :i1 - i0]
+        return result
+
+    def used_ids(self):
+        ids = [np.unique(chunk) for chunk in self.chunks.values()]
+        return np.unique(np.concatenate(ids + [np.array([EMPTY_TILE], dtype=TILE_DTYPE)]))
+
+    def iter_chunks(self, chunk_size=STORAGE_CHUNK_SIZE):
+        """按行遍历已分配的分块, 产生 (cx, cy, 编号数组)"""
+        if chunk_size != self.chunk_size:
+            raise ValueError("分块大小必须为 %d" % self.chunk_size)
+        for (cx, cy), chunk in sorted(self.chunks.items(), key=lambda item: (item[0][1], item[0][0])):
+            yield cx, cy, chunk
+
+    def to_grid_data(self):
+        """转换为保存文件中的 grid_data 格式; JSON 格式本身是稠密的, 超大地图应保存为二进制格式"""
+        names = np.array(self.tile_map.palette, dtype=object)
+        return names[self.get_region(0, 0, self.cols, self.rows)].tolist()
+
+    def load_grid_data(self, grid_data):
+        """从 grid_data 格式读取格子数据, 未知图片会追加到调色板"""
+        check_grid_data(grid_data, self.rows, self.cols, self.name)
+        tile_id = self.tile_map.tile_id
+        self.clear()
+        for y, row in enumerate(grid_data):
+            ids = np.fromiter((tile_id(name) for name in row), dtype=TILE_DTYPE, count=self.cols)
+            if ids.any():
+                self.set_region(0, y, ids.reshape(1, -1))
+
+
+class TileMap:
+    """与界面无关的地图模型: 尺寸、调色板(图片名称 -> 编号)和图层列表
+
+    sparse 为 True 时图层使用稀疏分块存储; 为 None 时格子数超过 SPARSE_THRESHOLD 自动使用稀疏存储.
+    """
+
+    def __init__(self, rows=10, cols=10, grid_width=32, grid_height=32, sparse=None):
+        self.rows = rows
+        self.cols = cols
+        self.sparse = rows * cols > SPARSE_THRESHOLD if sparse is None else sparse
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.palette = [None]
+        self.palette_ids = {None: EMPTY_TILE}
+        self.layers = []
+        self.layer_lookup = {}
+        # 缩放、网格显示、背景音乐等其它地图设置, 保存时原样写回;
+        # tile_flags 为 {图片名称: [类型名称]}, 由资源列表的右键菜单设置, 供游戏判断墙、砖块、道具和出口
+        self.properties = {"zoom_level": 1.0, "show_grid": True, "background_music": None}
+
+    def tile_id(self, name):
+        """返回图片名称对应的编号, 第一次出现时分配新编号"""
+        tile_id = self.palette_ids.get(name)
+        if tile_id is None:
+            tile_id = len(self.palette)
+            if tile_id > MAX_TILE_ID:
+                raise ValueError("调色板图片数量超出上限 %d" % MAX_TILE_ID)
+            self.palette.append(name)
+            self.palette_ids[name] = tile_id
+        return tile_id
+
+    def tile_name(self, tile_id):
+        return self.palette[tile_id]
+
+    def add_layer(self, name, visible=True, loader=None):
+        if self.sparse:
+            layer = SparseTileLayer(self, name, visible, loader=loader)
+        else:
+            layer = TileLayer(self, name, visible, loader=loader)
+        self.layers.append(layer)
+        self.layer_lookup[name] = layer
+        return layer
+
+    def remove_layer(self, name):
+        layer = self.layer_lookup.pop(name, None)
+        if layer is not None:
+            self.layers.remove(layer)
+        return layer
+
+    def rename_layer(self, layer, name):
+        if self.layer_lookup.get(layer.name) is layer:
+            del self.layer_lookup[layer.name]
+        layer.name = name
+        self.layer_lookup[name] = layer
+
+    def get_layer(self, name):
+        return self.layer_lookup.get(name)
+
+    def move_layer(self, index, new_index):
+        """调整图层顺序, 下标越大越靠上绘制"""
+        layer = self.layers.pop(index)
+        self.layers.insert(new_index, layer)
+
+    def used_tile_names(self):
+        """返回所有图层中实际使用到的图片名称"""
+        used = set()
+        for layer in self.layers:
+            used.update(int(tile_id) for tile_id in layer.used_ids())
+        used.discard(EMPTY_TILE)
+        return [self.palette[tile_id] for tile_id in sorted(used)]
+
+    def to_dict(self):
+        """转换为 JSON 地图文件格式的字典"""
+        map_data = {
+            "grid_width": self.grid_width,
+            "grid_height": self.grid_height,
+            "zoom_level": self.properties.get("zoom_level", 1.0),
+            "show_grid": self.properties.get("show_grid", True),
+            "rows": self.rows,
+            "cols": self.cols,
+            "background_music": self.properties.get("background_music"),
+            "layers": [{"name": layer.name, "visible": layer.visible, "grid_data": layer.to_grid_data()} for layer in self.layers],
+            "image_cache": {name: name for name in self.palette[1:]}
+        }
+        if self.properties.get("tile_flags"):
+            map_data["tile_flags"] = self.properties["tile_flags"]
+        return map_data
+
+    @classmethod
+    def from_dict(cls, map_data):
+        """从 JSON 地图数据创建地图模型"""
+        tile_map = cls(map_data.get("rows", 10), map_data.get("cols", 10), map_data["grid_width"], map_data["grid_height"])
+        tile_map.properties["zoom_level"] = map_data.get("zoom_level", 1.0)
+        tile_map.properties["show_grid"] = map_data.get("show_grid", True)
+        tile_map.properties["background_music"] = map_data.get("background_music")
+        if map_data.get("tile_flags"):
+            tile_map.properties["tile_flags"] = map_data["tile_flags"]
+        for image_name in map_data.get("image_cache", {}):
+            tile_map.tile_id(image_name)
+        for layer_data in map_data["layers"]:
+            layer = tile_map.add_layer(layer_data["name"], layer_data["visible"])
+            layer.load_grid_data(layer_data["grid_data"])
+        return tile_map
+
+
+def check_grid_data(grid_data, rows, cols, layer_name):
+    """检查 grid_data 的行数和每一行的列数, 不一致时后面的格子会错位, 抛出 ValueError"""
+    if len(grid_data) != rows:
+        raise ValueError("图层 %s 有 %d 行, 地图为 %d 行" % (layer_name, len(grid_data), rows))
+    for y, row in enumerate(grid_data):
+        if len(row) != cols:
+            raise ValueError("图层 %s 第 %d 行有 %d 列, 地图为 %d 列" % (layer_name, y, len(row), cols))
+
+
+def intersect_rect(a, b):
+    """返回两个矩形 (x0, y0, x1, y1) 的交集, 不相交时返回 None"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def subtract_rect(a, b):
+    """返回矩形 a 去掉矩形 b 之后剩下的部分, 最多拆成 4 个互不重叠的矩形"""
+    if a is None:
+        return []
+    inner = intersect_rect(a, b) if b is not None else None
+    if inner is None:
+        return [a]
+    ax0, ay0, ax1, ay1 = a
+    ix0, iy0, ix1, iy1 = inner
+    rects = []
+    if ay0 < iy0:
+        rects.append((ax0, ay0, ax1, iy0))
+    if iy1 < ay1:
+        rects.append((ax0, iy1, ax1, ay1))
+    if ax0 < ix0:
+        rects.append((ax0, iy0, ix0, iy1))
+    if ix1 < ax1:
+        rects.append((ix1, iy0, ax1, iy1))
+    return rects
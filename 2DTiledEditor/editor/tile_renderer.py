@@ -0,0 +1,206 @@
+import tkinter as tk
+
+# 始终显示在图层图片之上的画布项标签
+OVERLAY_TAGS = ("grid", "selection_rect", "highlight", "hud")
+
+
+class LayerRenderer:
+    """渲染器基类: 负责视口范围计算, 以及用图层标签和隐藏标记项维护图层的上下顺序"""
+
+    def __init__(self, canvas, margin=2):
+        self.canvas = canvas
+        self.margin = margin
+        self.layer_tags = {}
+        self.layer_markers = {}
+        self.tag_counter = 0
+        self.view_bounds = None
+
+    def get_view_bounds(self):
+        """返回当前视口(含边距)覆盖的格子范围 (x0, y0, x1, y1), 右下边界不包含"""
+        canvas = self.canvas
+        if canvas.grid_width <= 0 or canvas.grid_height <= 0:
+            return 0, 0, 0, 0
+        left = canvas.canvasx(0)
+        top = canvas.canvasy(0)
+        right = canvas.canvasx(canvas.winfo_width())
+        bottom = canvas.canvasy(canvas.winfo_height())
+        x0 = max(int(left // canvas.grid_width) - self.margin, 0)
+        y0 = max(int(top // canvas.grid_height) - self.margin, 0)
+        x1 = min(int(right // canvas.grid_width) + 1 + self.margin, canvas.cols)
+        y1 = min(int(bottom // canvas.grid_height) + 1 + self.margin, canvas.rows)
+        return x0, y0, max(x1, x0), max(y1, y0)
+
+    def get_layer_tag(self, layer):
+        """返回图层的画布标签, 并保证图层的层级标记存在"""
+        tag = self.layer_tags.get(layer)
+        if tag is None:
+            self.tag_counter += 1
+            tag = "layer_%d" % self.tag_counter
+            self.layer_tags[layer] = tag
+            # 隐藏的标记项放在图层所有图片之上, 新图片插到标记下面即可保持图层顺序
+            self.layer_markers[layer] = self.canvas.create_line(0, 0, 0, 0, state=tk.HIDDEN, tags=("layer_marker", tag + "_marker"))
+            for overlay in OVERLAY_TAGS:
+                self.canvas.tag_raise(overlay)
+        return tag
+
+    def set_layer_visible(self, layer):
+        """按 layer.visible 显示或隐藏图层的全部画布项, 只需一次 Tk 调用"""
+        tag = self.layer_tags.get(layer)
+        if tag is not None:
+            self.canvas.itemconfigure(tag, state=tk.NORMAL if layer.visible else tk.HIDDEN)
+
+    def move_layer(self, layer):
+        """图层在 canvas.layers 中的位置改变后, 把它的画布项整体移到下方图层的标记之上"""
+        layers = self.canvas.layers
+        tag = self.get_layer_tag(layer)
+        marker = self.layer_markers[layer]
+        index = layers.index(layer)
+        if index == 0:
+            self.canvas.tag_lower(marker)
+            self.canvas.tag_lower(tag)
+        else:
+            self.get_layer_tag(layers[index - 1])
+            self.canvas.tag_raise(marker, self.layer_markers[layers[index - 1]])
+            self.canvas.tag_lower(tag, marker)
+
+    def restack_layers(self):
+        """按 canvas.layers 的顺序重新排列所有图层, 每个图层两次 Tk 调用"""
+        for layer in self.canvas.layers:
+            tag = self.get_layer_tag(layer)
+            self.canvas.tag_raise(tag)
+            self.canvas.tag_raise(self.layer_markers[layer])
+        for overlay in OVERLAY_TAGS:
+            self.canvas.tag_raise(overlay)
+
+    def stack_item(self, layer, item_id):
+        """把画布项放到所属图层标记的正下方"""
+        self.canvas.tag_lower(item_id, self.layer_markers[layer])
+
+    def remove_layer_marker(self, layer):
+        marker = self.layer_markers.pop(layer, None)
+        if marker:
+            self.canvas.delete(marker)
+        self.layer_tags.pop(layer, None)
+
+    def clear(self):
+        """画布执行 delete("all") 后调用, 忘记所有已创建的画布项"""
+        self.layer_tags = {}
+        self.layer_markers = {}
+        self.view_bounds = None
+
+
+class TileRenderer(LayerRenderer):
+    """视口裁剪渲染: 只为可见区域(加边距)内的格子创建画布图片, 移出视口的图片回收复用"""
+
+    def __init__(self, canvas, margin=2):
+        super().__init__(canvas, margin)
+        self.items = {}  # 图层 -> {(x, y): 画布图片编号}
+        self.free_items = []
+        self.photos = {}  # 调色板编号 -> 当前格子大小的 PhotoImage, 保证显示中的图片不被缓存淘汰释放
+
+    def render(self, force=False):
+        """按当前视口同步画布图片, 视口没有变化时直接返回"""
+        bounds = self.get_view_bounds()
+        if bounds == self.view_bounds and not force:
+            return
+        self.view_bounds = bounds
+        x0, y0, x1, y1 = bounds
+        for layer in list(self.items):
+            if layer not in self.canvas.layers:
+                self.remove_layer(layer)
+                continue
+            items = self.items[layer]
+            for cell in [cell for cell in items if not (x0 <= cell[0] < x1 and y0 <= cell[1] < y1)]:
+                self.release_item(items.pop(cell))
+        for layer in self.canvas.layers:
+            self.get_layer_tag(layer)
+        for layer in self.canvas.layers:
+            items = self.items.setdefault(layer, {})
+            xs, ys, ids = layer.occupied_cells(x0, y0, x1, y1)
+            for grid_x, grid_y, tile_id in zip(xs.tolist(), ys.tolist(), ids.tolist()):
+                if (grid_x, grid_y) not in items:
+                    items[(grid_x, grid_y)] = self.acquire_item(layer, grid_x, grid_y, tile_id)
+        self.trim_free_items()
+
+    def update_cells(self, layer, x0, y0, x1, y1):
+        """格子数据修改后, 只刷新 [x0, x1) x [y0, y1) 与视口相交部分的画布图片"""
+        if self.view_bounds is None:
+            return
+        vx0, vy0, vx1, vy1 = self.view_bounds
+        x0, y0, x1, y1 = max(x0, vx0), max(y0, vy0), min(x1, vx1), min(y1, vy1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        items = self.items.setdefault(layer, {})
+        region = layer.get_region(x0, y0, x1, y1)
+        for grid_y in range(y0, y1):
+            row = region[grid_y - y0].tolist()
+            for grid_x in range(x0, x1):
+                tile_id = row[grid_x - x0]
+                image_id = items.get((grid_x, grid_y))
+                if tile_id:
+                    if image_id:
+                        self.canvas.itemconfig(image_id, image=self.get_photo(tile_id))
+                    else:
+                        items[(grid_x, grid_y)] = self.acquire_item(layer, grid_x, grid_y, tile_id)
+                elif image_id:
+                    self.release_item(items.pop((grid_x, grid_y)))
+
+    def relayout(self):
+        """格子大小改变后(缩放), 更新已有图片的位置和 PhotoImage"""
+        canvas = self.canvas
+        self.photos = {}
+        for layer, items in self.items.items():
+            for (grid_x, grid_y), image_id in items.items():
+                canvas.itemconfig(image_id, image=self.get_photo(layer.get_id(grid_x, grid_y)))
+                canvas.coords(image_id, grid_x * canvas.grid_width, grid_y * canvas.grid_height)
+        self.render(force=True)
+
+    def get_photo(self, tile_id):
+        photo = self.photos.get(tile_id)
+        if photo is None:
+            photo = self.canvas.get_tile_photo(self.canvas.tile_map.tile_name(tile_id))
+            self.photos[tile_id] = photo
+        return photo
+
+    def acquire_item(self, layer, grid_x, grid_y, tile_id):
+        """取一个回收的画布图片(没有则新建)放到格子上"""
+        canvas = self.canvas
+        tag = self.get_layer_tag(layer)
+        state = tk.NORMAL if layer.visible else tk.HIDDEN
+        x, y = grid_x * canvas.grid_width, grid_y * canvas.grid_height
+        photo = self.get_photo(tile_id)
+        if self.free_items:
+            image_id = self.free_items.pop()
+            canvas.coords(image_id, x, y)
+            canvas.itemconfig(image_id, image=photo, state=state, tags=(tag, "tile"))
+        else:
+            image_id = canvas.create_image(x, y, image=photo, anchor=tk.NW, state=state, tags=(tag, "tile"))
+        self.stack_item(layer, image_id)
+        return image_id
+
+    def release_item(self, image_id):
+        self.canvas.itemconfig(image_id, state=tk.HIDDEN, tags=("tile",))
+        self.free_items.append(image_id)
+
+    def trim_free_items(self):
+        """回收池最多保留与当前可见图片数量相当的图片, 多余的删除"""
+        live = sum(len(items) for items in self.items.values())
+        excess = len(self.free_items) - max(live, 64)
+        if excess > 0:
+            for image_id in self.free_items[-excess:]:
+                self.canvas.delete(image_id)
+            del self.free_items[-excess:]
+
+    def remove_layer(self, layer):
+        for image_id in self.items.pop(layer, {}).values():
+            self.release_item(image_id)
+        self.remove_layer_marker(layer)
+
+    def clear(self):
+        super().clear()
+        self.items = {}
+        self.free_items = []
+        self.photos = {}
+
+    def item_count(self):
+        return sum(len(items) for items in self.items.values())
@@ -4,9 +4,18 @@ from tkinter import Menu, messagebox, simpledialog, filedialog
 from editor.map_canvas import MapCanvas
 from editor.layer_panel import LayerPanel
 from editor.resource_tree import ResourceTree
+from editor.minimap import MiniMap
+from editor.perf_hud import PerfHud
+from editor.asset_pipeline import AssetPipeline
+from editor.map_file import MapFileError, BINARY_EXTENSION, can_save_json
 from utils.config import ConfigManager
+from utils.profiler import profiler
 import os.path
 import json
+import time
+
+# 资源图片在游戏中的类型, 保存在地图属性 tile_flags 中
+TILE_KINDS = ("solid", "brick", "item", "door")
 
 class MainWindow(ttk.Window):
     def __init__(self):
@@ -17,12 +26,18 @@ class MainWindow(ttk.Window):
         self.config_manager = ConfigManager()
         self.current_map_file = None
         self.language = self.config_manager.get_language()
+        self.show_hud = ttk.BooleanVar(value=False)
+        self.recording_trace = ttk.BooleanVar(value=False)
         self.load_language()
         self.init_menu()
         self.init_layout()
         self.load_last_map()
         self.bind("<Control-s>", self.save_map_shortcut)
         self.bind("<Control-g>", self.toggle_grid_shortcut)
+        self.bind("<Control-z>", self.undo_shortcut)
+        self.bind("<Control-y>", self.redo_shortcut)
+        self.bind("<Escape>", self.cancel_load_shortcut)
+        self.bind("<F3>", self.toggle_hud_shortcut)
 
     def load_language(self):
         lang_file = f"resources/{self.language}.json"
@@ -49,6 +64,13 @@ class MainWindow(ttk.Window):
         edit_menu.add_command(label=self.lang_data["menu"]["edit"]["toggle_grid"], command=self.toggle_grid)
         menubar.add_cascade(label=self.lang_data["menu"]["edit"]["label"], menu=edit_menu)
 
+        # 性能菜单
+        profile_menu = Menu(menubar, tearoff=0)
+        profile_menu.add_checkbutton(label=self.lang_data["menu"]["profile"]["show_hud"], variable=self.show_hud, command=self.toggle_hud, accelerator="F3")
+        profile_menu.add_checkbutton(label=self.lang_data["menu"]["profile"]["record"], variable=self.recording_trace, command=self.toggle_recording)
+        profile_menu.add_command(label=self.lang_data["menu"]["profile"]["export_trace"], command=self.export_trace)
+        menubar.add_cascade(label=self.lang_data["menu"]["profile"]["label"], menu=profile_menu)
+
         # 语言菜单
         language_menu = Menu(menubar, tearoff=0)
         language_menu.add_command(label="English", command=lambda: self.change_language("en"))
@@ -87,13 +109,19 @@ class MainWindow(ttk.Window):
         left_panel = ttk.Frame(main_frame, style="darkly.TFrame")
         left_panel.pack(side=ttk.LEFT, fill=ttk.BOTH, expand=True)
 
-        self.map_canvas = MapCanvas(left_panel)
+        # 地图加载和资源列表共用一个图片解码线程池
+        self.asset_pipeline = AssetPipeline(self)
+        self.map_canvas = MapCanvas(left_panel, tile_cache_budget=self.config_manager.get_tile_cache_budget(), history_budget=self.config_manager.get_history_budget(), asset_pipeline=self.asset_pipeline)
         self.map_canvas.pack(fill=ttk.BOTH, expand=True)
+        self.perf_hud = PerfHud(self.map_canvas)
 
         # 右侧面板 - 编辑面板
         right_panel = ttk.Frame(main_frame, width=300, style="darkly.TFrame")
         right_panel.pack(side=ttk.RIGHT, fill=ttk.Y)
 
+        # 小地图, 点击或拖动跳转到对应位置
+        self.minimap = MiniMap(right_panel, self.map_canvas)
+
         # 地图信息显示
         self.map_info_label = ttk.Label(right_panel, text=f"{self.lang_data['ui']['tiles']}:{self.map_canvas.rows} x {self.map_canvas.cols}  {self.lang_data['ui']['tilesize']}:{self.map_canvas.original_grid_width}x{self.map_canvas.original_grid_height}")
         self.map_info_label.pack(side=ttk.TOP, fill=ttk.X, padx=5, pady=5)
@@ -101,41 +129,62 @@ class MainWindow(ttk.Window):
         self.layer_panel = LayerPanel(right_panel, self.map_canvas)
         self.layer_panel.pack(side=ttk.TOP,fill=ttk.X, expand=False)
 
-        self.resource_tree = ResourceTree(right_panel, on_select_callback=self.on_image_select)
+        with profiler.span("init_resource_tree", "resources"):
+            self.resource_tree = ResourceTree(right_panel, on_select_callback=self.on_image_select, asset_pipeline=self.asset_pipeline)
         self.resource_tree.pack(fill=ttk.BOTH, expand=True)
+        self.resource_tree.bind("<Button-3>", self.show_tile_kind_menu)
 
         # 底部信息栏
         self.info_canvas = ttk.Canvas(self, height=20)
         self.info_canvas.pack(side=ttk.BOTTOM, fill=ttk.X)
         self.info_text = self.info_canvas.create_text(10, 5, anchor=ttk.NW, text=f"{self.lang_data['ui']['mouse_position']} (0, 0) {self.lang_data['ui']['offset']} (0, 0)", fill="white")
 
-        # 绑定鼠标移动事件
-        self.map_canvas.bind("<Motion>", self.update_mouse_position)
-        self.map_canvas.bind("<B2-Motion>", self.update_mouse_position,add=True)
-        self.map_canvas.bind("<MouseWheel>", self.update_mouse_position,add=True)
+        # 鼠标移动、拖动和滚轮事件由画布合并为每帧一次, 指针所在格子变化后才更新状态栏
+        self.map_canvas.add_pointer_listener(self.update_mouse_position)
 
-    def update_mouse_position(self, event):
+    def update_mouse_position(self, grid_x, grid_y):
         offset_x,offset_y = self.map_canvas.get_drag_offset()
-        x = event.x - offset_x
-        y = event.y - offset_y
-        grid_x = x // self.map_canvas.grid_width
-        grid_y = y // self.map_canvas.grid_height
         grid_x = max(0, min(grid_x, self.map_canvas.cols - 1))
         grid_y = max(0, min(grid_y, self.map_canvas.rows - 1))
         zoom = int(self.map_canvas.zoom_level * 100)
         self.info_canvas.itemconfig(self.info_text, text=f"{self.lang_data['ui']['mouse_position']} ({grid_x}, {grid_y}) {self.lang_data['ui']['offset']} ({offset_x}, {offset_y})  {self.lang_data['ui']['zoom']} ({zoom}%)")
-        self.map_canvas.on_mouse_move(event)
 
     def load_last_map(self):
         last_map_file = self.config_manager.get_last_map_file()
         if last_map_file:
             if os.path.exists(last_map_file) == True:
-                self.map_canvas.load_map(last_map_file)
-                self.current_map_file = last_map_file
+                self.start_map_load(last_map_file)
+
+    def start_map_load(self, file_path):
+        """在后台加载地图, 底部信息栏显示进度, 按 Esc 取消"""
+        start = time.perf_counter()
+
+        def on_progress(stage, done, total):
+            percent = int(done * 100 / total) if total else 100
+            self.info_canvas.itemconfig(self.info_text, text=f"{self.lang_data['ui']['loading'][stage]} {percent}%  ({self.lang_data['ui']['cancel_load']})")
+
+        def on_done(error):
+            # 从开始加载到全部图层显示完成的总时间
+            profiler.add_span("open_map", "io", start, time.perf_counter())
+            if error is not None:
+                self.info_canvas.itemconfig(self.info_text, text="")
+                messagebox.showerror(self.lang_data["ui"]["load_failed"], str(error))
+                return
+            with profiler.span("map_loaded_ui", "ui"):
+                self.current_map_file = file_path
                 self.update_window_title()
-                self.update_layer_list()
-                self.map_canvas.center_map()
+                self.config_manager.set_last_map_file(file_path)
+                self.layer_panel.sync_from_canvas()
                 self.update_map_info()
+                self.info_canvas.itemconfig(self.info_text, text="")
+
+        self.map_canvas.load_map_async(file_path, on_progress, on_done)
+
+    def cancel_load_shortcut(self, event=None):
+        if self.map_canvas.is_loading():
+            self.map_canvas.cancel_load()
+            self.layer_panel.sync_from_canvas()
+            self.info_canvas.itemconfig(self.info_text, text="")
 
     def new_map(self):
         dialog = ttk.Toplevel(self)
@@ -208,29 +257,44 @@ class MainWindow(ttk.Window):
         ttk.Button(dialog, text=self.lang_data["ui"]["new_map_dialog"]["cancel"], command=on_cancel).place(x=200, y=135 , width = 80)
 
     def open_map(self):
-        file_path = filedialog.askopenfilename(filetypes=[(f"{self.lang_data["ui"]["mapfile"]}", "*.json")])
+        file_path = filedialog.askopenfilename(filetypes=[(f"{self.lang_data["ui"]["mapfile"]}", "*.json *.tmap")])
         if file_path:
-            self.map_canvas.load_map(file_path)
-            self.current_map_file = file_path
-            self.update_window_title()
-            self.config_manager.set_last_map_file(file_path)
-            self.update_layer_list()
-            self.map_canvas.center_map()
-            self.update_map_info()
+            self.start_map_load(file_path)
 
     def save_map(self):
+        if self.map_canvas.is_loading():
+            # 加载完成之前地图不完整, 不能保存
+            return
         if self.current_map_file:
-            self.map_canvas.save_map(self.current_map_file)
-            messagebox.showinfo(self.lang_data["ui"]["save_success"], self.lang_data["ui"]["save_message"])
+            if self.write_map(self.current_map_file):
+                messagebox.showinfo(self.lang_data["ui"]["save_success"], self.lang_data["ui"]["save_message"])
         else:
-            file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[(f"{self.lang_data["ui"]["mapfile"]}", "*.json")])
-            if file_path:
-                self.map_canvas.save_map(file_path)
+            filetypes = [(f"{self.lang_data["ui"]["mapfile"]}", "*.json"), (f"{self.lang_data["ui"]["binarymapfile"]}", "*.tmap")]
+            defaultextension = ".json"
+            if not can_save_json(self.map_canvas.tile_map):
+                # 超大地图默认保存为二进制格式
+                filetypes.reverse()
+                defaultextension = BINARY_EXTENSION
+            file_path = filedialog.asksaveasfilename(defaultextension=defaultextension, filetypes=filetypes)
+            if file_path and self.write_map(file_path):
                 self.current_map_file = file_path
                 self.update_window_title()
                 messagebox.showinfo(self.lang_data["ui"]["save_success"], self.lang_data["ui"]["save_message"])
                 self.config_manager.set_last_map_file(file_path)
 
+    @profiler.timed("write_map", "io")
+    def write_map(self, file_path):
+        """保存地图, 超大地图保存为 JSON 时提示改用二进制格式, 返回是否保存成功"""
+        if not file_path.lower().endswith(BINARY_EXTENSION) and not can_save_json(self.map_canvas.tile_map):
+            messagebox.showerror(self.lang_data["ui"]["save_failed"], self.lang_data["ui"]["json_too_large"])
+            return False
+        try:
+            self.map_canvas.save_map(file_path)
+        except (OSError, MapFileError) as e:
+            messagebox.showerror(self.lang_data["ui"]["save_failed"], str(e))
+            return False
+        return True
+
     def save_map_shortcut(self, event=None):
         self.save_map()
 
@@ -240,11 +304,41 @@ class MainWindow(ttk.Window):
     def toggle_grid_shortcut(self, event=None):
         self.toggle_grid()
 
+    @profiler.timed("undo", "edit")
     def undo(self):
-        pass
+        if self.map_canvas.undo():
+            self.layer_panel.sync_from_canvas()
 
+    @profiler.timed("redo", "edit")
     def redo(self):
-        pass
+        if self.map_canvas.redo():
+            self.layer_panel.sync_from_canvas()
+
+    def undo_shortcut(self, event=None):
+        self.undo()
+
+    def redo_shortcut(self, event=None):
+        self.redo()
+
+    def toggle_hud(self):
+        if self.perf_hud.visible != self.show_hud.get():
+            self.perf_hud.toggle()
+
+    def toggle_hud_shortcut(self, event=None):
+        self.show_hud.set(self.perf_hud.toggle())
+
+    def toggle_recording(self):
+        if self.recording_trace.get():
+            profiler.start_recording()
+        else:
+            profiler.stop_recording()
+
+    def export_trace(self):
+        """把录制的性能事件导出为 Chrome trace 文件, 可在 chrome://tracing 或 Perfetto 中打开"""
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[(f"{self.lang_data["ui"]["tracefile"]}", "*.json")])
+        if file_path:
+            count = profiler.export_chrome_trace(file_path)
+            messagebox.showinfo(self.lang_data["ui"]["trace_saved"], self.lang_data["ui"]["trace_message"].format(count=count))
 
     def show_about(self):
         messagebox.showinfo(self.lang_data["ui"]["about"]["title"], self.lang_data["ui"]["about"]["content"])
@@ -252,14 +346,29 @@ class MainWindow(ttk.Window):
     def on_image_select(self, filename):
         self.map_canvas.selected_image = filename
 
-    def update_layer_list(self):
-        self.layer_panel.layer_list.delete(*self.layer_panel.layer_list.get_children())
-        self.layer_panel.layer_counter = 1
-        for layer in self.map_canvas.layers:
-            layer_name = f"图层_{self.layer_panel.layer_counter}"
-            self.layer_panel.layer_counter += 1
-            self.layer_panel.layers.append({"name": layer_name, "visible": True})
-            self.layer_panel.layer_list.insert("", "end", values=("✓", layer_name))
+    def show_tile_kind_menu(self, event):
+        """右键资源图片: 勾选图片在游戏中的类型"""
+        item = self.resource_tree.identify_row(event.y)
+        if not item:
+            return
+        filename = self.resource_tree.item(item, "text").strip()
+        kinds = self.map_canvas.tile_map.properties.get("tile_flags", {}).get(filename, [])
+        menu = Menu(self, tearoff=0)
+        self.tile_kind_vars = []  # 菜单显示期间保持变量的引用
+        for kind in TILE_KINDS:
+            variable = ttk.BooleanVar(value=kind in kinds)
+            self.tile_kind_vars.append(variable)
+            menu.add_checkbutton(label=self.lang_data["ui"]["tile_kinds"][kind], variable=variable,
+                                 command=lambda kind=kind, variable=variable: self.set_tile_kind(filename, kind, variable.get()))
+        menu.tk_popup(event.x_root, event.y_root)
+
+    def set_tile_kind(self, filename, kind, enabled):
+        tile_flags = self.map_canvas.tile_map.properties.setdefault("tile_flags", {})
+        kinds = [other for other in tile_flags.get(filename, []) if other != kind] + ([kind] if enabled else [])
+        if kinds:
+            tile_flags[filename] = kinds
+        else:
+            tile_flags.pop(filename, None)
 
     def update_map_info(self):
         info_text = f"{self.lang_data['ui']['tiles']}:{self.map_canvas.rows} x {self.map_canvas.cols}  {self.lang_data['ui']['tilesize']}:{self.map_canvas.original_grid_width}x{self.map_canvas.original_grid_height}"
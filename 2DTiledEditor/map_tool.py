@@ -0,0 +1,297 @@
+"""地图文件命令行工具, 不依赖 Tk, 可以在没有显示的环境中批量处理
+
+    python map_tool.py validate maps/ [--resources Resources]
+    python map_tool.py convert maps/ --to tmap [--out-dir out/]
+    python map_tool.py reindex maps/
+    python map_tool.py stats maps/ [--report stats.json]
+
+参数可以是地图文件或目录(递归查找 .json 和 .tmap), 多个文件由进程池并行处理, 每完成一个输出一行进度.
+validate 发现错误时以状态 1 退出.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+import numpy as np
+from editor.map_file import MapFileReader, MapFileError, FORMAT_VERSION, BINARY_EXTENSION, is_binary_map, load_map_file, save_map_file, convert_map
+from editor.tile_map import TileMap, TILE_DTYPE, STORAGE_CHUNK_SIZE
+
+MAP_EXTENSIONS = (".json", BINARY_EXTENSION)
+
+
+def find_maps(paths):
+    """展开目录, 返回排序后的地图文件列表, 重复的路径只保留一次"""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.update(os.path.normpath(os.path.join(root, name)) for name in names if os.path.splitext(name)[1].lower() in MAP_EXTENSIONS)
+        else:
+            files.add(os.path.normpath(path))
+    return sorted(files)
+
+
+def read_json_map(file_path):
+    """读取 JSON 文件, 不是地图文件(例如语言文件)时返回 None"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        map_data = json.load(f)
+    if not isinstance(map_data, dict) or "layers" not in map_data or "grid_width" not in map_data:
+        return None
+    return map_data
+
+
+def check_images(names, resources_dir, errors):
+    for name in sorted(names):
+        if not os.path.exists(os.path.join(resources_dir, name)):
+            errors.append("缺少图片 %s" % name)
+
+
+def check_json_structure(map_data, used):
+    """检查尺寸和各图层 grid_data 的行列数, 返回错误列表; 使用到的图片名称加入 used"""
+    errors = []
+    rows, cols = map_data.get("rows", 10), map_data.get("cols", 10)
+    if not (isinstance(rows, int) and isinstance(cols, int) and rows > 0 and cols > 0):
+        return ["地图尺寸无效 %r x %r" % (rows, cols)]
+    for index, layer in enumerate(map_data["layers"]):
+        name = layer.get("name", index)
+        grid_data = layer.get("grid_data")
+        if not isinstance(grid_data, list):
+            errors.append("图层 %s 缺少 grid_data" % name)
+            continue
+        if len(grid_data) != rows:
+            errors.append("图层 %s 有 %d 行, 地图为 %d 行" % (name, len(grid_data), rows))
+        for y, row in enumerate(grid_data):
+            if not isinstance(row, list) or len(row) != cols:
+                errors.append("图层 %s 第 %d 行有 %s 列, 地图为 %d 列" % (name, y, len(row) if isinstance(row, list) else "?", cols))
+                continue
+            for x, cell in enumerate(row):
+                if cell is not None and not isinstance(cell, str):
+                    errors.append("图层 %s 格子 (%d, %d) 的内容无效: %r" % (name, x, y, cell))
+                    break
+            used.update(cell for cell in row if isinstance(cell, str))
+    return errors
+
+
+def validate_json(file_path, resources_dir):
+    map_data = read_json_map(file_path)
+    if map_data is None:
+        return None
+    warnings = []
+    used = set()
+    errors = check_json_structure(map_data, used)
+    check_images(used, resources_dir, errors)
+    unlisted = used - set(map_data.get("image_cache", {}))
+    if unlisted:
+        warnings.append("image_cache 中缺少 %d 张使用中的图片" % len(unlisted))
+    return {"errors": errors, "warnings": warnings}
+
+
+def validate_binary(file_path, resources_dir):
+    errors, warnings = [], []
+    # 图层解码失败时读取器不会自动关闭, 由 with 关闭映射和文件
+    with MapFileReader(file_path) as reader:
+        version = reader.version
+        if version < FORMAT_VERSION:
+            warnings.append("旧版本格式 v%d, 可用 convert --to tmap 升级到 v%d" % (version, FORMAT_VERSION))
+        tile_map = reader.create_map()
+        size = STORAGE_CHUNK_SIZE
+        for layer in tile_map.layers:
+            try:
+                layer.load()
+            except (ValueError, zlib.error, MapFileError) as e:
+                errors.append("图层 %s 无法解码: %s" % (layer.name, e))
+                continue
+            if tile_map.sparse:
+                outside = [key for key in layer.chunks if not (0 <= key[0] * size < tile_map.cols and 0 <= key[1] * size < tile_map.rows)]
+                if outside:
+                    errors.append("图层 %s 有 %d 个分块超出地图范围" % (layer.name, len(outside)))
+            ids = layer.used_ids()
+            if len(ids) and int(ids.max()) >= len(tile_map.palette):
+                errors.append("图层 %s 使用了调色板之外的编号 %d" % (layer.name, int(ids.max())))
+    check_images(tile_map.palette[1:], resources_dir, errors)
+    return {"errors": errors, "warnings": warnings}
+
+
+def validate(file_path, options):
+    if is_binary_map(file_path):
+        return validate_binary(file_path, options["resources"])
+    return validate_json(file_path, options["resources"])
+
+
+def target_path(file_path, options):
+    """输出文件路径; 指定 --out-dir 时保留源文件相对于所有输入文件公共目录的子目录"""
+    base, _ = os.path.splitext(file_path)
+    if options["out_dir"]:
+        base = os.path.join(options["out_dir"], os.path.relpath(os.path.abspath(base), options["root"]))
+    return base + (BINARY_EXTENSION if options["to"] == "tmap" else ".json")
+
+
+def find_collisions(files, options):
+    """返回 {源文件: 错误结果}, 包含所有会写入同一个输出文件的源文件(例如同一目录下的 x.json 和 x.tmap)"""
+    targets = {}
+    for file_path in files:
+        targets.setdefault(os.path.abspath(target_path(file_path, options)), []).append(file_path)
+    collisions = {}
+    for target, sources in targets.items():
+        if len(sources) > 1:
+            for file_path in sources:
+                others = ", ".join(other for other in sources if other != file_path)
+                collisions[file_path] = {"errors": ["与 %s 输出到同一个文件 %s, 没有转换" % (others, target)]}
+    return collisions
+
+
+def check_source(file_path):
+    """convert 和 reindex 前检查源文件: 不是地图文件返回 None, grid_data 行列数不对时返回错误结果,
+    否则返回空字典. 读取行列数不对的 JSON 地图会使格子错位, 不能直接重写"""
+    if is_binary_map(file_path):
+        return {}
+    map_data = read_json_map(file_path)
+    if map_data is None:
+        return None
+    errors = check_json_structure(map_data, set())
+    return {"errors": errors} if errors else {}
+
+
+def convert(file_path, options):
+    checked = check_source(file_path)
+    if checked is None or checked:
+        return checked
+    target = target_path(file_path, options)
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    convert_map(file_path, target)
+    return {"output": target, "bytes": os.path.getsize(target)}
+
+
+def reindex_map(tile_map):
+    """返回调色板重新编号后的地图: 去掉没有使用的图片, 按名称排序"""
+    result = TileMap(tile_map.rows, tile_map.cols, tile_map.grid_width, tile_map.grid_height, tile_map.sparse)
+    result.properties.update(tile_map.properties)
+    lookup = np.zeros(len(tile_map.palette), dtype=TILE_DTYPE)
+    for name in sorted(tile_map.used_tile_names()):
+        lookup[tile_map.palette_ids[name]] = result.tile_id(name)
+    for layer in tile_map.layers:
+        new_layer = result.add_layer(layer.name, layer.visible)
+        for cx, cy, chunk in layer.iter_chunks(STORAGE_CHUNK_SIZE):
+            x0, y0 = cx * STORAGE_CHUNK_SIZE, cy * STORAGE_CHUNK_SIZE
+            new_layer.set_region(x0, y0, lookup[chunk[:tile_map.rows - y0, :tile_map.cols - x0]])
+    return result
+
+
+def reindex(file_path, options):
+    checked = check_source(file_path)
+    if checked is None or checked:
+        return checked
+    tile_map = load_map_file(file_path)
+    result = reindex_map(tile_map)
+    removed = len(tile_map.palette) - len(result.palette)
+    # 按原来的扩展名保存, 文件格式不变
+    save_map_file(result, file_path)
+    return {"palette": len(result.palette) - 1, "removed": removed}
+
+
+def stats(file_path, options):
+    if not is_binary_map(file_path) and read_json_map(file_path) is None:
+        return None
+    start = time.perf_counter()
+    tile_map = load_map_file(file_path)
+    layers = []
+    for layer in tile_map.layers:
+        filled = sum(int(np.count_nonzero(chunk)) for _, _, chunk in layer.iter_chunks(STORAGE_CHUNK_SIZE))
+        layers.append({"name": layer.name, "visible": layer.visible, "filled": filled, "tiles": len(set(layer.used_ids().tolist()) - {0})})
+    used = tile_map.used_tile_names()
+    return {
+        "format": "tmap" if is_binary_map(file_path) else "json",
+        "bytes": os.path.getsize(file_path),
+        "rows": tile_map.rows,
+        "cols": tile_map.cols,
+        "sparse": tile_map.sparse,
+        "palette": len(tile_map.palette) - 1,
+        "used_images": len(used),
+        "unused_images": len(tile_map.palette) - 1 - len(used),
+        "layers": layers,
+        "load_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+
+COMMANDS = {"validate": validate, "convert": convert, "reindex": reindex, "stats": stats}
+
+
+def run_task(task):
+    """进程池中执行的任务, 异常转为错误结果, 一个文件出错不影响其它文件"""
+    command, file_path, options = task
+    try:
+        result = COMMANDS[command](file_path, options)
+    except (OSError, ValueError, KeyError, TypeError, zlib.error, MapFileError) as e:
+        result = {"errors": ["%s: %s" % (type(e).__name__, e)]}
+    if result is None:
+        return file_path, {"skipped": True}
+    return file_path, result
+
+
+def format_result(command, result):
+    if result.get("skipped"):
+        return "跳过 (不是地图文件)"
+    if result.get("errors"):
+        return "错误 %d 项" % len(result["errors"])
+    if command == "validate":
+        return "通过" + (" (警告 %d 项)" % len(result["warnings"]) if result["warnings"] else "")
+    if command == "convert":
+        return "-> %s (%d 字节)" % (result["output"], result["bytes"])
+    if command == "reindex":
+        return "调色板 %d 张图片, 去掉 %d 张" % (result["palette"], result["removed"])
+    layers = ", ".join("%s:%d" % (layer["name"], layer["filled"]) for layer in result["layers"])
+    return "%dx%d %s %d 字节, 图片 %d/%d, 图层 [%s], 读取 %.1f ms" % (
+        result["cols"], result["rows"], result["format"], result["bytes"], result["used_images"], result["palette"], layers, result["load_ms"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="地图文件批量处理工具")
+    parser.add_argument("command", choices=sorted(COMMANDS), help="validate: 检查; convert: 转换格式; reindex: 整理调色板; stats: 统计")
+    parser.add_argument("paths", nargs="+", help="地图文件或目录")
+    parser.add_argument("--resources", default="Resources", help="图片资源目录")
+    parser.add_argument("--to", choices=("json", "tmap"), default="tmap", help="convert 的目标格式")
+    parser.add_argument("--out-dir", help="convert 的输出目录, 默认与源文件相同")
+    parser.add_argument("--jobs", type=int, default=None, help="进程数, 默认为 CPU 核数")
+    parser.add_argument("--report", help="把所有结果写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="逐条输出错误和警告")
+    args = parser.parse_args(argv)
+
+    files = find_maps(args.paths)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(file_path)) for file_path in files]) if files else ""
+    options = {"resources": args.resources, "to": args.to, "out_dir": args.out_dir, "root": root}
+    results = {}
+    failed = 0
+    if args.command == "convert":
+        # 冲突的文件都不转换, 避免一个覆盖另一个的输出
+        results = find_collisions(files, options)
+        failed = len(results)
+        for file_path, result in results.items():
+            print("%s: %s" % (file_path, format_result(args.command, result)))
+            if args.verbose:
+                for message in result["errors"]:
+                    print("    错误: " + message)
+    tasks = [(args.command, file_path, options) for file_path in files if file_path not in results]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.jobs) as pool:
+        # 按完成顺序输出, 大文件不会挡住后面小文件的进度
+        for done, (file_path, result) in enumerate(pool.imap_unordered(run_task, tasks), 1):
+            results[file_path] = result
+            failed += bool(result.get("errors"))
+            print("[%d/%d] %s: %s" % (done, len(tasks), file_path, format_result(args.command, result)), flush=True)
+            if args.verbose:
+                for message in result.get("errors", []):
+                    print("    错误: " + message)
+                for message in result.get("warnings", []):
+                    print("    警告: " + message)
+    print("共 %d 个文件, %d 个有错误, 用时 %.1f 秒" % (len(files), failed, time.perf_counter() - start))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
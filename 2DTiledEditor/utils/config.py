@@ -1,11 +1,13 @@
 import json
 import os
+from utils.profiler import profiler
 
 class ConfigManager:
     def __init__(self):
         self.config_file = "config.json"
         self.config = self.load_config()
 
+    @profiler.timed("load_config", "config")
     def load_config(self):
         if os.path.exists(self.config_file):
             with open(self.config_file, 'r') as file:
@@ -17,9 +19,12 @@ class ConfigManager:
                 "window_position": {"x": 100, "y": 100},
                 "layout_settings": {},
                 "last_map_file": None,
-                "language": "en"  # 默认语言设置为英文
+                "language": "en",  # 默认语言设置为英文
+                "tile_cache_mb": 64,
+                "history_mb": 32
             }
 
+    @profiler.timed("save_config", "config")
     def save_config(self):
         with open(self.config_file, 'w') as file:
             json.dump(self.config, file, indent=4)
@@ -71,3 +76,11 @@ class ConfigManager:
     def set_language(self, language):
         self.config["language"] = language
         self.save_config()
+
+    def get_tile_cache_budget(self):
+        """返回格子图片缩放缓存的内存预算(字节)"""
+        return self.config.get("tile_cache_mb", 64) * 1024 * 1024
+
+    def get_history_budget(self):
+        """返回撤销历史的内存预算(字节)"""
+        return self.config.get("history_mb", 32) * 1024 * 1024
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """按内存预算淘汰的 LRU 缓存, 每个条目登记自己占用的字节数"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # key -> (value, nbytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        self.pop(key)
+        self.entries[key] = (value, nbytes)
+        self.total_bytes += nbytes
+        self.evict()
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.total_bytes -= entry[1]
+        return entry[0]
+
+    def evict(self):
+        """淘汰最久未使用的条目, 直到总大小不超过预算(至少保留最新的一个)"""
+        while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.total_bytes -= nbytes
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+
+class Profiler:
+    """计时区间和计数器
+
+    span() 统计每个区间的调用次数和耗时, 开始录制后还会记录每一次调用, 可以导出为 Chrome 的 trace_event JSON
+    (在 chrome://tracing 或 Perfetto 中打开). count() 累加计数器, set_value() 记录瞬时值.
+    可以在任意线程中调用, 录制的事件数超过 max_events 时丢弃最早的事件.
+    """
+
+    def __init__(self, max_events=200000):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.span_stats = {}  # 名称 -> [次数, 总耗时, 最近一次耗时, 最大耗时], 单位秒
+        self.counters = {}
+        self.events = deque(maxlen=max_events)
+        self.thread_names = {}  # 录制期间出现过的线程, 线程结束后导出时仍能显示名称
+        self.recording = False
+
+    def now_us(self):
+        return (time.perf_counter() - self.origin) * 1000000
+
+    @contextmanager
+    def span(self, name, category="editor"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add_span(name, category, start, end)
+
+    def timed(self, name=None, category="editor"):
+        """装饰器, 把整个函数调用记为一个区间"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, category):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_span(self, name, category, start, end):
+        duration = end - start
+        with self.lock:
+            stats = self.span_stats.get(name)
+            if stats is None:
+                self.span_stats[name] = [1, duration, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = duration
+                stats[3] = max(stats[3], duration)
+            if self.recording:
+                thread = threading.current_thread()
+                self.thread_names[thread.ident] = thread.name
+                self.events.append({
+                    "name": name, "cat": category, "ph": "X",
+                    "ts": (start - self.origin) * 1000000, "dur": duration * 1000000,
+                    "pid": os.getpid(), "tid": thread.ident
+                })
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_value(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def get_counter(self, name, default=0):
+        return self.counters.get(name, default)
+
+    def get_span(self, name):
+        """返回 (次数, 总耗时, 最近一次耗时, 最大耗时), 单位毫秒"""
+        with self.lock:
+            stats = self.span_stats.get(name)
+        if stats is None:
+            return 0, 0.0, 0.0, 0.0
+        return stats[0], stats[1] * 1000, stats[2] * 1000, stats[3] * 1000
+
+    def sample_counters(self):
+        """录制期间把当前所有计数器记为一个计数事件, 在 trace 中显示为曲线"""
+        with self.lock:
+            if not self.recording:
+                return
+            timestamp = self.now_us()
+            for name, value in self.counters.items():
+                self.events.append({"name": name, "ph": "C", "ts": timestamp, "pid": os.getpid(), "args": {"value": value}})
+
+    def start_recording(self):
+        with self.lock:
+            self.events.clear()
+            self.thread_names.clear()
+            self.recording = True
+
+    def stop_recording(self):
+        with self.lock:
+            self.recording = False
+
+    def export_chrome_trace(self, file_path):
+        """把录制的事件写为 Chrome trace_event 格式的 JSON 文件, 返回事件数"""
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread_names.get(tid, str(tid))}}
+            for tid in sorted({event["tid"] for event in events if "tid" in event})
+        ]
+        with open(file_path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+    def reset(self):
+        with self.lock:
+            self.span_stats.clear()
+            self.counters.clear()
+            self.events.clear()
+
+
+# 编辑器各模块共用的性能统计
+profiler = Profiler()
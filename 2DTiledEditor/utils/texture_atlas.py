@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+import threading
+import time
+from PIL import Image
+
+ATLAS_INDEX = "atlas.json"
+ATLAS_VERSION = 1
+STALE_CHECK_INTERVAL = 1.0  # 两次检查资源目录修改时间的最短间隔, 秒
+
+
+def pack_atlas(resources_dir, max_size=2048, padding=1):
+    """把 resources_dir 下的 PNG 图片打包成一张或几张图集, 写出图集图片和 atlas.json 索引
+
+    使用按高度排序的货架算法: 图片从左到右排成一行, 放不下时换行, 整张图集放不下时换一张.
+    atlas.json 中每张图片记录所在图集、像素矩形 (x, y, w, h) 和归一化纹理坐标 (u0, v0, u1, v1).
+    返回索引字典.
+    """
+    filenames = sorted(name for name in os.listdir(resources_dir) if name.lower().endswith(".png") and not name.startswith("atlas_"))
+    images = {}
+    for filename in filenames:
+        with Image.open(os.path.join(resources_dir, filename)) as source:
+            images[filename] = source.convert("RGBA")
+    order = sorted(filenames, key=lambda name: (-images[name].height, -images[name].width, name))
+
+    sheets = []  # [[宽, 高, [(文件名, x, y)]]]
+    x = y = shelf_height = 0
+    for filename in order:
+        width, height = images[filename].size
+        # 超过图集尺寸的图片会单独占一张图集
+        if x > 0 and x + width > max_size:
+            x, y, shelf_height = 0, y + shelf_height + padding, 0
+        if not sheets or y + height > max_size:
+            sheets.append([0, 0, []])
+            x = y = shelf_height = 0
+        sheet = sheets[-1]
+        sheet[2].append((filename, x, y))
+        sheet[0] = max(sheet[0], x + width)
+        sheet[1] = max(sheet[1], y + height)
+        shelf_height = max(shelf_height, height)
+        x += width + padding
+
+    index = {"version": ATLAS_VERSION, "sheets": [], "images": {}}
+    for sheet_index, (sheet_width, sheet_height, placed) in enumerate(sheets):
+        sheet_name = "atlas_%d.png" % sheet_index
+        sheet_image = Image.new("RGBA", (sheet_width, sheet_height), (0, 0, 0, 0))
+        for filename, x, y in placed:
+            image = images[filename]
+            sheet_image.paste(image, (x, y))
+            index["images"][filename] = {
+                "sheet": sheet_index,
+                "x": x, "y": y, "w": image.width, "h": image.height,
+                "u0": x / sheet_width, "v0": y / sheet_height,
+                "u1": (x + image.width) / sheet_width, "v1": (y + image.height) / sheet_height
+            }
+        sheet_image.save(os.path.join(resources_dir, sheet_name))
+        index["sheets"].append(sheet_name)
+    with open(os.path.join(resources_dir, ATLAS_INDEX), "w") as f:
+        json.dump(index, f, indent=4)
+    return index
+
+
+class TextureAtlas:
+    """读取 pack_atlas() 生成的图集, 所有图片只需打开一次图集文件
+
+    is_stale() 和 get_image() 可以在线程池中调用. 判断图片是否过期时不逐个读取图片文件的时间:
+    资源目录的修改时间晚于图集时才扫描一遍目录, 扫描结果在目录再次改变之前一直有效;
+    目录的修改时间最多每 STALE_CHECK_INTERVAL 秒读取一次.
+    """
+
+    def __init__(self, resources_dir):
+        self.resources_dir = resources_dir
+        index_path = os.path.join(resources_dir, ATLAS_INDEX)
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if index.get("version", 0) > ATLAS_VERSION:
+            raise ValueError("不支持的图集版本 %s" % index["version"])
+        self.sheet_names = index["sheets"]
+        self.images = index["images"]
+        self.built_time = os.path.getmtime(index_path)
+        self.sheets = {}
+        self.lock = threading.Lock()
+        self.dir_time = None  # 上次扫描时资源目录的修改时间
+        self.check_time = None
+        self.stale_names = set()
+
+    def __contains__(self, image_name):
+        return image_name in self.images
+
+    def is_stale(self, image_name):
+        """图片在生成图集之后被替换过. 直接改写文件内容而不改变目录的修改不会被发现, 需要重新生成图集"""
+        with self.lock:
+            now = time.monotonic()
+            if self.check_time is None or now - self.check_time >= STALE_CHECK_INTERVAL:
+                self.check_time = now
+                dir_time = os.stat(self.resources_dir).st_mtime
+                if dir_time != self.dir_time:
+                    self.dir_time = dir_time
+                    self.stale_names = self.scan_stale() if dir_time > self.built_time else set()
+            return image_name in self.stale_names
+
+    def scan_stale(self):
+        """扫描一遍资源目录, 返回修改时间晚于图集的图片名称"""
+        with os.scandir(self.resources_dir) as entries:
+            return {entry.name for entry in entries if entry.name in self.images and entry.stat().st_mtime > self.built_time}
+
+    def get_sheet(self, sheet_index):
+        with self.lock:
+            sheet = self.sheets.get(sheet_index)
+            if sheet is None:
+                with Image.open(os.path.join(self.resources_dir, self.sheet_names[sheet_index])) as source:
+                    sheet = source.convert("RGBA")
+                self.sheets[sheet_index] = sheet
+            return sheet
+
+    def get_image(self, image_name):
+        """从图集中裁出图片, 返回 RGBA 的 PIL 图像"""
+        entry = self.images[image_name]
+        return self.get_sheet(entry["sheet"]).crop((entry["x"], entry["y"], entry["x"] + entry["w"], entry["y"] + entry["h"]))
+
+
+def load_atlas(resources_dir):
+    """资源目录下有图集时返回 TextureAtlas, 否则返回 None"""
+    if not os.path.exists(os.path.join(resources_dir, ATLAS_INDEX)):
+        return None
+    try:
+        return TextureAtlas(resources_dir)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+if __name__ == "__main__":
+    # python -m utils.texture_atlas [资源目录]
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else "Resources"
+    atlas_index = pack_atlas(target_dir)
+    print("%d 张图片打包为 %d 张图集" % (len(atlas_index["images"]), len(atlas_index["sheets"])))
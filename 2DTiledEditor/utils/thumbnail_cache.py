@@ -0,0 +1,61 @@
+import hashlib
+import os
+import tempfile
+from PIL import Image
+from utils.profiler import profiler
+
+
+class ThumbnailCache:
+    """磁盘上的缩略图缓存
+
+    缓存文件名由图片的绝对路径、修改时间、文件大小和缩略图尺寸计算出的哈希值决定,
+    图片被修改后哈希随之改变, 旧缓存自然失效, 不需要额外的失效逻辑. 所有方法都可以在线程池中调用.
+    """
+
+    def __init__(self, cache_dir=".thumbnails"):
+        self.cache_dir = cache_dir
+
+    def get_key(self, file_path, size):
+        stat = os.stat(file_path)
+        text = "%s|%d|%d|%d" % (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, size)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".png")
+
+    def load(self, key):
+        """读取缓存的缩略图, 不存在或已损坏时返回 None"""
+        try:
+            with Image.open(self.get_path(key)) as image:
+                return image.convert("RGBA")
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, image):
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名, 并发写入或中途退出都不会留下半个文件
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, "PNG")
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @profiler.timed("get_thumbnails", "resources")
+    def get_thumbnails(self, file_path, sizes):
+        """返回 {边长: PIL 图像}, 缓存中没有的尺寸从原图生成并写入缓存"""
+        keys = {size: self.get_key(file_path, size) for size in sizes}
+        thumbnails = {size: self.load(key) for size, key in keys.items()}
+        missing = [size for size, image in thumbnails.items() if image is None]
+        if missing:
+            with Image.open(file_path) as source:
+                image = source.convert("RGBA")
+            for size in sorted(missing, reverse=True):
+                image = image.copy()
+                image.thumbnail((size, size))
+                thumbnails[size] = image
+                self.save(keys[size], image)
+        return thumbnails
@@ -0,0 +1,265 @@
+from collections import OrderedDict, deque
+import heapq
+import numpy as np
+
+# 格子标志位, 一个格子可以同时有多个标志(例如砖块下面藏着道具)
+SOLID = 1  # 不可破坏的墙
+BRICK = 2  # 可以被炸掉的砖块
+ITEM = 4  # 道具
+DOOR = 8  # 出口
+BOMB = 16  # 炸弹, 阻挡行走但不阻挡爆炸
+BLOCKED = SOLID | BRICK | BOMB  # 不能行走
+STOPS_BLAST = SOLID | BRICK  # 爆炸在这里停止
+
+# 编辑器地图属性 tile_flags 中的类型名称 -> 标志
+KIND_FLAGS = {"solid": SOLID, "brick": BRICK, "item": ITEM, "door": DOOR}
+
+# 图片名称 -> 标志, 地图没有设置 tile_flags 属性时使用(Map1 的图片); 没有列出的图片(地面等)不影响游戏逻辑
+TILE_FLAGS = {
+    "3.png": SOLID,
+    "2.png": BRICK,
+    "4.png": DOOR,
+    "6.png": ITEM,
+    "7.png": ITEM,
+    "8.png": ITEM,
+}
+
+
+
+def read_tile_flags(map_data):
+    """读取地图属性 tile_flags({图片名称: [类型名称]}, 在编辑器的资源列表中右键设置), 没有设置时返回 TILE_FLAGS"""
+    kinds = map_data.get("tile_flags")
+    if not kinds:
+        return TILE_FLAGS
+    tile_flags = {}
+    for image_name, names in kinds.items():
+        if isinstance(names, str):
+            names = [names]
+        flag = 0
+        for name in names:
+            if name not in KIND_FLAGS:
+                raise ValueError("图片 %s 的类型无效: %s" % (image_name, name))
+            flag |= KIND_FLAGS[name]
+        tile_flags[image_name] = flag
+    return tile_flags
+
+
+UNREACHABLE = -1
+MAX_FIELDS = 64  # 最多缓存的距离场数量, 超过时丢弃最久没有使用的距离场
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class GameMap:
+    """由地图图层编译出的游戏逻辑数据
+
+    flags 为 rows x cols 的 uint8 数组, 每个格子的标志位由所有可见图层的图片按 tile_flags(默认读取地图属性) 合并而成,
+    查询某个格子是否可以行走只需要读一个数组元素. 到某个目标格子的距离场(BFS)按目标缓存, 许多怪物追同一个目标时共用一个距离场;
+    砖块被炸掉或放下炸弹时只修补或丢弃受影响的距离场.
+    """
+
+    def __init__(self, map_data, tile_flags=None):
+        if tile_flags is None:
+            tile_flags = read_tile_flags(map_data)
+        self.rows = map_data["rows"]
+        self.cols = map_data["cols"]
+        self.grid_width = map_data["grid_width"]
+        self.grid_height = map_data["grid_height"]
+        self.flags = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.brick_layers = {}  # (col, row) -> 砖块所在的图层编号, 砖块被炸掉时清除这个图层的格子
+        self.items = {}  # (col, row) -> (图层编号, 道具或出口的图片名称)
+        for layer_index, layer in enumerate(map_data["layers"]):
+            if not layer.get("visible", True):
+                continue
+            for row, cells in enumerate(layer["grid_data"]):
+                for col, cell in enumerate(cells):
+                    flag = tile_flags.get(cell, 0)
+                    if not flag:
+                        continue
+                    self.flags[row, col] |= flag
+                    if flag & BRICK:
+                        self.brick_layers[(col, row)] = layer_index
+                    if flag & (ITEM | DOOR):
+                        self.items[(col, row)] = (layer_index, cell)
+        self.fields = OrderedDict()  # (col, row) -> 距离场
+        self.cell_listeners = []
+
+    def add_cell_listener(self, listener):
+        """listener(layer_index, col, row, image_name) 在图层格子被修改后调用, 例如 MapRenderer.set_cell"""
+        self.cell_listeners.append(listener)
+
+    def in_bounds(self, col, row):
+        return 0 <= col < self.cols and 0 <= row < self.rows
+
+    def is_blocked(self, col, row):
+        """地图之外视为不能行走"""
+        return not self.in_bounds(col, row) or bool(self.flags[row, col] & BLOCKED)
+
+    def is_walkable(self, col, row):
+        return not self.is_blocked(col, row)
+
+    def walkable(self):
+        """返回可以行走的格子的布尔数组"""
+        return (self.flags & BLOCKED) == 0
+
+    def to_cell(self, x, y):
+        return int(x // self.grid_width), int(y // self.grid_height)
+
+    def rect_blocked(self, rect):
+        """像素矩形覆盖的格子中是否有不能行走的格子"""
+        col0, row0 = self.to_cell(rect.left, rect.top)
+        col1, row1 = self.to_cell(rect.right - 1, rect.bottom - 1)
+        if col0 < 0 or row0 < 0 or col1 >= self.cols or row1 >= self.rows:
+            return True
+        return bool((self.flags[row0:row1 + 1, col0:col1 + 1] & BLOCKED).any())
+
+    def blast(self, col, row, power):
+        """计算炸弹在 (col, row) 爆炸的范围: 沿四个方向各延伸 power 格, 遇到墙停止, 遇到砖块时包含砖块并停止.
+        返回 (爆炸覆盖的格子列表, 被炸到的砖块列表)"""
+        cells = [(col, row)]
+        bricks = []
+        for dx, dy in DIRECTIONS:
+            # 取出这个方向上的一段标志, 用 argmax 找第一个挡住爆炸的格子
+            if dx:
+                if dx > 0:
+                    line = self.flags[row, col + 1:col + 1 + power]
+                else:
+                    line = self.flags[row, max(col - power, 0):col][::-1]
+            else:
+                if dy > 0:
+                    line = self.flags[row + 1:row + 1 + power, col]
+                else:
+                    line = self.flags[max(row - power, 0):row, col][::-1]
+            stops = (line & STOPS_BLAST) != 0
+            length = int(stops.argmax()) if stops.any() else len(line)
+            cells.extend((col + dx * step, row + dy * step) for step in range(1, length + 1))
+            if length < len(line) and line[length] & BRICK:
+                brick = (col + dx * (length + 1), row + dy * (length + 1))
+                cells.append(brick)
+                bricks.append(brick)
+        return cells, bricks
+
+    def destroy_brick(self, col, row):
+        """炸掉砖块, 露出下面的道具; 图层中的砖块格子被清除, 并通知格子监听者"""
+        if not self.flags[row, col] & BRICK:
+            return False
+        self.flags[row, col] &= ~np.uint8(BRICK)
+        layer_index = self.brick_layers.pop((col, row), None)
+        if layer_index is not None:
+            for listener in self.cell_listeners:
+                listener(layer_index, col, row, None)
+        if not self.flags[row, col] & BLOCKED:
+            self.repair_fields(col, row)
+        return True
+
+    def take_item(self, col, row):
+        """拾取 (col, row) 上已经露出的道具, 返回图片名称; 出口不能拾取"""
+        if self.flags[row, col] & (BRICK | DOOR) or not self.flags[row, col] & ITEM:
+            return None
+        self.flags[row, col] &= ~np.uint8(ITEM)
+        layer_index, image_name = self.items.pop((col, row))
+        for listener in self.cell_listeners:
+            listener(layer_index, col, row, None)
+        return image_name
+
+    def door_open(self, col, row):
+        """出口已经露出(上面的砖块被炸掉)"""
+        return bool(self.flags[row, col] & DOOR) and not self.flags[row, col] & BRICK
+
+    def place_bomb(self, col, row):
+        self.flags[row, col] |= BOMB
+        self.drop_fields(col, row)
+
+    def remove_bomb(self, col, row):
+        self.flags[row, col] &= ~np.uint8(BOMB)
+        if not self.flags[row, col] & BLOCKED:
+            self.repair_fields(col, row)
+
+    def distance_field(self, col, row):
+        """返回从每个格子走到 (col, row) 的步数数组, 走不到的格子为 UNREACHABLE; 结果按目标缓存"""
+        key = (col, row)
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+        field = np.full((self.rows, self.cols), UNREACHABLE, dtype=np.int32)
+        if self.is_walkable(col, row):
+            field[row, col] = 0
+            self.spread(field, deque([key]))
+        self.fields[key] = field
+        while len(self.fields) > MAX_FIELDS:
+            self.fields.popitem(last=False)
+        return field
+
+    def spread(self, field, queue):
+        """从队列中的格子开始按 BFS 更新距离, 只改写距离变小的格子"""
+        flags, rows, cols = self.flags, self.rows, self.cols
+        while queue:
+            col, row = queue.popleft()
+            distance = field[row, col] + 1
+            for dx, dy in DIRECTIONS:
+                x, y = col + dx, row + dy
+                if 0 <= x < cols and 0 <= y < rows and not flags[y, x] & BLOCKED:
+                    current = field[y, x]
+                    if current == UNREACHABLE or current > distance:
+                        field[y, x] = distance
+                        queue.append((x, y))
+
+    def repair_fields(self, col, row):
+        """格子变为可以行走: 距离只会变小, 从这个格子开始向外修补每个缓存的距离场, 没有受影响的格子不会被访问"""
+        for key, field in self.fields.items():
+            if key == (col, row):
+                # 目标格子本身之前不能行走, 距离场是空的
+                field[row, col] = 0
+                self.spread(field, deque([key]))
+                continue
+            distances = [field[row + dy, col + dx] for dx, dy in DIRECTIONS
+                         if self.in_bounds(col + dx, row + dy) and field[row + dy, col + dx] != UNREACHABLE]
+            if not distances:
+                # 周围都走不到目标, 打通这个格子也不会连通目标
+                continue
+            field[row, col] = min(distances) + 1
+            self.spread(field, deque([(col, row)]))
+
+    def drop_fields(self, col, row):
+        """格子变为不能行走: 丢弃经过这个格子的距离场, 其它距离场不受影响"""
+        for key in [key for key, field in self.fields.items() if field[row, col] != UNREACHABLE]:
+            del self.fields[key]
+
+    def next_step(self, col, row, target_col, target_row):
+        """沿距离场走向目标的下一个格子, 已经到达或走不到时返回 None"""
+        field = self.distance_field(target_col, target_row)
+        best, best_distance = None, field[row, col] if field[row, col] != UNREACHABLE else None
+        for dx, dy in DIRECTIONS:
+            x, y = col + dx, row + dy
+            if self.in_bounds(x, y):
+                distance = field[y, x]
+                if distance != UNREACHABLE and (best_distance is None or distance < best_distance):
+                    best, best_distance = (x, y), distance
+        return best
+
+    def find_path(self, start, goal):
+        """A* 查找从 start 到 goal 的格子路径(包含两端), 找不到时返回 None; 用于只查询一次、不值得缓存距离场的路径"""
+        if self.is_blocked(*goal):
+            return None
+        flags = self.flags
+        came_from = {start: None}
+        cost = {start: 0}
+        heap = [(abs(start[0] - goal[0]) + abs(start[1] - goal[1]), 0, start)]
+        while heap:
+            _, steps, cell = heapq.heappop(heap)
+            if cell == goal:
+                path = []
+                while cell is not None:
+                    path.append(cell)
+                    cell = came_from[cell]
+                return path[::-1]
+            if steps > cost[cell]:
+                continue
+            for dx, dy in DIRECTIONS:
+                x, y = cell[0] + dx, cell[1] + dy
+                if 0 <= x < self.cols and 0 <= y < self.rows and not flags[y, x] & BLOCKED:
+                    if steps + 1 < cost.get((x, y), steps + 2):
+                        cost[(x, y)] = steps + 1
+                        came_from[(x, y)] = cell
+                        heapq.heappush(heap, (steps + 1 + abs(x - goal[0]) + abs(y - goal[1]), steps + 1, (x, y)))
+        return None
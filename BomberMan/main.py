@@ -1,11 +1,55 @@
 import pygame
 import json
 import os
+from game_map import GameMap
+from renderer import MapRenderer, Sprite
+
+FPS = 60
+MAX_SCREEN_WIDTH = 960
+MAX_SCREEN_HEIGHT = 640
+PLAYER_SPEED = 4  # 格/秒
+PLAYER_MARGIN = 4  # 碰撞矩形比图片每边小的像素, 方便拐进一格宽的通道
 
 def load_map_data(map_file):
     with open(map_file, 'r') as f:
         return json.load(f)
 
+def load_images(image_names, resources_dir="Resources"):
+    """资源目录下有图集(atlas.json)时从图集中切出图片, 只需读取图集文件; 否则逐个读取图片.
+    需要在 set_mode() 之后调用, 图片转换为屏幕像素格式, 绘制时不再逐像素转换"""
+    images = {}
+    atlas_file = os.path.join(resources_dir, "atlas.json")
+    if os.path.exists(atlas_file):
+        with open(atlas_file, 'r') as f:
+            atlas = json.load(f)
+        sheets = {}
+        for image_name in image_names:
+            entry = atlas["images"].get(image_name)
+            if entry:
+                sheet_index = entry["sheet"]
+                if sheet_index not in sheets:
+                    sheets[sheet_index] = pygame.image.load(os.path.join(resources_dir, atlas["sheets"][sheet_index])).convert_alpha()
+                # 子表面与图集共享像素, 绘制时直接从同一张图集取数据
+                images[image_name] = sheets[sheet_index].subsurface(pygame.Rect(entry["x"], entry["y"], entry["w"], entry["h"]))
+    for image_name in image_names:
+        if image_name not in images:
+            images[image_name] = pygame.image.load(os.path.join(resources_dir, image_name)).convert_alpha()
+    return images
+
+def create_player_image(width, height):
+    # 资源中还没有角色图片, 先用圆形代替
+    image = pygame.Surface((width, height), pygame.SRCALPHA)
+    pygame.draw.circle(image, (255, 255, 255), (width // 2, height // 2), min(width, height) // 2 - 2)
+    pygame.draw.circle(image, (30, 30, 30), (width // 2, height // 2), min(width, height) // 2 - 2, 2)
+    return image.convert_alpha()
+
+def move_player(player, game_map, dx, dy):
+    x, y = player.x, player.y
+    player.x += dx
+    player.y += dy
+    if game_map.rect_blocked(player.rect.inflate(-2 * PLAYER_MARGIN, -2 * PLAYER_MARGIN)):
+        player.x, player.y = x, y
+
 def main():
     pygame.init()
     
@@ -15,36 +59,50 @@ def main():
     grid_height = map_data['grid_height']
     rows = map_data['rows']
     cols = map_data['cols']
-    layers = map_data['layers']
     
-    # 创建Pygame窗口
-    screen_width = cols * grid_width
-    screen_height = rows * grid_height
+    # 创建Pygame窗口, 地图比窗口大时相机跟随角色滚动
+    screen_width = min(cols * grid_width, MAX_SCREEN_WIDTH)
+    screen_height = min(rows * grid_height, MAX_SCREEN_HEIGHT)
     screen = pygame.display.set_mode((screen_width, screen_height))
     pygame.display.set_caption("BomberMan Map")
     
     # 加载图片资源
-    images = {}
-    for image_name in map_data['image_cache'].values():
-        image_path = os.path.join("Resources", image_name)
-        images[image_name] = pygame.image.load(image_path)
-    
-    # 绘制地图
-    for layer in layers:
-        for row in range(rows):
-            for col in range(cols):
-                cell = layer['grid_data'][row][col]
-                if cell:
-                    screen.blit(images[cell], (col * grid_width, row * grid_height))
-    
-    pygame.display.flip()
+    images = load_images(map_data['image_cache'].values())
+    renderer = MapRenderer(map_data, images, screen_width, screen_height)
+    game_map = GameMap(map_data)
+    # 砖块被炸掉时更新对应的图层格子
+    game_map.add_cell_listener(renderer.set_cell)
+    player = Sprite(create_player_image(grid_width, grid_height), grid_width, grid_height)
+    speed = PLAYER_SPEED * grid_width  # 像素/秒
     
     # 主循环
+    clock = pygame.time.Clock()
+    fps_time = 0
     running = True
     while running:
+        # tick() 在帧之间休眠, 空闲时不占满 CPU
+        dt = clock.tick(FPS) / 1000.0
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+        
+        keys = pygame.key.get_pressed()
+        dx = (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * speed * dt
+        dy = (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * speed * dt
+        # 两个方向分别移动, 撞墙时仍可以沿墙滑动
+        move_player(player, game_map, dx, 0)
+        move_player(player, game_map, 0, dy)
+        renderer.follow(player.rect)
+        
+        # 只更新有变化的矩形, 没有变化时不更新窗口
+        dirty = renderer.draw(screen, [player])
+        if dirty:
+            pygame.display.update(dirty)
+        
+        fps_time += dt
+        if fps_time >= 1:
+            fps_time = 0
+            pygame.display.set_caption("BomberMan Map - %.0f FPS" % clock.get_fps())
     
     pygame.quit()
 
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import pygame
+
+CHUNK_SIZE = 16  # 每个预渲染分块包含 CHUNK_SIZE x CHUNK_SIZE 个格子
+MAX_CHUNKS = 64  # 最多保留的分块表面数量, 超过时丢弃最久没有显示的分块
+
+
+class Sprite:
+    """运动物体: 世界坐标(像素)和图片"""
+
+    def __init__(self, image, x, y):
+        self.image = image
+        self.x = x
+        self.y = y
+
+    @property
+    def rect(self):
+        return pygame.Rect(int(self.x), int(self.y), self.image.get_width(), self.image.get_height())
+
+
+class MapRenderer:
+    """地图运行时渲染
+
+    地图的静态图层按分块预先合成到转换过像素格式的表面上, 每个分块只合成一次, 格子被修改(例如砖块被炸掉)时重新合成所在分块.
+    相机不动时每帧只恢复运动物体上一帧和这一帧所在的矩形, 并只更新这些矩形; 相机移动后整屏重绘.
+    """
+
+    def __init__(self, map_data, images, view_width, view_height):
+        self.grid_width = map_data["grid_width"]
+        self.grid_height = map_data["grid_height"]
+        self.rows = map_data["rows"]
+        self.cols = map_data["cols"]
+        # 保留所有图层, set_cell() 的图层编号与地图文件一致; 只合成可见图层
+        self.layers = [layer["grid_data"] for layer in map_data["layers"]]
+        self.visible_layers = [layer["grid_data"] for layer in map_data["layers"] if layer.get("visible", True)]
+        self.images = images
+        self.world_width = self.cols * self.grid_width
+        self.world_height = self.rows * self.grid_height
+        self.camera = pygame.Rect(0, 0, min(view_width, self.world_width), min(view_height, self.world_height))
+        # 地图比窗口小时居中显示
+        self.screen_offset = ((view_width - self.camera.width) // 2, (view_height - self.camera.height) // 2)
+        self.chunks = OrderedDict()  # (cx, cy) -> 合成好的分块表面
+        self.previous_rects = []  # 上一帧运动物体在屏幕上的矩形
+        self.extra_dirty = []  # 由 mark_dirty() 登记的屏幕矩形
+        self.full_redraw = True
+
+    def set_cell(self, layer_index, col, row, image_name):
+        """修改静态图层中的一个格子; 可以注册为 GameMap 的格子监听者.
+        已经合成的分块只重新合成这一个格子, 下一帧只重画这个格子的矩形"""
+        self.layers[layer_index][row][col] = image_name
+        chunk = self.chunks.get((col // CHUNK_SIZE, row // CHUNK_SIZE))
+        if chunk is not None:
+            self.compose_cell(chunk, col, row)
+        self.mark_dirty(pygame.Rect(col * self.grid_width, row * self.grid_height, self.grid_width, self.grid_height))
+
+    def compose_cell(self, chunk, col, row):
+        """在分块上按图层顺序重新合成一个格子"""
+        position = ((col % CHUNK_SIZE) * self.grid_width, (row % CHUNK_SIZE) * self.grid_height)
+        chunk.fill((0, 0, 0), pygame.Rect(position, (self.grid_width, self.grid_height)))
+        for grid_data in self.visible_layers:
+            cell = grid_data[row][col]
+            if cell:
+                chunk.blit(self.images[cell], position)
+
+    def mark_dirty(self, world_rect):
+        """登记需要重画的世界坐标矩形, 例如物体换了图片但位置没变"""
+        self.extra_dirty.append(self.to_screen(world_rect))
+
+    def get_chunk(self, cx, cy):
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        x0, y0 = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        x1, y1 = min(x0 + CHUNK_SIZE, self.cols), min(y0 + CHUNK_SIZE, self.rows)
+        # 分块不透明, convert() 之后与屏幕像素格式相同, 绘制时不需要转换和混合
+        chunk = pygame.Surface(((x1 - x0) * self.grid_width, (y1 - y0) * self.grid_height)).convert()
+        chunk.fill((0, 0, 0))
+        for grid_data in self.visible_layers:
+            for row in range(y0, y1):
+                cells = grid_data[row]
+                for col in range(x0, x1):
+                    cell = cells[col]
+                    if cell:
+                        chunk.blit(self.images[cell], ((col - x0) * self.grid_width, (row - y0) * self.grid_height))
+        self.chunks[key] = chunk
+        while len(self.chunks) > MAX_CHUNKS:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def follow(self, rect):
+        """移动相机使 rect 位于视野中央, 不超出地图边界; 相机移动后下一帧整屏重绘"""
+        x = min(max(rect.centerx - self.camera.width // 2, 0), self.world_width - self.camera.width)
+        y = min(max(rect.centery - self.camera.height // 2, 0), self.world_height - self.camera.height)
+        if (x, y) != self.camera.topleft:
+            self.camera.topleft = (x, y)
+            self.full_redraw = True
+
+    def to_screen(self, rect):
+        return rect.move(self.screen_offset[0] - self.camera.x, self.screen_offset[1] - self.camera.y)
+
+    def draw_background(self, screen, world_rect):
+        """把世界坐标矩形内的静态图层画到屏幕上"""
+        world_rect = world_rect.clip(self.camera)
+        if world_rect.width <= 0 or world_rect.height <= 0:
+            return
+        chunk_width, chunk_height = CHUNK_SIZE * self.grid_width, CHUNK_SIZE * self.grid_height
+        for cy in range(world_rect.top // chunk_height, (world_rect.bottom - 1) // chunk_height + 1):
+            for cx in range(world_rect.left // chunk_width, (world_rect.right - 1) // chunk_width + 1):
+                chunk_rect = pygame.Rect(cx * chunk_width, cy * chunk_height, chunk_width, chunk_height)
+                area = world_rect.clip(chunk_rect)
+                source = area.move(-chunk_rect.x, -chunk_rect.y)
+                screen.blit(self.get_chunk(cx, cy), self.to_screen(area).topleft, source)
+
+    def draw(self, screen, sprites):
+        """绘制一帧, 返回需要更新到窗口的屏幕矩形列表(全屏重绘时为整个窗口)"""
+        sprites = sorted(sprites, key=lambda sprite: sprite.y)
+        screen_rects = [self.to_screen(sprite.rect) for sprite in sprites]
+        view = pygame.Rect(self.screen_offset, self.camera.size)
+        if self.full_redraw:
+            self.full_redraw = False
+            self.extra_dirty = []
+            screen.fill((0, 0, 0))
+            self.draw_background(screen, self.camera)
+            screen.set_clip(view)
+            for sprite, rect in zip(sprites, screen_rects):
+                screen.blit(sprite.image, rect)
+            screen.set_clip(None)
+            self.previous_rects = screen_rects
+            return [screen.get_rect()]
+        # 上一帧有而这一帧没有的矩形要恢复背景, 这一帧新出现的矩形要画上物体
+        previous = set(map(tuple, self.previous_rects))
+        current = set(map(tuple, screen_rects))
+        dirty = [pygame.Rect(rect).clip(view) for rect in previous ^ current] + [rect.clip(view) for rect in self.extra_dirty]
+        # 完全在视野之外的矩形不需要重画
+        dirty = [rect for rect in dirty if rect.width and rect.height]
+        self.previous_rects = screen_rects
+        self.extra_dirty = []
+        if not dirty:
+            return []
+        offset_x, offset_y = self.camera.x - self.screen_offset[0], self.camera.y - self.screen_offset[1]
+        for rect in dirty:
+            self.draw_background(screen, rect.move(offset_x, offset_y))
+        # 与重画区域相交的物体都要重画, 包括没有移动但被覆盖的物体
+        screen.set_clip(view)
+        for sprite, rect in zip(sprites, screen_rects):
+            if rect.collidelist(dirty) != -1:
+                screen.blit(sprite.image, rect)
+        screen.set_clip(None)
+        return dirty
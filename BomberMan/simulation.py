@@ -0,0 +1,497 @@
+"""不依赖窗口的对局模拟, 用于调整关卡难度
+
+    python simulation.py Resources/Map1.json --matches 1000 [--monsters 3] [--jobs 4] [--report stats.json]
+    python simulation.py Resources/Map1.json --watch
+
+对局按固定的逻辑帧推进, 不等待真实时间; 玩家由简单的 AI 控制. 多个对局由进程池并行模拟, 最后输出每张地图的统计.
+--watch 用 pygame 实时显示一局, 显示只读取对局状态, 不影响模拟结果.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import deque
+from game_map import GameMap, DIRECTIONS, BLOCKED, UNREACHABLE
+
+TICK_RATE = 20  # 每秒逻辑帧数, 只在 --watch 时用于控制速度
+SAFE_REGION_CELLS = 64  # 逃跑时评估每一步最多数的格子数
+SAFE_REGION_MIN = 4  # 躲避炸弹时, 怪物能走到的安全格子周围至少要有这么多格子, 否则会被堵在角落里
+MONSTER_SEARCH_STEPS = 16  # 计算怪物到各格子的步数时最多搜索的步数, 更远的格子视为安全
+
+# 对局规则, 单位为逻辑帧
+DEFAULT_RULES = {
+    "monsters": 3,
+    "monster_move_ticks": 6,  # 怪物每隔多少帧走一格
+    "monster_chase": 0.7,  # 怪物每一步追向玩家的概率, 否则随机走
+    "monster_min_distance": 4,  # 怪物出生位置到玩家的最小步数
+    "player_move_ticks": 4,
+    "player_flee_distance": 3,  # 怪物离玩家不超过这个步数时玩家逃开
+    "min_player_move_ticks": 2,
+    "bomb_fuse_ticks": 50,
+    "flame_ticks": 10,
+    "bomb_power": 1,
+    "bomb_count": 1,
+    "max_ticks": 20 * 60 * 3,
+}
+
+# 道具图片 -> 效果
+ITEM_EFFECTS = {
+    "6.png": "power",
+    "7.png": "bombs",
+    "8.png": "speed",
+}
+
+
+class Monster:
+    def __init__(self, col, row):
+        self.col = col
+        self.row = row
+        self.cooldown = 0
+        self.alive = True
+
+
+class Bomb:
+    def __init__(self, col, row, power, fuse):
+        self.col = col
+        self.row = row
+        self.power = power
+        self.fuse = fuse
+
+
+class Match:
+    """一局游戏的状态, 每次 step() 推进一个逻辑帧
+
+    result 为 None 表示对局还在进行, 结束后为 "win"(所有怪物被消灭后走到出口)、"monster"(被怪物抓到)、
+    "bomb"(被炸到) 或 "timeout".
+    """
+
+    def __init__(self, map_data, seed=0, rules=None):
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.random = random.Random(seed)
+        self.game_map = GameMap(map_data)
+        self.tick = 0
+        self.result = None
+        self.bombs = []
+        self.flames = {}  # (col, row) -> 剩余帧数
+        self.power = self.rules["bomb_power"]
+        self.bomb_count = self.rules["bomb_count"]
+        self.move_ticks = self.rules["player_move_ticks"]
+        self.cooldown = 0
+        self.stats = {"bombs": 0, "bricks": 0, "kills": 0, "items": 0}
+        floor = self.floor_cells()
+        self.player = floor[0]
+        self.monsters = self.spawn_monsters(floor)
+
+    def floor_cells(self):
+        game_map = self.game_map
+        return [(col, row) for row in range(game_map.rows) for col in range(game_map.cols) if game_map.is_walkable(col, row)]
+
+    def spawn_monsters(self, floor):
+        """怪物优先出生在被砖块隔开、玩家走不到的格子, 其次是离玩家足够远的格子"""
+        field = self.game_map.distance_field(*self.player)
+        hidden = [(col, row) for col, row in floor if field[row, col] == UNREACHABLE]
+        far = [(col, row) for col, row in floor if field[row, col] >= self.rules["monster_min_distance"]]
+        cells = hidden or far or [cell for cell in floor if cell != self.player]
+        cells = self.random.sample(cells, min(self.rules["monsters"], len(cells)))
+        return [Monster(col, row) for col, row in cells]
+
+    def alive_monsters(self):
+        return [monster for monster in self.monsters if monster.alive]
+
+    def step(self):
+        if self.result is not None:
+            return self.result
+        self.tick += 1
+        self.update_player()
+        self.update_monsters()
+        self.update_bombs()
+        self.check_result()
+        return self.result
+
+    def run(self):
+        while self.result is None:
+            self.step()
+        return self.result
+
+    # ---------- 玩家 ----------
+
+    def danger_cells(self):
+        """即将爆炸的炸弹会覆盖的格子和正在燃烧的格子"""
+        cells = set(self.flames)
+        for bomb in self.bombs:
+            cells.update(self.game_map.blast(bomb.col, bomb.row, bomb.power)[0])
+        return cells
+
+    def search(self, avoid, distances=None):
+        """从玩家所在格子开始 BFS, 按距离顺序返回 [(格子, 距离, 第一步)]; 玩家可以离开自己脚下的炸弹.
+        给出 distances(怪物到各格子的步数)时不经过怪物能先到或同时到的格子"""
+        game_map = self.game_map
+        flags, rows, cols = game_map.flags, game_map.rows, game_map.cols
+        start = self.player
+        monsters = {(monster.col, monster.row) for monster in self.monsters if monster.alive}
+        visited = {start: (0, None)}
+        queue = deque([start])
+        order = []
+        while queue:
+            cell = queue.popleft()
+            distance, first = visited[cell]
+            order.append((cell, distance, first))
+            for dx, dy in DIRECTIONS:
+                x, y = cell[0] + dx, cell[1] + dy
+                next_cell = (x, y)
+                if next_cell in visited or not (0 <= x < cols and 0 <= y < rows) or flags[y, x] & BLOCKED or next_cell in monsters or next_cell in avoid:
+                    continue
+                if distances and next_cell in distances and not self.ahead_of_monsters(distance + 1, distances[next_cell]):
+                    continue
+                visited[next_cell] = (distance + 1, first or next_cell)
+                queue.append(next_cell)
+        return order
+
+    def find_escape(self, danger, fuse, distances=None):
+        """在 fuse 帧内能走到的最近的安全格子的第一步, 已经安全时返回玩家所在格子, 没有时返回 None.
+        给出 distances 时, 到达安全格子后最近的怪物还要在 player_flee_distance 步以外"""
+        margin = self.rules["player_flee_distance"]
+        for cell, distance, first in self.search(set(self.flames), distances):
+            if cell in danger or distance * self.move_ticks >= fuse:
+                continue
+            if distances and cell in distances:
+                if not self.ahead_of_monsters(distance, distances[cell] - margin):
+                    continue
+                if self.safe_region(cell, distance, danger, distances, MONSTER_SEARCH_STEPS) < SAFE_REGION_MIN:
+                    continue
+            return first or cell
+        return None
+
+    def monster_distances(self, limit, blocked=()):
+        """从所有怪物同时开始 BFS, 返回 {格子: 最近的怪物走到这里的步数}, 只搜索 limit 步以内; blocked 中的格子(例如将要放下的炸弹)不能经过"""
+        game_map = self.game_map
+        flags, rows, cols = game_map.flags, game_map.rows, game_map.cols
+        distances = {(monster.col, monster.row): 0 for monster in self.alive_monsters()}
+        queue = deque(distances)
+        while queue:
+            cell = queue.popleft()
+            distance = distances[cell] + 1
+            if distance > limit:
+                continue
+            for dx, dy in DIRECTIONS:
+                x, y = cell[0] + dx, cell[1] + dy
+                if (x, y) not in distances and 0 <= x < cols and 0 <= y < rows and not flags[y, x] & BLOCKED and (x, y) not in blocked:
+                    distances[(x, y)] = distance
+                    queue.append((x, y))
+        return distances
+
+    def ahead_of_monsters(self, steps, monster_steps):
+        """玩家走 steps 步到达并在格子上停留到下一次行动之前, 怪物走 monster_steps 步还到不了;
+        怪物的冷却时间未知, 按它的第一步立即走出计算"""
+        return (monster_steps - 1) * self.rules["monster_move_ticks"] + 1 > steps * self.move_ticks
+
+    def safe_region(self, start, steps, avoid, distances, limit):
+        """从 start(已经走了 steps 步)出发, 玩家能比所有怪物先到达的格子数, 最多数到 SAFE_REGION_CELLS"""
+        flags, rows, cols = self.game_map.flags, self.game_map.rows, self.game_map.cols
+        visited = {start: steps}
+        queue = deque([start])
+        while queue and len(visited) < SAFE_REGION_CELLS:
+            cell = queue.popleft()
+            distance = visited[cell] + 1
+            for dx, dy in DIRECTIONS:
+                x, y = cell[0] + dx, cell[1] + dy
+                next_cell = (x, y)
+                if next_cell in visited or not (0 <= x < cols and 0 <= y < rows) or flags[y, x] & BLOCKED or next_cell in avoid:
+                    continue
+                if not self.ahead_of_monsters(distance, distances.get(next_cell, limit + 1)):
+                    continue
+                visited[next_cell] = distance
+                queue.append(next_cell)
+        return len(visited)
+
+    def flee(self, danger, distances, limit):
+        """选择之后能比怪物先到达的格子最多的一步: 走进通道尽头会被堵住, 在环路中可以一直绕开怪物;
+        一样多时选离怪物远的格子. 留在原地最好时返回 None"""
+        col, row = self.player
+        best, best_key = None, None
+        for dx, dy in ((0, 0),) + DIRECTIONS:
+            step = (col + dx, row + dy)
+            if step != self.player and (self.game_map.is_blocked(*step) or step in danger):
+                continue
+            # 原地等待也要占用这个格子一步的时间
+            if not self.ahead_of_monsters(1, distances.get(step, limit + 1)):
+                continue
+            key = (self.safe_region(step, 1, danger, distances, limit), distances.get(step, limit + 1))
+            if best_key is None or key > best_key:
+                best, best_key = step, key
+        return None if best == self.player else best
+
+    def blast_targets(self, col, row):
+        """在 (col, row) 放炸弹能炸到的砖块和怪物数"""
+        cells, bricks = self.game_map.blast(col, row, self.power)
+        cells = set(cells)
+        return len(bricks) + sum(1 for monster in self.monsters if monster.alive and (monster.col, monster.row) in cells)
+
+    def choose_move(self):
+        """玩家 AI: 躲避爆炸, 能炸到东西且有退路时放炸弹, 怪物靠近时逃开, 否则走向下一个放炸弹的位置或出口.
+        退路不经过怪物能先到的格子"""
+        game_map = self.game_map
+        danger = self.danger_cells()
+        col, row = self.player
+        limit = MONSTER_SEARCH_STEPS
+        distances = self.monster_distances(limit)
+        if self.player in danger:
+            fuse = min([bomb.fuse for bomb in self.bombs] or [self.rules["flame_ticks"]])
+            return (self.find_escape(danger, fuse, distances) or self.find_escape(danger, fuse)
+                    or self.find_escape(danger, sys.maxsize))
+        if len(self.bombs) < self.bomb_count and self.blast_targets(col, row):
+            fuse = self.rules["bomb_fuse_ticks"]
+            blast = set(game_map.blast(col, row, self.power)[0])
+            # 放下的炸弹挡住怪物, 计算退路时怪物不能经过这个格子
+            if self.find_escape(danger | blast, fuse, self.monster_distances(limit, {self.player})):
+                return "bomb"
+        if distances.get(self.player, limit + 1) <= self.rules["player_flee_distance"]:
+            return self.flee(danger, distances, limit)
+        monsters_left = bool(self.alive_monsters())
+        # 不走到怪物旁边
+        near_monsters = {(monster.col + dx, monster.row + dy) for monster in self.alive_monsters() for dx, dy in DIRECTIONS}
+        for cell, distance, first in self.search(danger | near_monsters):
+            if not distance:
+                continue
+            if not monsters_left and game_map.door_open(*cell):
+                return first
+            if len(self.bombs) < self.bomb_count and self.blast_targets(*cell):
+                return first
+        return None
+
+    def update_player(self):
+        if self.cooldown:
+            self.cooldown -= 1
+            return
+        move = self.choose_move()
+        if move == "bomb":
+            self.place_bomb()
+        elif move and move != self.player:
+            self.player = move
+            self.cooldown = self.move_ticks - 1
+            self.pick_item()
+        else:
+            # 原地等待时隔一步的时间再重新决策
+            self.cooldown = self.move_ticks - 1
+
+    def place_bomb(self):
+        col, row = self.player
+        self.bombs.append(Bomb(col, row, self.power, self.rules["bomb_fuse_ticks"]))
+        self.game_map.place_bomb(col, row)
+        self.stats["bombs"] += 1
+
+    def pick_item(self):
+        image_name = self.game_map.take_item(*self.player)
+        effect = ITEM_EFFECTS.get(image_name)
+        if effect is None:
+            return
+        self.stats["items"] += 1
+        if effect == "power":
+            self.power += 1
+        elif effect == "bombs":
+            self.bomb_count += 1
+        elif effect == "speed":
+            self.move_ticks = max(self.move_ticks - 1, self.rules["min_player_move_ticks"])
+
+    # ---------- 怪物 ----------
+
+    def update_monsters(self):
+        game_map = self.game_map
+        rules = self.rules
+        for monster in self.monsters:
+            if not monster.alive:
+                continue
+            if monster.cooldown:
+                monster.cooldown -= 1
+                continue
+            monster.cooldown = rules["monster_move_ticks"] - 1
+            step = None
+            if self.random.random() < rules["monster_chase"]:
+                # 所有怪物共用到玩家所在格子的距离场
+                step = game_map.next_step(monster.col, monster.row, *self.player)
+            if step is None:
+                steps = [(monster.col + dx, monster.row + dy) for dx, dy in DIRECTIONS
+                         if game_map.is_walkable(monster.col + dx, monster.row + dy) and (monster.col + dx, monster.row + dy) not in self.flames]
+                step = self.random.choice(steps) if steps else None
+            if step is not None and step not in self.flames:
+                monster.col, monster.row = step
+
+    # ---------- 炸弹 ----------
+
+    def update_bombs(self):
+        for cell in list(self.flames):
+            self.flames[cell] -= 1
+            if not self.flames[cell]:
+                del self.flames[cell]
+        for bomb in self.bombs:
+            bomb.fuse -= 1
+        # 连锁爆炸: 被炸到的炸弹立即爆炸
+        exploding = [bomb for bomb in self.bombs if bomb.fuse <= 0]
+        while exploding:
+            bomb = exploding.pop()
+            if bomb not in self.bombs:
+                continue
+            self.explode(bomb)
+            exploding.extend(other for other in self.bombs if (other.col, other.row) in self.flames)
+        flames = self.flames
+        for monster in self.monsters:
+            if monster.alive and (monster.col, monster.row) in flames:
+                monster.alive = False
+                self.stats["kills"] += 1
+
+    def explode(self, bomb):
+        game_map = self.game_map
+        self.bombs.remove(bomb)
+        game_map.remove_bomb(bomb.col, bomb.row)
+        cells, bricks = game_map.blast(bomb.col, bomb.row, bomb.power)
+        for cell in cells:
+            self.flames[cell] = self.rules["flame_ticks"]
+        for col, row in bricks:
+            if game_map.destroy_brick(col, row):
+                self.stats["bricks"] += 1
+
+    def check_result(self):
+        if self.player in self.flames:
+            self.result = "bomb"
+        elif any(monster.alive and (monster.col, monster.row) == self.player for monster in self.monsters):
+            self.result = "monster"
+        elif not self.alive_monsters() and self.game_map.door_open(*self.player):
+            self.result = "win"
+        elif self.tick >= self.rules["max_ticks"]:
+            self.result = "timeout"
+
+
+# ---------- 批量模拟 ----------
+
+map_cache = {}  # 每个工作进程中缓存读取过的地图
+
+
+def load_map(map_path):
+    map_data = map_cache.get(map_path)
+    if map_data is None:
+        with open(map_path, "r") as f:
+            map_data = map_cache[map_path] = json.load(f)
+    return map_data
+
+
+def run_match(task):
+    """进程池中执行的任务, 返回 (地图路径, 对局结果)"""
+    map_path, seed, rules = task
+    match = Match(load_map(map_path), seed, rules)
+    match.run()
+    result = dict(match.stats)
+    result["result"] = match.result
+    result["ticks"] = match.tick
+    return map_path, result
+
+
+def summarize(results):
+    """汇总一张地图的所有对局结果"""
+    count = len(results)
+    outcomes = {}
+    for result in results:
+        outcomes[result["result"]] = outcomes.get(result["result"], 0) + 1
+    wins = sorted(result["ticks"] for result in results if result["result"] == "win")
+    summary = {
+        "matches": count,
+        "outcomes": outcomes,
+        "win_rate": round(len(wins) / count, 4) if count else 0,
+        "win_seconds_median": round(wins[len(wins) // 2] / TICK_RATE, 2) if wins else None,
+        "ticks_mean": round(sum(result["ticks"] for result in results) / count, 1) if count else 0,
+    }
+    for key in ("bombs", "bricks", "kills", "items"):
+        summary[key + "_mean"] = round(sum(result[key] for result in results) / count, 2) if count else 0
+    return summary
+
+
+def watch(map_path, seed, rules):
+    """用 pygame 实时显示一局模拟, 显示层只读取 Match 的状态"""
+    import pygame
+    from main import load_images, create_player_image, MAX_SCREEN_WIDTH, MAX_SCREEN_HEIGHT
+    from renderer import MapRenderer, Sprite
+
+    map_data = load_map(map_path)
+    match = Match(map_data, seed, rules)
+    grid_width, grid_height = map_data["grid_width"], map_data["grid_height"]
+    pygame.init()
+    screen = pygame.display.set_mode((min(match.game_map.cols * grid_width, MAX_SCREEN_WIDTH),
+                                      min(match.game_map.rows * grid_height, MAX_SCREEN_HEIGHT)))
+    images = load_images(map_data["image_cache"].values(), os.path.dirname(map_path) or ".")
+    # 渲染器会修改图层数据, 使用副本, 不影响缓存的地图
+    renderer = MapRenderer(json.loads(json.dumps(map_data)), images, *screen.get_size())
+    match.game_map.add_cell_listener(renderer.set_cell)
+    player_image = create_player_image(grid_width, grid_height)
+    monster_image = player_image.copy()
+    monster_image.fill((220, 40, 40, 255), special_flags=pygame.BLEND_RGBA_MULT)
+    bomb_image = pygame.Surface((grid_width, grid_height), pygame.SRCALPHA)
+    pygame.draw.circle(bomb_image, (20, 20, 20), (grid_width // 2, grid_height // 2), min(grid_width, grid_height) // 3)
+    flame_image = pygame.Surface((grid_width, grid_height), pygame.SRCALPHA)
+    flame_image.fill((255, 140, 0, 180))
+
+    clock = pygame.time.Clock()
+    running = True
+    while running:
+        clock.tick(TICK_RATE)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+        if match.step() is not None:
+            pygame.display.set_caption("BomberMan - %s (%d ticks)" % (match.result, match.tick))
+        sprites = [Sprite(flame_image, col * grid_width, row * grid_height) for col, row in match.flames]
+        sprites += [Sprite(bomb_image, bomb.col * grid_width, bomb.row * grid_height) for bomb in match.bombs]
+        sprites += [Sprite(monster_image, monster.col * grid_width, monster.row * grid_height) for monster in match.alive_monsters()]
+        player = Sprite(player_image, match.player[0] * grid_width, match.player[1] * grid_height)
+        renderer.follow(player.rect)
+        dirty = renderer.draw(screen, sprites + [player])
+        if dirty:
+            pygame.display.update(dirty)
+    pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BomberMan 对局模拟")
+    parser.add_argument("maps", nargs="+", help="地图文件")
+    parser.add_argument("--matches", type=int, default=100, help="每张地图的对局数")
+    parser.add_argument("--seed", type=int, default=0, help="第一局的随机种子, 之后每局加 1")
+    parser.add_argument("--monsters", type=int, default=DEFAULT_RULES["monsters"], help="怪物数量")
+    parser.add_argument("--chase", type=float, default=DEFAULT_RULES["monster_chase"], help="怪物追向玩家的概率")
+    parser.add_argument("--max-ticks", type=int, default=DEFAULT_RULES["max_ticks"], help="对局最多的逻辑帧数")
+    parser.add_argument("--jobs", type=int, default=None, help="进程数, 默认为 CPU 核数")
+    parser.add_argument("--report", help="把统计结果写入 JSON 文件")
+    parser.add_argument("--watch", action="store_true", help="用窗口实时显示第一张地图的一局")
+    args = parser.parse_args(argv)
+
+    rules = {"monsters": args.monsters, "monster_chase": args.chase, "max_ticks": args.max_ticks}
+    if args.watch:
+        watch(args.maps[0], args.seed, rules)
+        return 0
+
+    tasks = [(map_path, args.seed + index, rules) for map_path in args.maps for index in range(args.matches)]
+    results = {map_path: [] for map_path in args.maps}
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.jobs) as pool:
+        # 单局很短, 成批分发减少进程间通信
+        chunksize = max(1, len(tasks) // ((args.jobs or os.cpu_count() or 1) * 8))
+        for done, (map_path, result) in enumerate(pool.imap_unordered(run_match, tasks, chunksize), 1):
+            results[map_path].append(result)
+            if done % max(1, len(tasks) // 10) == 0 or done == len(tasks):
+                print("[%d/%d]" % (done, len(tasks)), flush=True)
+    elapsed = time.perf_counter() - start
+    summaries = {map_path: summarize(map_results) for map_path, map_results in results.items()}
+    total_ticks = sum(result["ticks"] for map_results in results.values() for result in map_results)
+    for map_path, summary in summaries.items():
+        outcomes = ", ".join("%s %d" % item for item in sorted(summary["outcomes"].items()))
+        print("%s: %d 局, 胜率 %.1f%% (%s), 平均 %.0f 帧, 平均炸掉砖块 %.1f, 消灭怪物 %.1f" % (
+            map_path, summary["matches"], summary["win_rate"] * 100, outcomes, summary["ticks_mean"], summary["bricks_mean"], summary["kills_mean"]))
+    print("共 %d 局, 用时 %.1f 秒, %.0f 帧/秒" % (len(tasks), elapsed, total_ticks / max(elapsed, 1e-6)))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"rules": dict(DEFAULT_RULES, **rules), "maps": summaries}, f, ensure_ascii=False, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import os
+import unittest
+from simulation import Match, load_map
+
+MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Resources", "Map1.json")
+SEEDS = range(100)
+
+
+class SimulationWinRateTest(unittest.TestCase):
+    """Map1 上固定种子的对局胜率回归测试: 玩家 AI 只会原地等怪物时胜率约 1%, 现在约 15%"""
+
+    def test_map1_win_rate(self):
+        map_data = load_map(MAP_PATH)
+        outcomes = {}
+        for seed in SEEDS:
+            result = Match(map_data, seed).run()
+            outcomes[result] = outcomes.get(result, 0) + 1
+        win_rate = outcomes.get("win", 0) / len(SEEDS)
+        self.assertTrue(0.08 <= win_rate <= 0.6, "胜率 %.2f 超出范围, 对局结果 %s" % (win_rate, outcomes))
+        # 被自己的炸弹炸死说明放炸弹时没有找好退路
+        self.assertLess(outcomes.get("bomb", 0) / len(SEEDS), 0.1, "对局结果 %s" % outcomes)
+
+
+if __name__ == "__main__":
+    unittest.main()